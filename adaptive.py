@@ -0,0 +1,111 @@
+# adaptive.py
+# 苦手な単語を多めに出す「おすすめ出題」の単語選び
+#
+# 単語帳の全単語に重みを付け（直近の誤答・連続正解数・最後に出てからの日数・似た意味の単語の有無）、
+# Efraimidis–Spirakis の方法で重み付きの非復元抽出をする。
+#   各単語に key = log(u) / w（u は一様乱数）を振り、大きい方から k 語 → 1回の O(N) で済む。
+# 重みもキーも NumPy でまとめて計算するので、数万語でも 1 ミリ秒かからない。
+import threading
+
+import numpy as np
+
+import progress_array
+
+# 最後に出てからこの日数が経つと「忘れかけ」とみなして重みを最大にする
+RECENCY_DAYS = 7
+# まだ出題していない単語の「間違えやすさ」（直近で間違えた単語は 1.0）
+UNSEEN_ERROR = 0.5
+
+def prepare(snapshot):
+    """単語ごとの「紛らわしさ」の計算を別スレッドで始める（終わったらスナップショットに持たせる）
+
+    全単語の組み合わせの類似度を取るので、大きな単語帳では時間がかかる。
+    単語帳の読み込み（最初にデッキを使うリクエストや、デッキ単位の読み込み待ち）を待たせないよう、
+    計算はスナップショットの公開とは別に進める。終わるまでは confusability() が None を返す。
+    スレッドを返す（終わるのを待ちたいとき用）。"""
+    snapshot._confusability = None
+    thread = threading.Thread(target=_prepare, args=(snapshot,), name="adaptive-confusability", daemon=True)
+    thread.start()
+    return thread
+
+
+def _prepare(snapshot):
+    try:
+        snapshot._confusability = _nearest_similarity(snapshot.english, snapshot.japanese, snapshot.embeddings)
+    except Exception as e:  # 紛らわしさが無くてもおすすめ出題はできる
+        print(f"❌ エラー: 紛らわしさの計算に失敗しました: {e}")
+
+
+def confusability(snapshot):
+    """単語ごとに、意味の一番近い別の単語とのコサイン類似度（0〜1）。ベクトルが無ければ 0
+
+    prepare() の計算がまだ終わっていなければ None（紛らわしさを使わずに重みを付ける）。"""
+    return getattr(snapshot, '_confusability', None)
+
+
+def _nearest_similarity(english, japanese, embeddings, chunk=1024):
+    scores = np.zeros(len(english), dtype=np.float32)
+    if embeddings is None or not english:
+        return scores
+    # 英語のベクトルを優先し、無ければ日本語のセルのベクトルを使う
+    vectors = []
+    for e, j in zip(english, japanese):
+        vec = embeddings.get(e)
+        vectors.append(vec if vec is not None else embeddings.get(j))
+    have = [i for i, v in enumerate(vectors) if v is not None]
+    if len(have) < 2:
+        return scores
+    matrix = np.asarray([vectors[i] for i in have], dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    nearest = np.empty(len(have), dtype=np.float32)
+    # 全組み合わせの類似度は大きいので、行を区切って計算する
+    for start in range(0, len(have), chunk):
+        sims = matrix[start:start + chunk] @ matrix.T
+        sims[np.arange(sims.shape[0]), np.arange(start, start + sims.shape[0])] = -1.0  # 自分自身は除く
+        nearest[start:start + chunk] = sims.max(axis=1)
+    scores[have] = np.clip(nearest, 0.0, 1.0)
+    return scores
+
+
+def word_weights(array, word_ids, confusable=None, day=None):
+    """単語帳の並び順の重み（大きいほど出やすい）"""
+    day = progress_array.today() if day is None else day
+    word_ids = np.asarray(word_ids)
+    if not len(array):
+        array = np.zeros(1, dtype=progress_array.DTYPE)
+    # 構造化配列を丸ごと引くより、列ごとに引いた方が速い（配列の外の単語は未出題）
+    inside = word_ids < len(array)
+    seen = (np.take(array['seen'], word_ids, mode='clip') > 0) & inside
+    streak = np.take(array['streak'], word_ids, mode='clip')
+    last_day = np.take(array['day'], word_ids, mode='clip')
+    # 連続正解が続くほど下げる（直近で間違えた単語は 1.0）
+    error = np.where(seen, 1.0 / (1.0 + streak.astype(np.float32)), np.float32(UNSEEN_ERROR))
+    # 最後に出てからの日数（未出題は最大扱い）
+    age = np.where(seen, np.clip(day - last_day.astype(np.int32), 0, RECENCY_DAYS), RECENCY_DAYS)
+    weights = (np.float32(0.1) + error) * (np.float32(0.25) + age.astype(np.float32) / RECENCY_DAYS)
+    if confusable is not None and len(confusable):
+        weights *= 1.0 + confusable
+    return weights
+
+
+def weighted_sample(weights, k, rng=None):
+    """重みに比例した確率で、重複なしに k 個の添字を選ぶ（Efraimidis–Spirakis。選ばれやすい順）"""
+    rng = rng or np.random.default_rng()
+    n = len(weights)
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    # u^(1/w) の大小は log(u)/w と同じ（u が 0 なら -inf になり、最後に回る）
+    with np.errstate(divide='ignore'):
+        keys = np.log(rng.random(n, dtype=np.float32)) / weights
+    if k < n:
+        top = np.argpartition(keys, n - k)[n - k:]
+    else:
+        top = np.arange(n)
+    return top[np.argsort(keys[top])[::-1]]
+
+
+def draw(array, snapshot, k, rng=None):
+    """おすすめ出題の単語ID（k 語）"""
+    weights = word_weights(array, snapshot.word_ids, confusability(snapshot))
+    return [int(snapshot.word_ids[i]) for i in weighted_sample(weights, k, rng)]
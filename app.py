@@ -1,19 +1,38 @@
+import csv
+import json
+import math
 import os
-import pickle
-from flask import Flask, request, render_template, redirect, url_for, flash, session
+import sqlite3
+import threading
+from collections import Counter
+from flask import Flask, request, render_template, redirect, url_for, flash, session, send_from_directory, make_response
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from werkzeug.security import generate_password_hash, check_password_hash
-import pandas as pd
 import random
 from dotenv import load_dotenv
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from datetime import datetime, timedelta
 from functools import wraps
-from sqlalchemy import func
+from sqlalchemy import event, func
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
 from flask import jsonify
 load_dotenv() 
 from fuzzywuzzy import fuzz
+from vector_store import AnswerEncoder, VectorStore, cosine, split_variants, stored_model_name
+from vocab import WORDS_PATH
+from decks import DECKS_DIR, DEFAULT_DECK, DeckManager
+from render_cache import DEFAULT_CACHE_DIR, LazyRows, init_render_cache, render_if_modified, stream_page
+from compression import init_compression
+import mistake_keys
+import progress_array
+import adaptive
+from passwords import HashPoolBusy, PasswordHasher
+from readings import normalize_kana
+from suggest_cache import SuggestionCache, TokenBucket, normalize as normalize_suggestion_query, suggestion_etag
+from user_cache import CachedUser, UserCache
+from attempt_writer import AttemptWriter
+import user_csv
 
 # --- 初期化 ------------------------------------------------------------------
 app = Flask(__name__)
@@ -22,11 +41,21 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'
 
 # --- 環境ごとの設定 ---
+# DATABASE_URL があればそれを使う。無ければ DATABASE_BACKEND で選ぶ:
+#   postgres（既定）: ローカル開発用の PostgreSQL
+#   sqlite          : PostgreSQL を置かずに1台で動かす（小さな学校向け）。SQLITE_PATH のファイルに保存する
 db_url = os.environ.get('DATABASE_URL')
+DATABASE_BACKEND = os.environ.get('DATABASE_BACKEND', 'postgres')
 if db_url:
     # Render や Heroku の場合
     app.config["SECRET_KEY"] = os.environ.get('SECRET_KEY', os.urandom(24).hex())
     app.config['SQLALCHEMY_DATABASE_URI'] = db_url  # ← ここ重要！！
+elif DATABASE_BACKEND == 'sqlite':
+    # gunicorn のワーカー間でセッションを共有するので、SECRET_KEY は環境変数で固定しておく
+    app.config["SECRET_KEY"] = os.environ.get('SECRET_KEY', os.urandom(24).hex())
+    sqlite_path = os.path.abspath(os.environ.get('SQLITE_PATH', os.path.join(app.instance_path, 'tango.db')))
+    os.makedirs(os.path.dirname(sqlite_path), exist_ok=True)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{sqlite_path}'
 else:
     # ローカル開発環境
     app.config["SECRET_KEY"] = os.urandom(24).hex()
@@ -38,12 +67,35 @@ else:
         'database': 'kawamataharuka'
     }
     app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://{user}:{password}@{host}:{port}/{database}'.format(**db_info)
+IS_SQLITE = app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite')
 # --- DB設定 ---
 #app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI')
 #app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+# SQLite は ALTER TABLE でできることが少ないので、マイグレーションは batch（テーブルの作り直し）で書く
+migrate = Migrate(app, db, render_as_batch=IS_SQLITE)
+
+
+# SQLite の接続ごとの設定（1台で gunicorn の複数ワーカーから同じファイルを使う前提）
+SQLITE_PRAGMAS = {
+    'foreign_keys': 'ON',  # 既定では無効なので、ON DELETE CASCADE を効かせるために有効にする
+    'journal_mode': 'WAL',  # 書き込み中でも他のワーカーが読める
+    'synchronous': 'NORMAL',  # WAL なら NORMAL でも壊れない（電源断で直前のコミットが消えることはある）
+    'busy_timeout': os.environ.get('SQLITE_BUSY_TIMEOUT', '5000'),  # 書き込みが重なったら待つ（ミリ秒）
+    'cache_size': -64 * 1024,  # 64MB（負の値は KB 単位）
+    'temp_store': 'MEMORY',
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+
+@event.listens_for(Engine, "connect")
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
 
 # --- モデル定義 ----------------------------------------------------------------
 class User(UserMixin, db.Model):
@@ -59,60 +111,562 @@ class User(UserMixin, db.Model):
 class ContactMessage(db.Model):
     __tablename__ = 'contact_messages'
     id         = db.Column(db.Integer, primary_key=True)
-    user_id    = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id    = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     subject    = db.Column(db.String(200), nullable=False)
     body       = db.Column(db.Text,    nullable=False)
     timestamp  = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     is_deleted = db.Column(db.Boolean, nullable=False, default=False)
-    user = db.relationship('User', backref=db.backref('contact_messages', lazy=True))
+    user = db.relationship('User', backref=db.backref('contact_messages', lazy=True, passive_deletes=True))
+
+    __table_args__ = (
+        # ユーザー削除（ON DELETE CASCADE）で子の行を探す用
+        db.Index('ix_contact_messages_user_id', 'user_id'),
+        # 管理ページの未削除のお問い合わせ一覧（新しい順）用。削除済みは索引に入れない
+        db.Index('ix_contact_messages_open_timestamp', 'timestamp',
+                 postgresql_where=db.text('is_deleted = false'), sqlite_where=db.text('is_deleted = 0')),
+    )
 
 class QuizAttempt(db.Model):
     __tablename__ = 'quiz_attempts'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # オフラインで解いた回答の ID（端末側で発行）。同じ回答を二重に取り込まないためのもの
+    client_answer_id = db.Column(db.String(64), nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'client_answer_id', name='uq_quiz_attempts_user_client_answer'),
+        # 学習記録・管理ページの「あるユーザーの直近の回答」用
+        db.Index('ix_quiz_attempts_user_timestamp', 'user_id', 'timestamp'),
+        # 週間ランキング（全ユーザーの直近の回答）と archive-attempts 用
+        db.Index('ix_quiz_attempts_timestamp_user', 'timestamp', 'user_id'),
+    )
+
+    user = db.relationship('User', backref=db.backref('attempts', lazy=True, passive_deletes=True))
+
+class QuizAttemptDaily(db.Model):
+    """古い quiz_attempts をユーザー・日ごとの件数にまとめたもの（flask archive-attempts が作る）"""
+    __tablename__ = 'quiz_attempt_daily'
+    id       = db.Column(db.Integer, primary_key=True)
+    user_id  = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    day      = db.Column(db.Date, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'day', name='uq_quiz_attempt_daily_user_day'),
+    )
+
+class Word(db.Model):
+    """単語カタログ。words.xlsx の行位置とは独立した、変わらない単語IDを持つ"""
+    __tablename__ = 'words'
+    id           = db.Column(db.Integer, primary_key=True)
+    english      = db.Column(db.String(200), nullable=False)
+    japanese     = db.Column(db.Text, nullable=False)
+    content_hash = db.Column(db.String(40), nullable=False, unique=True)
+    created_at   = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class WordIdRemap(db.Model):
+    """単語の修正などで統合された旧ID -> 新ID（flask remap-word-ids が記録する）"""
+    __tablename__ = 'word_id_remaps'
+    id         = db.Column(db.Integer, primary_key=True)  # 大きいほど新しい（セッション変換の世代）
+    old_id     = db.Column(db.Integer, nullable=False, unique=True)
+    new_id     = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class WordProgress(db.Model):
+    """ユーザーごと・デッキごと・出題方向ごとの、各単語の最後の正誤（範囲ごとの集計を差分で更新するために持つ）
+
+    同じ単語が複数のデッキに入っていることがあるので、範囲別の集計（RangeStat）と同じくデッキごとに持つ。"""
+    __tablename__ = 'word_progress'
+    id         = db.Column(db.Integer, primary_key=True)
+    user_id    = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    deck       = db.Column(db.String(100), nullable=False, default=DEFAULT_DECK)
+    word_id    = db.Column(db.Integer, nullable=False)
+    direction  = db.Column(db.String(2), nullable=False)
+    correct    = db.Column(db.Boolean, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'deck', 'word_id', 'direction', name='uq_word_progress_user_deck_word_direction'),
+    )
+
+class RangeStat(db.Model):
+    """ユーザーごとの範囲別の集計（最後に正解した単語数 / 最後に間違えた単語数）"""
+    __tablename__ = 'range_stats'
+    id          = db.Column(db.Integer, primary_key=True)
+    user_id     = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    deck        = db.Column(db.String(100), nullable=False)
+    direction   = db.Column(db.String(2), nullable=False)
+    range_start = db.Column(db.Integer, nullable=False)
+    mastered    = db.Column(db.Integer, nullable=False, default=0)
+    mistakes    = db.Column(db.Integer, nullable=False, default=0)
+    updated_at  = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'deck', 'direction', 'range_start', name='uq_range_stats_user_deck_range'),
+    )
+
+class ProgressArray(db.Model):
+    """ユーザー・出題方向ごとの単語別の学習状況（progress_array の配列をバイト列で持つ）"""
+    __tablename__ = 'progress_arrays'
+    id         = db.Column(db.Integer, primary_key=True)
+    user_id    = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    direction  = db.Column(db.String(2), nullable=False)
+    data       = db.Column(db.LargeBinary, nullable=False, default=b'')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'direction', name='uq_progress_arrays_user_direction'),
+    )
+
+class Mistake(db.Model):
+    """ユーザーの間違い単語（出題元・方向ごと）。以前はセッションのリストに持っていたもの"""
+    __tablename__ = 'mistakes'
+    id         = db.Column(db.Integer, primary_key=True)
+    user_id    = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    word_id    = db.Column(db.Integer, nullable=False)
+    direction  = db.Column(db.String(2), nullable=False)
+    source     = db.Column(db.String(20), nullable=False)   # 'random' / 'detailed' / 'rough'
+    range_key  = db.Column(db.String(120), nullable=False, default='')  # 詳細学習の範囲（"1-50" / "toeic:1-50"）
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'source', 'range_key', 'word_id', 'direction', name='uq_mistakes_entry'),
+        # 管理ページのキーセット・ページング（user_id, word_id の順に進む）用
+        db.Index('ix_mistakes_user_word', 'user_id', 'word_id'),
+    )
+
+class UserImportJob(db.Model):
+    """管理ページの CSV アップロードによる一括登録の進み具合と結果（登録はバックグラウンドなので、結果をここに残して管理ページに出す）"""
+    __tablename__ = 'user_import_jobs'
+    id         = db.Column(db.Integer, primary_key=True)
+    admin_id   = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    filename   = db.Column(db.String(200), nullable=False, default='')
+    status     = db.Column(db.String(20), nullable=False, default='running')  # 'running' / 'done' / 'failed'
+    total      = db.Column(db.Integer, nullable=False, default=0)  # 登録しようとした人数（CSV のエラー行は除く）
+    created    = db.Column(db.Integer, nullable=False, default=0)
+    errors     = db.Column(db.Text, nullable=False, default='[]')  # [[行番号, ユーザー名, エラー内容], ...] の JSON
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    @property
+    def error_list(self):
+        return json.loads(self.errors or '[]')
+
+    def add_errors(self, errors):
+        self.errors = json.dumps(sorted(self.error_list + [list(e) for e in errors]), ensure_ascii=False)
 
-    user = db.relationship('User', backref=db.backref('attempts', lazy=True))
+    @property
+    def stalled(self):
+        """実行中のまま長く更新されていない（ワーカーの再起動などで止まった）"""
+        return self.status == 'running' and datetime.utcnow() - self.updated_at > timedelta(minutes=USER_IMPORT_STALL_MINUTES)
+
+# 単語IDを参照している (テーブル, 列)。remap-word-ids で一括更新する
+WORD_REF_COLUMNS = [(WordProgress.__table__, 'word_id'), (Mistake.__table__, 'word_id')]
+
+
+# ログイン中のユーザーは軽いレコードにしてワーカーごとに短時間キャッシュする（毎リクエストの DB 問い合わせを省く）
+user_cache = UserCache(ttl=float(os.environ.get("USER_CACHE_TTL", "30")))
+
+
+def _load_user_record(user_id):
+    row = db.session.query(User.id, User.username, User.nickname, User.is_admin).filter(User.id == user_id).first()
+    return CachedUser(*row) if row else None
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id), _load_user_record)
 
 # --- グローバル変数とヘルパー関数 --------------------------------------------------
-try:
-    full_df = pd.read_excel("static/words.xlsx")
-    ALL_INDICES = list(full_df.index)
-    print("✅ words.xlsx を正常に読み込みました。")
-except FileNotFoundError:
-    print("❌ エラー: words.xlsx が見つかりません。")
-    full_df = pd.DataFrame(columns=["English", "Japanese"])
-    ALL_INDICES = []
-try:
-    with open("static/word_vectors.pkl", "rb") as f:
-        embeddings = pickle.load(f)
-except FileNotFoundError:
-        embeddings = None
-        print("❌ エラー: word_vectors.pkl が見つかりません。")
-
-
-def is_answer_similar(user_answer, correct_answer, threshold=60):  # ← 数値を調整
-    user_ans_clean = user_answer.strip().lower()
-    correct_ans_clean = correct_answer.strip().lower()
+# 単語帳はスナップショットとして保持し、words.xlsx が更新されたら裏で読み直して差し替える
+def sync_word_catalogue(snapshot):
+    """スナップショットの各行に単語カタログのIDを割り当てる（未登録の単語は追加する）"""
+    with app.app_context():
+        for attempt in range(2):
+            known = {h: i for i, h in db.session.query(Word.id, Word.content_hash)}
+            new_rows = {}
+            for h, en, ja in zip(snapshot.content_hashes, snapshot.english, snapshot.japanese):
+                if h not in known and h not in new_rows:
+                    new_rows[h] = {'english': en, 'japanese': ja, 'content_hash': h}
+            if not new_rows:
+                break
+            try:
+                db.session.execute(db.insert(Word), list(new_rows.values()))
+                db.session.commit()
+            except IntegrityError:
+                # 別のワーカーが同時に同じ単語を登録した場合は読み直す
+                db.session.rollback()
+        rows = db.session.query(Word.id, Word.content_hash, Word.english, Word.japanese).all()
+        by_hash = {r.content_hash: r.id for r in rows}
+        present = set(snapshot.content_hashes)
+        retired = {r.id: (r.english, r.japanese) for r in rows if r.content_hash not in present}
+        remaps = dict(db.session.query(WordIdRemap.old_id, WordIdRemap.new_id))
+        remap_epoch = db.session.query(func.max(WordIdRemap.id)).scalar() or 0
+        db.session.remove()
+    # 旧ID -> 旧ID -> 新ID と連鎖していれば最後まで辿る
+    for old_id in list(remaps):
+        seen = {old_id}
+        new_id = remaps[old_id]
+        while new_id in remaps and new_id not in seen:
+            seen.add(new_id)
+            new_id = remaps[new_id]
+        remaps[old_id] = new_id
+    snapshot.attach_word_ids(
+        [by_hash[h] for h in snapshot.content_hashes],
+        retired=retired, id_remaps=remaps, remap_epoch=remap_epoch
+    )
+
+
+# 予測変換の結果キャッシュ（全ユーザー共通）と、ユーザーごとの回数制限
+SUGGESTION_LIMIT = 10
+SUGGESTION_MAX_AGE = int(os.environ.get("SUGGEST_MAX_AGE", "60"))
+suggestion_cache = SuggestionCache(
+    max_entries=int(os.environ.get("SUGGEST_CACHE_SIZE", "20000")),
+    ttl=float(os.environ.get("SUGGEST_CACHE_TTL", "600")),
+)
+suggestion_limiter = TokenBucket(
+    rate=float(os.environ.get("SUGGEST_RATE", "10")),
+    burst=int(os.environ.get("SUGGEST_BURST", "20")),
+)
+
+# パスワードのハッシュ化・照合（専用のプロセスプールで行い、一斉ログインでワーカーが止まらないようにする）
+password_hasher = PasswordHasher(
+    method=os.environ.get("PASSWORD_HASH_METHOD", "scrypt"),
+    workers=int(os.environ.get("PASSWORD_HASH_WORKERS", "1")),
+    max_pending=int(os.environ.get("PASSWORD_HASH_QUEUE", "64")),
+    wait_timeout=float(os.environ.get("PASSWORD_HASH_TIMEOUT", "10")),
+)
+
+
+def prepare_snapshot(snapshot):
+    """読み込んだ単語帳を公開する前の準備（単語IDの付与、短い入力の予測変換の作り置き、おすすめ出題の紛らわしさ（裏で計算））"""
+    sync_word_catalogue(snapshot)
+    suggestion_cache.warm(snapshot, SUGGESTION_LIMIT)
+    adaptive.prepare(snapshot)
+
+
+def lookup_suggestions(user_id, vocab, query, if_none_match=None):
+    """予測変換を引く。(ステータス, 結果, ヘッダー) を返す（Flask のルートと asgi.py の両方から使う）
+
+    同じ単語帳・同じ入力なら結果も同じなので、ETag が一致すれば 304 を返して中身を送らない。"""
+    allowed, retry_after = suggestion_limiter.allow(user_id)
+    if not allowed:
+        return 429, {'error': '入力が速すぎます。少し待ってから再度お試しください。'}, {'Retry-After': str(math.ceil(retry_after))}
+    query = normalize_suggestion_query(query)
+    if not query:
+        return 200, [], {}
+    etag = suggestion_etag(vocab.version, query, SUGGESTION_LIMIT)
+    headers = {
+        'ETag': f'"{etag}"',
+        # デッキを切り替えるとセッションの Cookie が変わるので、Cookie ごとに別のキャッシュにさせる
+        'Cache-Control': f'private, max-age={SUGGESTION_MAX_AGE}',
+        'Vary': 'Cookie',
+    }
+    if if_none_match is not None and if_none_match.contains_weak(etag):
+        return 304, None, headers
+    results = suggestion_cache.get(
+        (vocab.version, query, SUGGESTION_LIMIT),
+        lambda: vocab.suggestions(query, limit=SUGGESTION_LIMIT),
+    )
+    return 200, results, headers
+
+
+# 単語帳（デッキ）は最初に使われたときに読み込み、上限を超えたら使われていないものから捨てる
+decks = DeckManager(
+    WORDS_PATH,
+    DECKS_DIR,
+    memory_budget=int(os.environ.get("DECK_MEMORY_BUDGET_MB", "512")) * 1024 * 1024,
+    keep_versions=int(os.environ.get("VOCAB_KEEP_VERSIONS", "3")),
+    check_interval=float(os.environ.get("VOCAB_CHECK_INTERVAL", "5")),
+    on_load=prepare_snapshot,
+)
+
+# ユーザーの自由入力用エンコーダ（予算内に終わらなければfuzzyマッチに切り替える）
+answer_encoder = AnswerEncoder(
+    stored_model_name() or "paraphrase-multilingual-MiniLM-L12-v2",
+    budget=float(os.environ.get("ANSWER_ENCODER_BUDGET_MS", "50")) / 1000.0,
+    cache_size=int(os.environ.get("ANSWER_ENCODER_CACHE_SIZE", "4096")),
+)
+
+# テンプレートは起動時にまとめてコンパイルしておく（バイトコードはワーカー間で共有）
+init_render_cache(
+    app,
+    cache_dir=os.environ.get("TEMPLATE_CACHE_DIR", DEFAULT_CACHE_DIR),
+    precompile=os.environ.get("TEMPLATE_PRECOMPILE", "1") != "0",
+)
+# 一定サイズ以上のレスポンスは圧縮し、静的ファイルは内容ハッシュ付きURLで長期キャッシュさせる
+init_compression(
+    app,
+    min_size=int(os.environ.get("COMPRESS_MIN_SIZE", "1024")),
+    level=int(os.environ.get("COMPRESS_LEVEL", "6")),
+)
+
+
+@app.before_request
+def check_vocab_update():
+    decks.maybe_reload()
+    if request.endpoint != 'static':
+        _upgrade_session_word_refs(current_vocab())
+        _migrate_session_mistakes()
+
+
+# セッション内で単語を参照しているキー（中身は {'idx': 単語ID, 'dir': ...} や単語IDのリスト）
+# 間違いリスト3つは古いセッションに残っている分（DBに移す前に単語IDへ直す）
+WORD_REF_SESSION_KEYS = [
+    'random_quiz_mistakes', 'detailed_quiz_mistakes', 'current_quiz_mistakes_indices', 'quiz_rows',
+    'saved_states', 'rough_mistakes', 'global_rough_mistakes', 'saved_rough', 'saved_rough_states',
+]
+
+
+# 間違いを mistake_keys の形式（詰めた整数の文字列）で持っているキー
+PACKED_MISTAKE_KEYS = ('current_quiz_mistakes_indices', 'session_mistakes')
+
+
+def _map_word_refs(value, fn, key=None):
+    """セッションの値の中の単語参照を fn で置き換える（fn が None を返した参照は取り除く）"""
+    if key in PACKED_MISTAKE_KEYS and isinstance(value, str):
+        return mistake_keys.remap(value, fn)
+    if isinstance(value, dict):
+        if 'idx' in value and 'dir' in value:
+            new_id = fn(value['idx'])
+            return None if new_id is None else {**value, 'idx': new_id}
+        return {k: _map_word_refs(v, fn, k) for k, v in value.items()}
+    if isinstance(value, list):
+        mapped = []
+        for item in value:
+            if isinstance(item, int) and key in ('rows', 'quiz_rows'):
+                item = fn(item)
+            else:
+                item = _map_word_refs(item, fn, key)
+            if item is not None:
+                mapped.append(item)
+        return mapped
+    return value
+
 
+def _upgrade_session_word_refs(vocab):
+    """古い形式（行番号）や統合前の単語IDを保存しているセッションを、現在の単語IDに書き換える"""
+    epoch = session.get('word_ref_epoch')
+    if epoch == vocab.remap_epoch:
+        return
+    keys = [k for k in WORD_REF_SESSION_KEYS if session.get(k)]
+    if epoch is None:
+        # 単語ID導入前のセッション: 値は現在の単語帳の行番号
+        def to_id(position):
+            return vocab.word_id(position) if 0 <= position < len(vocab) else None
+        for key in keys:
+            session[key] = _map_word_refs(session[key], to_id, key)
+    if vocab.id_remaps:
+        for key in keys:
+            session[key] = _map_word_refs(session[key], vocab.resolve_id, key)
+    session['word_ref_epoch'] = vocab.remap_epoch
+
+
+def selected_deck():
+    """ユーザーが選んでいるデッキ（無くなっていれば既定のデッキ）"""
+    deck = session.get('deck', DEFAULT_DECK)
+    return deck if decks.exists(deck) else DEFAULT_DECK
+
+
+def deck_registry(deck=None):
     try:
-        from sentence_transformers import util
-    except ImportError:
-        # fuzzyマッチでスコアを計算
-        similarity = fuzz.partial_ratio(user_ans_clean, correct_ans_clean)
-        return similarity >= threshold
-
-    # sentence_transformers 使えるとき（ローカル用）
-    emb1 = embeddings.get(user_answer)
-    emb2 = embeddings.get(correct_answer)
-    if emb1 is not None and emb2 is not None:
-        sim = util.cos_sim(emb1, emb2).item()
-        return sim >= (threshold / 100.0)
+        return decks.get(deck or selected_deck())
+    except KeyError:
+        return decks.get(DEFAULT_DECK)
+
+
+def current_vocab():
+    """一覧・検索などで使う、選択中のデッキの最新スナップショット"""
+    return deck_registry().current
+
+
+def quiz_vocab():
+    """進行中のクイズが開始時に固定したデッキ・スナップショット（出題順がずれないように）"""
+    return deck_registry(session.get('vocab_deck')).get(session.get('vocab_version'))
+
+
+def keep_quiz_vocab():
+    """進行中のクイズが固定したスナップショットが、このワーカーに無いときの後始末。続けられれば True
+
+    保持数（keep_versions）を超えて消えたときや、別のワーカーがそのバージョンを読み込んでいないときに起きる。
+    詳細・復習・おすすめは出題を単語IDで持っているので、いまのスナップショットに付け替えてそのまま続ける。
+    ランダムは出題順が単語帳の並びから決まり、同じ順番を作り直せないので、クイズを終わらせてメニューに戻す。
+    """
+    version = session.get('vocab_version')
+    registry = deck_registry(session.get('vocab_deck'))
+    if version is None or registry.has_version(version):
+        return True
+    if session.get('quiz_seed') is None:
+        session['vocab_version'] = registry.current.version
+        return True
+    commit_quiz_mistakes()
+    _clear_current_quiz_session_vars()
+    flash("単語帳が更新されたため、ランダムクイズの続きを出せなくなりました。お手数ですが最初から始めてください。", "warning")
+    return False
+
+
+def deck_range_key(start, end, deck=None):
+    """範囲ごとの保存データのキー。既定以外のデッキはデッキ名を前につける（例: "toeic:1-50"）"""
+    deck = deck or selected_deck()
+    range_key = f"{start}-{end}"
+    return range_key if deck == DEFAULT_DECK else f"{deck}:{range_key}"
+
+
+def states_for_deck(states, deck=None):
+    """範囲ごとの保存データから、指定デッキの分だけを「1-50」形式のキーで取り出す"""
+    deck = deck or selected_deck()
+    prefix = "" if deck == DEFAULT_DECK else f"{deck}:"
+    return {
+        key[len(prefix):]: value for key, value in (states or {}).items()
+        if key.startswith(prefix) and ':' not in key[len(prefix):]
+    }
+
+
+def update_range_stats(vocab, deck, results):
+    """回答結果 [(単語ID, 方向, 正誤), ...] から、範囲別の集計を差分で更新する（commit は呼び出し側）
+
+    このデッキでの単語ごとの「最後の正誤」が変わったときだけ、その単語の範囲の件数を増減させる。"""
+    latest = {}
+    for word_id, direction, correct in results:
+        latest[(word_id, direction)] = bool(correct)
+    if not latest:
+        return
+
+    now = datetime.utcnow()
+    existing = {
+        (p.word_id, p.direction): p for p in WordProgress.query.filter(
+            WordProgress.user_id == current_user.id,
+            WordProgress.deck == deck,
+            WordProgress.word_id.in_({word_id for word_id, _ in latest}),
+        )
+    }
+    deltas = {}  # (方向, 範囲の先頭) -> [習得の増減, 間違いの増減]
+    for (word_id, direction), correct in latest.items():
+        progress = existing.get((word_id, direction))
+        previous = progress.correct if progress is not None else None
+        if progress is None:
+            db.session.add(WordProgress(user_id=current_user.id, deck=deck, word_id=word_id, direction=direction, correct=correct, updated_at=now))
+        else:
+            progress.correct = correct
+            progress.updated_at = now
+        if previous == correct:
+            continue
+        range_start = vocab.range_start(word_id)
+        if range_start is None:
+            continue
+        delta = deltas.setdefault((direction, range_start), [0, 0])
+        if previous is not None:
+            delta[0 if previous else 1] -= 1
+        delta[0 if correct else 1] += 1
+
+    if not deltas:
+        return
+    stats = {
+        (stat.direction, stat.range_start): stat for stat in RangeStat.query.filter(
+            RangeStat.user_id == current_user.id,
+            RangeStat.deck == deck,
+            RangeStat.range_start.in_({start for _, start in deltas}),
+        )
+    }
+    for key, (mastered, mistakes) in deltas.items():
+        stat = stats.get(key)
+        if stat is None:
+            stat = RangeStat(user_id=current_user.id, deck=deck, direction=key[0], range_start=key[1], mastered=0, mistakes=0)
+            db.session.add(stat)
+        stat.mastered = max(stat.mastered + mastered, 0)
+        stat.mistakes = max(stat.mistakes + mistakes, 0)
+        stat.updated_at = now
+
+
+def update_progress_arrays(results):
+    """回答結果 [(単語ID, 方向, 正誤), ...] を学習状況の配列に反映する（commit は呼び出し側）"""
+    # 配列の長さは単語IDで決まるので、単語カタログに無いIDは入れない（大きなIDひとつで巨大な配列になる）
+    ids = {word_id for word_id, _, _ in results}
+    known = set()
+    max_word_id = None
+    if ids:
+        catalogue_max = db.session.query(func.max(Word.id)).scalar_subquery()
+        for word_id, max_word_id in db.session.query(Word.id, catalogue_max).filter(Word.id.in_(ids)):
+            known.add(word_id)
+    by_direction = {}
+    for word_id, direction, correct in results:
+        if word_id in known:
+            by_direction.setdefault(direction, []).append((word_id, bool(correct)))
+    if not by_direction:
+        return
+    # 同じユーザーの回答が同時に来ても取りこぼさないよう、行をロックして読み書きする
+    rows = {
+        row.direction: row for row in ProgressArray.query.filter(
+            ProgressArray.user_id == current_user.id,
+            ProgressArray.direction.in_(by_direction),
+        ).with_for_update()
+    }
+    now = datetime.utcnow()
+    for direction, answers in by_direction.items():
+        row = rows.get(direction)
+        if row is None:
+            row = ProgressArray(user_id=current_user.id, direction=direction, data=b'')
+            db.session.add(row)
+        row.data = progress_array.dump(progress_array.record(progress_array.load(row.data), answers, max_word_id=max_word_id))
+        row.updated_at = now
+
+
+def record_answers(vocab, deck, results):
+    """回答結果 [(単語ID, 方向, 正誤), ...] を範囲別の集計と学習状況の配列に反映する（commit は呼び出し側）"""
+    update_range_stats(vocab, deck, results)
+    update_progress_arrays(results)
+
+
+def progress_arrays_for(user_ids, direction):
+    """ユーザーID -> 学習状況の配列（1回のクエリで取る）"""
+    return {
+        user_id: progress_array.load(data)
+        for user_id, data in db.session.query(ProgressArray.user_id, ProgressArray.data)
+        .filter(ProgressArray.user_id.in_(user_ids), ProgressArray.direction == direction)
+    }
+
+
+def range_stats_for(deck, direction):
+    """範囲の先頭 -> {'mastered', 'mistakes'}（範囲選択ページ用に1回のクエリで取る）"""
+    return {
+        range_start: {'mastered': mastered, 'mistakes': mistakes}
+        for range_start, mastered, mistakes in db.session.query(
+            RangeStat.range_start, RangeStat.mastered, RangeStat.mistakes
+        ).filter_by(user_id=current_user.id, deck=deck, direction=direction)
+    }
+
+
+def _answer_vector(text, embeddings):
+    """事前計算済みベクトルがあればそれを、なければその場でエンコードしたものを返す"""
+    if embeddings is not None:
+        vec = embeddings.get(text.strip())
+        if vec is not None:
+            return vec
+    if isinstance(embeddings, VectorStore):
+        # 新形式のストアがある（=多言語モデルで揃っている）ときだけ、その場でエンコードする
+        return answer_encoder.encode(text)
+    return None
+
+
+def is_answer_similar(user_answer, correct_answer, threshold=60, embeddings=None):  # ← 数値を調整
+    user_ans_clean = user_answer.strip().lower()
+    correct_ans_clean = correct_answer.strip().lower()
+    if not user_ans_clean:
+        return False
+
+    # 訳語セル（「学生、生徒」など）のどれか1つと一致すれば正解
+    variants = [correct_answer.strip()] + split_variants(correct_answer)
+    if user_ans_clean in (v.lower() for v in variants):
+        return True
+
+    # ベクトルで意味的に比較（正解側は事前計算、ユーザー側は事前計算 or その場でエンコード）
+    correct_vectors = [vec for vec in (embeddings.get(v) for v in variants) if vec is not None] if embeddings is not None else []
+    if correct_vectors:
+        user_vec = _answer_vector(user_answer, embeddings)
+        if user_vec is not None:
+            sim = max(cosine(user_vec, vec) for vec in correct_vectors)
+            return sim >= (threshold / 100.0)
 
     # fallback: fuzzyマッチ
     similarity = fuzz.partial_ratio(user_ans_clean, correct_ans_clean)
@@ -121,74 +675,192 @@ def is_answer_similar(user_answer, correct_answer, threshold=60):  # ← 数値
 # （以降のコードはそのまま）
 
 
-def remove_mistake_from_all_lists(index_to_delete):
+# --- 間違いリスト（DB） -----------------------------------------------------------
+# 出題元: ランダム / 総合学習（範囲ごと）/ ざっくり学習。「復習」はランダムと総合学習の分が対象
+QUIZ_MISTAKE_SOURCES = ('random', 'detailed', 'adaptive')
+ROUGH_MISTAKE_SOURCES = ('rough',)
+ALL_MISTAKE_SOURCES = QUIZ_MISTAKE_SOURCES + ROUGH_MISTAKE_SOURCES
+MISTAKES_PAGE_SIZE = int(os.environ.get("MISTAKES_PAGE_SIZE", "100"))
+
+
+def add_mistakes(entries, user_id=None):
+    """間違いを登録する（既にあるものは無視）。entries: [{'word_id', 'direction', 'source', 'range_key'}]
+
+    1回の INSERT ... ON CONFLICT DO NOTHING で入れる。commit は呼び出し側"""
+    user_id = user_id or current_user.id
+    rows = {
+        (e['source'], e.get('range_key') or '', e['word_id'], e['direction']): {
+            'user_id': user_id, 'word_id': e['word_id'], 'direction': e['direction'],
+            'source': e['source'], 'range_key': e.get('range_key') or '',
+        }
+        for e in entries
+    }
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        db.session.execute(insert(Mistake).on_conflict_do_nothing(), list(rows.values()))
+        return
+    # それ以外の DB: 既存分を引いてから入れる
+    existing = set(
+        db.session.query(Mistake.source, Mistake.range_key, Mistake.word_id, Mistake.direction)
+        .filter(Mistake.user_id == user_id, Mistake.word_id.in_({key[2] for key in rows}))
+    )
+    new_rows = [row for key, row in rows.items() if key not in existing]
+    if new_rows:
+        db.session.execute(db.insert(Mistake), new_rows)
+
+
+def delete_mistakes(word_ids, sources=ALL_MISTAKE_SOURCES, direction=None):
+    """指定した単語の間違いを1回の DELETE でまとめて消す。消した行数を返す（commit は呼び出し側）"""
+    if not word_ids:
+        return 0
+    query = Mistake.query.filter(
+        Mistake.user_id == current_user.id,
+        Mistake.source.in_(sources),
+        Mistake.word_id.in_(set(word_ids)),
+    )
+    if direction:
+        query = query.filter(Mistake.direction == direction)
+    return query.delete(synchronize_session=False)
+
+
+def mistake_entries(sources):
+    """復習クイズ用に、重複を除いた (単語ID, 方向) の一覧"""
+    return [
+        {'idx': word_id, 'dir': direction}
+        for word_id, direction in db.session.query(Mistake.word_id, Mistake.direction)
+        .filter(Mistake.user_id == current_user.id, Mistake.source.in_(sources))
+        .distinct()
+    ]
+
+
+def mistake_word_page(sources, direction=None, after=None, limit=MISTAKES_PAGE_SIZE):
+    """間違えた単語IDを word_id 順に limit 件（キーセット・ページング）。(IDのリスト, 次ページの after) を返す"""
+    query = db.session.query(Mistake.word_id).filter(
+        Mistake.user_id == current_user.id, Mistake.source.in_(sources)
+    )
+    if direction:
+        query = query.filter(Mistake.direction == direction)
+    if after is not None:
+        query = query.filter(Mistake.word_id > after)
+    word_ids = [row.word_id for row in query.distinct().order_by(Mistake.word_id).limit(limit + 1)]
+    next_after = word_ids[limit - 1] if len(word_ids) > limit else None
+    return word_ids[:limit], next_after
+
+
+def mistake_page_args(sources):
+    """管理ページのクエリ引数（?source=&dir=&after=）を読む"""
+    source = request.args.get('source', '')
+    direction = request.args.get('dir', '')
+    return {
+        'sources': (source,) if source in sources else sources,
+        'direction': direction if direction in ('ej', 'je') else None,
+        'after': request.args.get('after', type=int),
+        'filters': {'source': source if source in sources else '', 'dir': direction if direction in ('ej', 'je') else ''},
+    }
+
+
+# セッションに持っていた頃の間違いリストのキー（DBに移したら消す）
+LEGACY_MISTAKE_SESSION_KEYS = ('random_quiz_mistakes', 'detailed_quiz_mistakes', 'global_rough_mistakes')
+
+
+def _migrate_session_mistakes():
+    """セッションに残っている古い間違いリストを DB に移す（ユーザーごとに最初のアクセス時に1回）"""
+    if not current_user.is_authenticated or not any(key in session for key in LEGACY_MISTAKE_SESSION_KEYS):
+        return
+    entries = [
+        {'word_id': m['idx'], 'direction': m['dir'], 'source': 'random'}
+        for m in session.get('random_quiz_mistakes') or []
+    ]
+    for range_key, mistakes in (session.get('detailed_quiz_mistakes') or {}).items():
+        entries.extend(
+            {'word_id': m['idx'], 'direction': m['dir'], 'source': 'detailed', 'range_key': range_key}
+            for m in mistakes
+        )
+    entries.extend(
+        {'word_id': m['idx'], 'direction': m['dir'], 'source': 'rough'}
+        for m in session.get('global_rough_mistakes') or []
+    )
+    add_mistakes(entries)
+    db.session.commit()
+    for key in LEGACY_MISTAKE_SESSION_KEYS:
+        session.pop(key, None)
+
+
+def remove_mistakes_from_all_lists(word_ids):
     """指定された単語IDを、永続・中断セッションを含む全ての間違いリストから完全に削除する"""
-    # 1. 永続的なランダム間違いリストから削除
-    random_mistakes = session.get("random_quiz_mistakes", [])
-    session["random_quiz_mistakes"] = [m for m in random_mistakes if m.get('idx') != index_to_delete]
-
-    # 2. 永続的な詳細学習間違い辞書から削除
-    detailed_mistakes_dict = session.get("detailed_quiz_mistakes", {})
-    if detailed_mistakes_dict:
-        for range_key in list(detailed_mistakes_dict.keys()):
-            detailed_mistakes_dict[range_key] = [m for m in detailed_mistakes_dict[range_key] if m.get('idx') != index_to_delete]
-        session['detailed_quiz_mistakes'] = detailed_mistakes_dict
-    
-    # 3. 中断中のセッション間違いから削除
+    word_ids = set(word_ids)
+    # 1. 永続的な間違いリスト（ランダム・詳細学習）から1回の DELETE で削除
+    delete_mistakes(word_ids, QUIZ_MISTAKE_SOURCES)
+    db.session.commit()
+
+    # 2. 中断中のセッション間違いから削除（各リストを1回ずつ走査）
+    def keep(mistakes):
+        return mistake_keys.encode(k for k in mistake_keys.decode(mistakes) if k >> 1 not in word_ids)
+
     saved_states = session.get('saved_states', {})
     if saved_states:
         for direction, saves in saved_states.items():
             if saves.get('random') and 'session_mistakes' in saves['random']:
-                saves['random']['session_mistakes'] = [m for m in saves['random']['session_mistakes'] if m.get('idx') != index_to_delete]
+                saves['random']['session_mistakes'] = keep(saves['random']['session_mistakes'])
             if saves.get('review') and 'session_mistakes' in saves['review']:
-                saves['review']['session_mistakes'] = [m for m in saves['review']['session_mistakes'] if m.get('idx') != index_to_delete]
+                saves['review']['session_mistakes'] = keep(saves['review']['session_mistakes'])
             if saves.get('detailed'):
                 for range_key, state in saves['detailed'].items():
                     if 'session_mistakes' in state:
-                        state['session_mistakes'] = [m for m in state['session_mistakes'] if m.get('idx') != index_to_delete]
+                        state['session_mistakes'] = keep(state['session_mistakes'])
     session['saved_states'] = saved_states
         
 def commit_quiz_mistakes():
-    """現在のクイズの間違い（IDと方向）を、永続リストにコミットする"""
+    """現在のクイズの間違い（IDと方向）を、永続リスト（DB）にコミットする"""
     if not current_user.is_authenticated:
         return
 
     current_quiz_type = session.get('current_quiz_type')
-    current_mistakes = session.get('current_quiz_mistakes_indices', [])
+    current_mistakes = mistake_keys.decode(session.get('current_quiz_mistakes_indices'))
      
     if not current_quiz_type or not current_mistakes:
         return
 
-    if current_quiz_type == 'random':
-        mistake_list = session.setdefault('random_quiz_mistakes', [])
-        for mistake_dict in current_mistakes:
-            if mistake_dict not in mistake_list:
-                mistake_list.append(mistake_dict)
-        session['random_quiz_mistakes'] = mistake_list
-
+    if current_quiz_type in ('random', 'adaptive'):
+        range_key = ''
     elif current_quiz_type == 'detailed':
         current_range = session.get('detailed_quiz_range')
         if not current_range: return
-        
-        range_key = f"{current_range[0]}-{current_range[1]}"
-        mistakes_dict = session.setdefault('detailed_quiz_mistakes', {})
-        range_mistake_list = mistakes_dict.setdefault(range_key, [])
+        range_key = deck_range_key(current_range[0], current_range[1], session.get('vocab_deck'))
+    else:
+        return
 
-        for mistake_dict in current_mistakes:
-            if mistake_dict not in range_mistake_list:
-                range_mistake_list.append(mistake_dict)
-        
-        mistakes_dict[range_key] = range_mistake_list
-        session['detailed_quiz_mistakes'] = mistakes_dict
+    add_mistakes([
+        {'word_id': word_id, 'direction': direction, 'source': current_quiz_type, 'range_key': range_key}
+        for word_id, direction in map(mistake_keys.unpack, current_mistakes)
+    ])
+    db.session.commit()
         
-def _init_quiz_session(quiz_type, initial_rows=None, initial_seed=None, initial_index=0, initial_score=0, detailed_range=None, initial_session_mistakes=None):
+def _init_quiz_session(quiz_type, initial_rows=None, initial_seed=None, initial_index=0, initial_score=0, detailed_range=None, initial_session_mistakes=None, vocab_version=None, deck=None):
+    # 再開時は中断した時点のデッキ・バージョンに戻す（保持期間を過ぎていれば最新）
+    deck = deck if deck and decks.exists(deck) else selected_deck()
+    registry = deck_registry(deck)
+    if vocab_version is not None and not registry.has_version(vocab_version) and quiz_type == 'random':
+        # ランダムは中断時の出題順を作り直せないので、最初から（詳細などは単語IDで持っているのでそのまま続ける）
+        flash("単語帳が更新されたため、ランダムクイズは最初からになります。", "warning")
+        initial_seed, initial_index, initial_score, initial_session_mistakes = None, 0, 0, None
+    if vocab_version is None or not registry.has_version(vocab_version):
+        vocab_version = registry.current.version
+    session['vocab_deck'] = deck
+    session['vocab_version'] = vocab_version
     session['index'] = initial_index
     session['score'] = initial_score
     session['last_result'] = None
     session['user_answer_for_feedback'] = ""
     session['correct_english_for_feedback'] = ""
     session['correct_japanese_for_feedback'] = ""
-    session['current_quiz_mistakes_indices'] = initial_session_mistakes if initial_session_mistakes is not None else []
+    session['current_quiz_mistakes_indices'] = mistake_keys.encode(mistake_keys.decode(initial_session_mistakes))
     session['current_quiz_type'] = quiz_type
     session['show_feedback_and_next_button'] = False
 
@@ -196,7 +868,7 @@ def _init_quiz_session(quiz_type, initial_rows=None, initial_seed=None, initial_
         session['quiz_seed'] = initial_seed if initial_seed is not None else random.randint(0, 100000)
         session['quiz_rows'] = None
         session.pop('detailed_quiz_range', None)
-    elif quiz_type in ['retry', 'detailed']:
+    elif quiz_type in ['retry', 'detailed', 'adaptive']:
         session['quiz_seed'] = None
         session['quiz_rows'] = initial_rows
         if quiz_type == 'detailed' and detailed_range:
@@ -204,9 +876,9 @@ def _init_quiz_session(quiz_type, initial_rows=None, initial_seed=None, initial_
         else:
             session.pop('detailed_quiz_range', None)
 
-def get_quiz_rows_from_session_params(quiz_seed, fixed_quiz_rows):
+def get_quiz_rows_from_session_params(quiz_seed, fixed_quiz_rows, vocab=None):
     if quiz_seed is not None:
-        shuffled_indices = ALL_INDICES.copy()
+        shuffled_indices = (vocab or quiz_vocab()).all_word_ids.copy()
         random.Random(quiz_seed).shuffle(shuffled_indices)
         return shuffled_indices[:len(shuffled_indices)]
     elif fixed_quiz_rows is not None:
@@ -218,7 +890,7 @@ def _clear_current_quiz_session_vars():
         'index', 'score', 'quiz_seed', 'quiz_rows', 'total_questions', 'last_result',
         'user_answer_for_feedback', 'correct_english_for_feedback', 'correct_japanese_for_feedback',
         'current_quiz_mistakes_indices', 'current_quiz_type', 'show_feedback_and_next_button',
-        'detailed_quiz_range', 'current_row_index'
+        'detailed_quiz_range', 'current_row_index', 'vocab_version', 'vocab_deck'
     ]
     for key in keys_to_clear:
         session.pop(key, None)
@@ -237,7 +909,16 @@ def login():
         username = request.form.get("username")
         password = request.form.get("password")
         user = User.query.filter_by(username=username).first()
-        if user and check_password_hash(user.password, password):
+        try:
+            valid, new_hash = password_hasher.verify_and_update(user.password, password) if user else (False, None)
+        except HashPoolBusy:
+            flash("ログインが混み合っています。少し待ってから再度お試しください。", "warning")
+            return redirect(url_for("login"))
+        if valid:
+            if new_hash:
+                # 古い方式のハッシュは、今の設定で作り直しておく
+                user.password = new_hash
+                db.session.commit()
             login_user(user)
             #flash("ログインに成功しました！", "success")
             return redirect(url_for("menu"))
@@ -260,6 +941,15 @@ def set_direction(direction):
         session['quiz_direction'] = direction
     return redirect(url_for('menu'))
 
+@app.route("/set_deck/<deck>")
+@login_required
+def set_deck(deck):
+    if decks.exists(deck):
+        session['deck'] = deck
+    else:
+        flash("その単語帳は見つかりませんでした。", "warning")
+    return redirect(url_for('menu'))
+
 # --- メインメニュー -------------------------------------------------------------
 @app.route("/")
 @app.route("/menu")
@@ -287,12 +977,30 @@ def menu():
         .all()
     )
 
-    return render_template("menu.html", 
+    # ランキングの各ユーザーが、選択中の単語帳で何語習得しているか（配列をまとめて読んで数える）
+    vocab = current_vocab()
+    arrays = progress_arrays_for([user.id for user, _ in top_users], quiz_direction)
+    top_users = [
+        (user, attempts, progress_array.summary(arrays[user.id], vocab.all_word_ids)['mastered'] if user.id in arrays else 0)
+        for user, attempts in top_users
+    ]
+
+    available_decks = list(decks.available())
+    # ランキングや中断データが前回と同じなら 304 を返す
+    etag_parts = (
+        'menu', current_user.id, current_user.nickname, current_user.is_admin,
+        quiz_direction, saved_states_for_direction, selected_deck(), available_decks,
+        [(user.id, user.nickname, attempts, mastered) for user, attempts, mastered in top_users],
+    )
+    return render_if_modified(app, etag_parts, lambda: render_template("menu.html", 
         saved_random_state=saved_states_for_direction.get('random'),
+        saved_adaptive_state=saved_states_for_direction.get('adaptive'),
         saved_detailed_states=saved_states_for_direction.get('detailed', {}),
         saved_review_state=saved_states_for_direction.get('review'),
-        top_users=top_users
-    )
+        top_users=top_users,
+        available_decks=available_decks,
+        current_deck=selected_deck()
+    ))
 # --- クイズ開始・再開ルート ----------------------------------------------------
 @app.route('/start_new_random_quiz')
 @login_required
@@ -324,7 +1032,9 @@ def resume_random_quiz():
         initial_seed=saved_state.get('seed'), 
         initial_index=saved_state.get('index', 0), 
         initial_score=saved_state.get('score', 0),
-        initial_session_mistakes=saved_state.get('session_mistakes', [])
+        initial_session_mistakes=saved_state.get('session_mistakes', []),
+        vocab_version=saved_state.get('vocab_version'),
+        deck=saved_state.get('deck')
     )
     #flash("中断したランダムクイズを再開します。", "info")
     return redirect(url_for('quiz'))
@@ -333,28 +1043,36 @@ def resume_random_quiz():
 @login_required
 def learn_details():
     commit_quiz_mistakes()
-    total_words = len(full_df)
-    ranges = [(i + 1, min(i + 50, total_words)) for i in range(0, total_words, 50)]
+    vocab = current_vocab()
+    deck = selected_deck()
     
     # ★★★ ここからが修正後のロジック ★★★
     # 現在の出題方向に応じた中断データを正しく取得する
     quiz_direction = session.get('quiz_direction', 'ej')
-    saved_states = session.get('saved_states', {}).get(quiz_direction, {}).get('detailed', {})
+    saved_states = states_for_deck(session.get('saved_states', {}).get(quiz_direction, {}).get('detailed', {}))
+    # 範囲の一覧はスナップショットで作成済み、集計は回答のたびに更新済みなので、ここでは引くだけ
+    range_stats = range_stats_for(deck, quiz_direction)
+    # 単語帳全体の習得状況は、学習状況の配列を単語帳の単語IDで引いて数える
+    progress = progress_arrays_for([current_user.id], quiz_direction).get(current_user.id)
+    deck_summary = progress_array.summary(progress if progress is not None else progress_array.load(b''), vocab.all_word_ids)
     
-    return render_template("learn_details.html", ranges=ranges, saved_detailed_states=saved_states)
+    etag_parts = ('learn_details', current_user.id, deck, vocab.version, quiz_direction, saved_states, range_stats, deck_summary)
+    return render_if_modified(app, etag_parts, lambda: render_template(
+        "learn_details.html", ranges=vocab.ranges, saved_detailed_states=saved_states,
+        range_stats=range_stats, deck_summary=deck_summary, current_deck=deck, quiz_direction=quiz_direction))
 
 @app.route('/start_detailed_quiz/<int:start_idx>/<int:end_idx>')
 @login_required
 def start_detailed_quiz(start_idx, end_idx):
     commit_quiz_mistakes()
     quiz_direction = session.get('quiz_direction', 'ej')
-    range_key = f"{start_idx}-{end_idx}"
+    range_key = deck_range_key(start_idx, end_idx)
     
     if 'saved_states' in session and quiz_direction in session['saved_states'] and 'detailed' in session['saved_states'][quiz_direction]:
         session['saved_states'][quiz_direction]['detailed'].pop(range_key, None)
         session.modified = True
 
-    selected_indices = ALL_INDICES[start_idx - 1 : end_idx]
+    selected_indices = current_vocab().ids_in_range(start_idx, end_idx)
     _init_quiz_session('detailed', initial_rows=selected_indices, detailed_range=(start_idx, end_idx))
     #flash(f"詳細学習クイズ (範囲: {range_key}) を開始します。", "info")
     return redirect(url_for('quiz'))
@@ -364,7 +1082,8 @@ def start_detailed_quiz(start_idx, end_idx):
 def resume_detailed_quiz(range_key):
     quiz_direction = session.get('quiz_direction', 'ej')
     saved_detailed_states = session.get('saved_states', {}).get(quiz_direction, {}).get('detailed', {})
-    saved_state = saved_detailed_states.pop(range_key, None)
+    start_idx, end_idx = map(int, range_key.split('-'))
+    saved_state = saved_detailed_states.pop(deck_range_key(start_idx, end_idx), None)
 
     if not saved_state:
         flash("再開できる詳細学習クイズが見つかりませんでした。", "warning")
@@ -373,18 +1092,64 @@ def resume_detailed_quiz(range_key):
     session['saved_states'][quiz_direction]['detailed'] = saved_detailed_states
     session.modified = True
 
-    start_idx, end_idx = map(int, range_key.split('-'))
     _init_quiz_session(
         'detailed',
         initial_rows=saved_state.get('rows'),
         initial_index=saved_state.get('index', 0),
         initial_score=saved_state.get('score', 0),
         detailed_range=(start_idx, end_idx),
-        initial_session_mistakes=saved_state.get('session_mistakes', [])
+        initial_session_mistakes=saved_state.get('session_mistakes', []),
+        vocab_version=saved_state.get('vocab_version'),
+        deck=saved_state.get('deck')
     )
     #flash(f"中断した詳細学習クイズ (範囲: {range_key}) を再開します。", "info")
     return redirect(url_for('quiz'))
 
+# おすすめ出題の1回あたりの問題数
+ADAPTIVE_QUIZ_SIZE = int(os.environ.get("ADAPTIVE_QUIZ_SIZE", "20"))
+
+@app.route('/start_adaptive_quiz')
+@login_required
+def start_adaptive_quiz():
+    """苦手な単語・しばらく出ていない単語・紛らわしい単語を多めに選んでクイズを始める（毎回選び直す）"""
+    commit_quiz_mistakes()
+    quiz_direction = session.get('quiz_direction', 'ej')
+    vocab = current_vocab()
+    progress = progress_arrays_for([current_user.id], quiz_direction).get(current_user.id)
+    rows = adaptive.draw(progress if progress is not None else progress_array.load(b''), vocab, ADAPTIVE_QUIZ_SIZE)
+    if not rows:
+        flash("出題できる単語がありません。", "warning")
+        return redirect(url_for('menu'))
+    if 'saved_states' in session and quiz_direction in session['saved_states']:
+        session['saved_states'][quiz_direction].pop('adaptive', None)
+        session.modified = True
+    _init_quiz_session('adaptive', initial_rows=rows)
+    return redirect(url_for('quiz'))
+
+@app.route('/resume_adaptive_quiz')
+@login_required
+def resume_adaptive_quiz():
+    """中断したおすすめ出題を、中断したときに選んだ単語のまま続きから"""
+    quiz_direction = session.get('quiz_direction', 'ej')
+    saved_state = session.get('saved_states', {}).get(quiz_direction, {}).get('adaptive')
+
+    if not saved_state:
+        flash("再開できるおすすめ出題が見つかりませんでした。", "warning")
+        return redirect(url_for('menu'))
+
+    session['saved_states'][quiz_direction].pop('adaptive', None)
+    session.modified = True
+
+    _init_quiz_session('adaptive',
+        initial_rows=saved_state.get('rows'),
+        initial_index=saved_state.get('index', 0),
+        initial_score=saved_state.get('score', 0),
+        initial_session_mistakes=saved_state.get('session_mistakes', []),
+        vocab_version=saved_state.get('vocab_version'),
+        deck=saved_state.get('deck')
+    )
+    return redirect(url_for('quiz'))
+
 @app.route("/retry")
 @login_required
 def retry_mistakes():
@@ -416,7 +1181,9 @@ def retry_mistakes():
             initial_rows=saved_review_state.get('rows'), 
             initial_index=saved_review_state.get('index', 0), 
             initial_score=saved_review_state.get('score', 0), 
-            initial_session_mistakes=saved_review_state.get('session_mistakes', [])
+            initial_session_mistakes=saved_review_state.get('session_mistakes', []),
+            vocab_version=saved_review_state.get('vocab_version'),
+            deck=saved_review_state.get('deck')
         )
         return redirect(url_for('quiz'))
 
@@ -433,17 +1200,8 @@ def retry_mistakes():
     # DBなどに保存されている間違いをコミット（必要に応じて）
     commit_quiz_mistakes()
 
-    # セッションから全ての間違いデータを収集
-    random_mistakes = session.get("random_quiz_mistakes", [])
-    detailed_mistakes_dict = session.get("detailed_quiz_mistakes", {})
-    all_mistakes = list(random_mistakes)
-    if detailed_mistakes_dict:
-        for key in detailed_mistakes_dict:
-            all_mistakes.extend(detailed_mistakes_dict[key])
-    
-    # 辞書のリストはsetに入れられないため、タプルのリストに変換して重複を削除
-    unique_mistakes_tuples = set(tuple(d.items()) for d in all_mistakes)
-    unique_mistakes = [dict(t) for t in unique_mistakes_tuples]
+    # 全ての間違いデータを収集（重複は DB 側で除く）
+    unique_mistakes = mistake_entries(QUIZ_MISTAKE_SOURCES)
     
     # ★★★ 修正箇所 ★★★
     # 間違いが一件もなかった場合、専用ページを表示する
@@ -456,14 +1214,113 @@ def retry_mistakes():
     return redirect(url_for("quiz"))
 
 # --- クイズ進行・結果ルート -------------------------------------------------------
+def _quiz_question(vocab, item, quiz_type, global_quiz_direction):
+    """quiz_rows の1要素から、出題に必要な情報をまとめる"""
+    if quiz_type == 'retry':
+        word_id = item['idx']
+        question_direction = item['dir']
+    else:
+        word_id = item
+        question_direction = global_quiz_direction
+
+    english, japanese = vocab.word(word_id)
+    question, correct_answer = (
+        (english, japanese)
+        if question_direction == 'ej'
+        else (japanese, english)
+    )
+
+    # ヒント（日本語→英語のみ）
+    hints = {}
+    if question_direction == 'je' and correct_answer:
+        hints['first_letter'] = correct_answer[0]
+        hints['placeholder'] = ' '.join(['_' for _ in correct_answer])
+        hints['word_length'] = len(correct_answer)
+        # 漢字の訳が読めないときのために読みも出す（問題文がかなだけなら出さない）
+        reading = vocab.reading(word_id)
+        if reading and normalize_kana(reading) != normalize_kana(question):
+            hints['reading'] = reading
+
+    return {
+        'word_id': word_id,
+        'direction': question_direction,
+        'question': question,
+        'correct_answer': correct_answer,
+        'english': english,
+        'japanese': japanese,
+        'hints': hints,
+    }
+
+
+# 回答記録を何行ためてから書くか（0 ならためずに回答ごとに書く）。既定は SQLite のときだけためる
+ATTEMPT_BATCH_SIZE = int(os.environ.get("ATTEMPT_BATCH_SIZE", "200" if IS_SQLITE else "0"))
+ATTEMPT_FLUSH_INTERVAL = float(os.environ.get("ATTEMPT_FLUSH_INTERVAL", "1.0"))
+
+
+def _write_attempts(rows):
+    with app.app_context():
+        try:
+            db.session.execute(db.insert(QuizAttempt), rows)
+            db.session.commit()
+        except IntegrityError:
+            # ためている間に削除されたユーザーの分は捨てて入れ直す
+            db.session.rollback()
+            alive = {i for (i,) in db.session.query(User.id).filter(User.id.in_({row['user_id'] for row in rows}))}
+            rows = [row for row in rows if row['user_id'] in alive]
+            if rows:
+                db.session.execute(db.insert(QuizAttempt), rows)
+            db.session.commit()
+
+
+attempt_writer = AttemptWriter(_write_attempts, batch_size=ATTEMPT_BATCH_SIZE, interval=ATTEMPT_FLUSH_INTERVAL)
+
+
+def record_attempt(user_id):
+    """クイズ1問ぶんの回答記録（ためて書く設定ならバッファに積む。そうでなければ add のみ、commit は呼び出し側）"""
+    if attempt_writer.enabled:
+        attempt_writer.add({'user_id': user_id, 'timestamp': datetime.utcnow()})
+    else:
+        db.session.add(QuizAttempt(user_id=user_id))
+
+
+def _record_quiz_answer(q, user_answer, vocab):
+    """回答を採点し、スコア・進行位置・間違いリストを更新する（DBへの記録は add のみ、commit は呼び出し側）"""
+    correct = (
+        user_answer.lower() == q['correct_answer'].lower()
+        if q['direction'] == 'je'
+        else is_answer_similar(user_answer, q['correct_answer'], embeddings=vocab.embeddings)
+    )
+
+    # 間違いリスト更新
+    current_mistakes = mistake_keys.decode(session.get('current_quiz_mistakes_indices'))
+    marker = mistake_keys.pack(q['word_id'], q['direction'])
+    if correct:
+        # スコア加算
+        session["score"] = session.get("score", 0) + 1
+        current_mistakes.discard(marker)
+    else:
+        current_mistakes.add(marker)
+    session['current_quiz_mistakes_indices'] = mistake_keys.encode(current_mistakes)
+
+    # ここで「解いた問題」をカウント
+    session["index"] = session.get("index", 0) + 1
+
+    record_attempt(current_user.id)
+    return correct
+
+
 @app.route("/quiz", methods=["GET", "POST"])
 @login_required
 def quiz():
+    if not keep_quiz_vocab():
+        return redirect(url_for("menu"))
     quiz_type = session.get('current_quiz_type')
     global_quiz_direction = session.get('quiz_direction', 'ej')
+    vocab = quiz_vocab()
     quiz_rows = get_quiz_rows_from_session_params(
         session.get('quiz_seed'),
-        session.get('quiz_rows')
+        session.get('quiz_rows'),
+        vocab
     )
     session['total_questions'] = len(quiz_rows)
 
@@ -476,88 +1333,42 @@ def quiz():
         return redirect(url_for("result"))
 
     # 出題データ取得
-    current_item = quiz_rows[idx]
-    if quiz_type == 'retry':
-        row_index = current_item['idx']
-        question_direction = current_item['dir']
-    else:
-        row_index = current_item
-        question_direction = global_quiz_direction
-
-    english = str(full_df.at[row_index, "English"]).strip()
-    japanese = str(full_df.at[row_index, "Japanese"]).strip()
-    question, correct_answer = (
-        (english, japanese)
-        if question_direction == 'ej'
-        else (japanese, english)
-    )
-
-    # ヒント（日本語→英語のみ）
-    hints = {}
-    if question_direction == 'je' and correct_answer:
-        hints['first_letter'] = correct_answer[0]
-        hints['placeholder'] = ' '.join(['_' for _ in correct_answer])
-        hints['word_length'] = len(correct_answer)
+    q = _quiz_question(vocab, quiz_rows[idx], quiz_type, global_quiz_direction)
+    template = "mistake.html" if quiz_type == 'retry' else "quiz.html"
 
     if request.method == "POST":
         # 正誤判定
         user_answer = request.form.get("user_answer", "").strip()
-        correct = (
-            user_answer.lower() == correct_answer.lower()
-            if question_direction == 'je'
-            else is_answer_similar(user_answer, correct_answer)
-        )
+        correct = _record_quiz_answer(q, user_answer, vocab)
+        record_answers(vocab, session.get('vocab_deck') or selected_deck(), [(q['word_id'], q['direction'], correct)])
+        db.session.commit()
 
         # フィードバック用セッション設定
         session['last_result'] = "正解" if correct else "不正解"
         session['user_answer_for_feedback'] = user_answer
-        session['correct_english_for_feedback'] = english
-        session['correct_japanese_for_feedback'] = japanese
-
-        # 間違いリスト更新
-        current_mistakes = session.get('current_quiz_mistakes_indices', [])
-        marker = {'idx': row_index, 'dir': question_direction}
-        if correct:
-            # スコア加算
-            session["score"] = session.get("score", 0) + 1
-            if marker in current_mistakes:
-                current_mistakes.remove(marker)
-        else:
-            if marker not in current_mistakes:
-                current_mistakes.append(marker)
-        session['current_quiz_mistakes_indices'] = current_mistakes
-
-        # ここで「解いた問題」をカウント
-        session["index"] = idx + 1
-
-        # DBに記録
-        attempt = QuizAttempt(user_id=current_user.id)
-        db.session.add(attempt)
-        db.session.commit()
-
+        session['correct_english_for_feedback'] = q['english']
+        session['correct_japanese_for_feedback'] = q['japanese']
         session['show_feedback_and_next_button'] = True
 
         # 回答後は同じテンプレートでフィードバック表示
-        template = "mistake.html" if quiz_type == 'retry' else "quiz.html"
         return render_template(
             template,
-            question=question,
+            question=q['question'],
             result=session['last_result'],
             user_answer_for_feedback=user_answer,
-            correct_english_for_feedback=english,
-            correct_japanese_for_feedback=japanese,
+            correct_english_for_feedback=q['english'],
+            correct_japanese_for_feedback=q['japanese'],
             current_question_number=idx + 1,
             total_questions=len(quiz_rows),
             show_feedback_and_next_button=True,
-            hints=hints,
-            current_row_index=row_index
+            hints=q['hints'],
+            current_word_id=q['word_id']
         )
 
-    # GET時はただ出題
-    template = "mistake.html" if quiz_type == 'retry' else "quiz.html"
+    # GET時はただ出題（JS が使えればここから先は1ページで進めるので、先読み分も埋め込む）
     return render_template(
         template,
-        question=question,
+        question=q['question'],
         result=None,
         user_answer_for_feedback="",
         correct_english_for_feedback="",
@@ -565,10 +1376,336 @@ def quiz():
         current_question_number=idx + 1,
         total_questions=len(quiz_rows),
         show_feedback_and_next_button=False,
-        hints=hints,
-        current_row_index=row_index
+        hints=q['hints'],
+        current_word_id=q['word_id'],
+        initial_questions=_api_questions(vocab, quiz_rows, quiz_type, idx, QUIZ_API_PREFETCH)
     )
 
+# --- クイズ JSON API（1ページで進めるクライアント用） ----------------------------
+# 次の数問をまとめて先読みし、回答もまとめて送れるようにして、1問ごとの往復をなくす。
+# 正解（と訳の言い換え）をクライアントに渡し、一致する回答はその場で判定して後でまとめて送る。
+# 一致しない英語→日本語の回答だけは、意味での判定のためにすぐサーバーで採点する。
+QUIZ_API_MAX_BATCH = 50
+QUIZ_API_PREFETCH = 10
+
+
+def _api_quiz_state():
+    """(vocab, quiz_rows, quiz_type) を返す。クイズ中でなければ None"""
+    if not keep_quiz_vocab():
+        return None
+    vocab = quiz_vocab()
+    quiz_rows = get_quiz_rows_from_session_params(session.get('quiz_seed'), session.get('quiz_rows'), vocab)
+    if not quiz_rows or not session.get('current_quiz_type'):
+        return None
+    session['total_questions'] = len(quiz_rows)
+    return vocab, quiz_rows, session.get('current_quiz_type')
+
+
+def _api_questions(vocab, quiz_rows, quiz_type, start, count):
+    global_quiz_direction = session.get('quiz_direction', 'ej')
+    count = max(0, min(count, QUIZ_API_MAX_BATCH))
+    questions = []
+    for position in range(start, min(start + count, len(quiz_rows))):
+        q = _quiz_question(vocab, quiz_rows[position], quiz_type, global_quiz_direction)
+        if q['direction'] == 'je':
+            accept = [q['correct_answer']]
+        else:
+            accept = [q['correct_answer']] + split_variants(q['correct_answer'])
+        questions.append({
+            'position': position,
+            'word_id': q['word_id'],
+            'direction': q['direction'],
+            'question': q['question'],
+            'hints': q['hints'],
+            'english': q['english'],
+            'japanese': q['japanese'],
+            # accept のどれかと一致すれば正解（クライアントで判定してよい）。
+            # exact=False の問題で一致しなかった場合は、意味での判定のためサーバーに送る
+            'accept': accept,
+            'exact': q['direction'] == 'je',
+        })
+    return questions
+
+
+def _api_progress(quiz_rows):
+    index = session.get('index', 0)
+    return {
+        'index': index,
+        'score': session.get('score', 0),
+        'total': len(quiz_rows),
+        'done': index >= len(quiz_rows),
+    }
+
+
+@app.route("/api/quiz/next")
+@login_required
+def api_quiz_next():
+    state = _api_quiz_state()
+    if state is None:
+        return jsonify({'error': 'クイズセッションが正しく開始されていません。'}), 400
+    vocab, quiz_rows, quiz_type = state
+    start = request.args.get('start', default=session.get('index', 0), type=int)
+    count = request.args.get('n', default=QUIZ_API_PREFETCH, type=int)
+    return jsonify({
+        **_api_progress(quiz_rows),
+        'questions': _api_questions(vocab, quiz_rows, quiz_type, max(start, 0), count),
+    })
+
+
+@app.route("/api/quiz/answer", methods=["POST"])
+@login_required
+def api_quiz_answer():
+    """回答をまとめて受け取る: {"answers": [{"position": 3, "answer": "..."}], "prefetch": {"start": 8, "n": 10}}
+
+    position は現在の進行位置から順番に受け付ける。既に受け付けた position は無視するので、
+    通信が切れて同じ回答を送り直しても二重に数えない。"""
+    state = _api_quiz_state()
+    if state is None:
+        return jsonify({'error': 'クイズセッションが正しく開始されていません。'}), 400
+    vocab, quiz_rows, quiz_type = state
+    payload = request.get_json(silent=True) or {}
+    if not isinstance(payload, dict):
+        return jsonify({'error': '送信内容の形式が正しくありません。'}), 400
+    answers = payload.get('answers') or []
+    if not isinstance(answers, list) or not all(isinstance(item, dict) for item in answers):
+        return jsonify({'error': 'answers の形式が正しくありません。'}), 400
+    prefetch = payload.get('prefetch')
+    if isinstance(prefetch, dict):
+        try:
+            prefetch_start = int(prefetch.get('start', session.get('index', 0)))
+            prefetch_count = int(prefetch.get('n', QUIZ_API_PREFETCH))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'prefetch の形式が正しくありません。'}), 400
+    global_quiz_direction = session.get('quiz_direction', 'ej')
+
+    results = []
+    for item in answers[:QUIZ_API_MAX_BATCH]:
+        position = item.get('position')
+        index = session.get('index', 0)
+        if not isinstance(position, int) or position < index:
+            continue  # 受付済み（再送）
+        if position > index or index >= len(quiz_rows):
+            break     # 飛ばされた問題がある／全問回答済み
+        q = _quiz_question(vocab, quiz_rows[position], quiz_type, global_quiz_direction)
+        user_answer = str(item.get('answer', '')).strip()
+        correct = _record_quiz_answer(q, user_answer, vocab)
+        results.append({
+            'position': position,
+            'word_id': q['word_id'],
+            'direction': q['direction'],
+            'correct': correct,
+            'english': q['english'],
+            'japanese': q['japanese'],
+            'user_answer': user_answer,
+        })
+    if results:
+        record_answers(vocab, session.get('vocab_deck') or selected_deck(),
+                           [(r['word_id'], r['direction'], r['correct']) for r in results])
+        db.session.commit()
+
+    response = {**_api_progress(quiz_rows), 'results': results}
+    if isinstance(prefetch, dict):
+        response['questions'] = _api_questions(vocab, quiz_rows, quiz_type, max(prefetch_start, 0), prefetch_count)
+    return jsonify(response)
+
+# --- オフライン学習 ---------------------------------------------------------------
+# 範囲ごとの単語をまとめてダウンロードしておき、通信なしで解けるようにする。
+# 回答は端末にためておき、つながったときに /api/offline/sync でまとめて取り込む。
+# 回答には端末で発行した ID を付けてもらい、同じ回答を何度送っても1回分しか数えない。
+OFFLINE_MAX_PACK_WORDS = 200
+OFFLINE_MAX_SYNC = 500
+
+
+@app.route("/offline")
+@login_required
+def offline():
+    return render_template("offline.html", current_deck=selected_deck())
+
+
+@app.route("/sw.js")
+def service_worker():
+    # スコープをサイト全体にするため、ルート直下から配信する
+    response = send_from_directory(app.static_folder, "sw.js", mimetype="application/javascript")
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route("/api/offline/pack")
+@login_required
+def api_offline_pack():
+    """範囲の単語をまとめて返す: ?mode=detailed|rough&dir=ej|je&start=1&end=50"""
+    mode = request.args.get('mode', 'detailed')
+    direction = request.args.get('dir', session.get('quiz_direction', 'ej'))
+    start = request.args.get('start', default=1, type=int)
+    end = request.args.get('end', default=start + 49, type=int)
+    if mode not in ('detailed', 'rough') or direction not in ('ej', 'je'):
+        return jsonify({'error': '無効なパラメータです。'}), 400
+    end = min(end, start + OFFLINE_MAX_PACK_WORDS - 1)
+
+    deck = selected_deck()
+    vocab = current_vocab()
+    if mode == 'detailed' and (start, end) not in vocab.ranges:
+        # 詳細学習の間違いは範囲ごとに持つので、単語帳の範囲どおりのものだけ（同期のときも同じ範囲で確かめる）
+        return jsonify({'error': '無効な範囲です。'}), 400
+    words = []
+    for word_id in vocab.ids_in_range(start, end):
+        english, japanese = vocab.word(word_id)
+        # [ID, 英語, 日本語, 日本語の言い換え]（容量を抑えるため配列で持つ）
+        words.append([word_id, english, japanese, split_variants(japanese)])
+    if not words:
+        return jsonify({'error': '選択された範囲に単語が存在しません'}), 404
+    return jsonify({
+        'deck': deck,
+        'version': vocab.version,
+        'mode': mode,
+        'direction': direction,
+        'start': start,
+        'end': end,
+        'range_key': deck_range_key(start, end, deck),
+        'words': words,
+    })
+
+
+def _grade_offline_answer(item, vocab):
+    """端末で解いた回答をサーバー側でも採点し直す（間違いリストに入れる内容を確定する）"""
+    english, japanese = vocab.word(item['word_id'])
+    correct_answer = english if item['dir'] == 'je' else japanese
+    answer = item['answer']
+    if item['mode'] == 'rough':
+        # 4択は選んだ選択肢の文字列がそのまま正解と一致するか
+        correct = answer == correct_answer
+    elif item['dir'] == 'je':
+        correct = answer.lower() == correct_answer.lower()
+    else:
+        correct = is_answer_similar(answer, correct_answer, embeddings=vocab.embeddings)
+    return correct, english, japanese
+
+
+def _parse_offline_answer(raw):
+    if not isinstance(raw, dict):
+        return None
+    client_id = str(raw.get('id') or '').strip()
+    word_id = raw.get('word_id')
+    if not client_id or len(client_id) > 64 or not isinstance(word_id, int) or isinstance(word_id, bool):
+        return None
+    if raw.get('dir') not in ('ej', 'je') or raw.get('mode') not in ('detailed', 'rough'):
+        return None
+    answered_at = datetime.utcnow()
+    if raw.get('answered_at'):
+        try:
+            # 端末の時計が未来にずれていても今より後にはしない
+            answered_at = min(datetime.utcfromtimestamp(float(raw['answered_at']) / 1000), answered_at)
+        except (TypeError, ValueError, OverflowError, OSError):
+            pass
+    return {
+        'id': client_id,
+        'word_id': word_id,
+        'dir': raw['dir'],
+        'mode': raw['mode'],
+        'range_key': raw.get('range_key') if isinstance(raw.get('range_key'), str) else '',
+        'answer': str(raw.get('answer') or '').strip(),
+        'answered_at': answered_at,
+    }
+
+
+@app.route("/api/offline/sync", methods=["POST"])
+@login_required
+def api_offline_sync():
+    """オフラインでためた回答の取り込み: {"deck": ..., "version": ..., "answers": [{"id", "word_id", "dir", "mode", "range_key", "answer", "answered_at"}]}
+
+    QuizAttempt の追加は1トランザクションで行い、取り込めたものだけを間違いリストに反映する。
+    既に取り込み済みの ID は duplicates、壊れていて取り込めないものは rejected として返す
+    （端末はいずれも送信済みとして消してよい）。"""
+    payload = request.get_json(silent=True)
+    if payload is None:
+        payload = {}
+    if not isinstance(payload, dict):
+        return jsonify({'error': '無効なリクエストです。'}), 400
+    deck = payload.get('deck')
+    version = payload.get('version')
+    answers_in = payload.get('answers') or []
+    if any(value is not None and not isinstance(value, str) for value in (deck, version)) or not isinstance(answers_in, list):
+        return jsonify({'error': '無効なリクエストです。'}), 400
+    deck = deck or selected_deck()
+    if not decks.exists(deck):
+        deck = DEFAULT_DECK
+    vocab = deck_registry(deck).get(version)
+
+    answers = []
+    rejected = []
+    seen = set()
+    for raw in answers_in[:OFFLINE_MAX_SYNC]:
+        item = _parse_offline_answer(raw)
+        if item is not None:
+            word_range = vocab.range_of(item['word_id'])
+            if word_range is None:
+                item = None  # 今の単語帳に無い単語ID（採点も記録もしない）
+            elif item['mode'] == 'detailed' and item['range_key'] != deck_range_key(*word_range, deck):
+                # 範囲のキーは、このデッキで単語が実際に属する範囲のものだけ受け付ける
+                # （ほかのデッキの範囲・長すぎるキーなどはここで落ちる）
+                item = None
+        if item is None:
+            # 壊れた回答は取り込まない（端末側で捨ててもらう）
+            if isinstance(raw, dict) and raw.get('id'):
+                rejected.append(str(raw['id']))
+            continue
+        if item['id'] not in seen:
+            seen.add(item['id'])
+            answers.append(item)
+
+    for _ in range(2):  # 同じ回答が別リクエストで同時に届いたときは1回だけやり直す
+        existing = set()
+        if answers:
+            existing = {
+                row.client_answer_id for row in QuizAttempt.query
+                .with_entities(QuizAttempt.client_answer_id)
+                .filter(QuizAttempt.user_id == current_user.id,
+                        QuizAttempt.client_answer_id.in_([a['id'] for a in answers]))
+            }
+        new_answers = [a for a in answers if a['id'] not in existing]
+        results = []
+        for item in new_answers:
+            correct, english, japanese = _grade_offline_answer(item, vocab)
+            results.append((item, correct, english, japanese))
+            db.session.add(QuizAttempt(user_id=current_user.id, timestamp=item['answered_at'], client_answer_id=item['id']))
+        record_answers(vocab, deck, [(item['word_id'], item['dir'], correct) for item, correct, _, _ in results])
+        # 間違いも同じトランザクションで記録する（回答が重複なら間違いも入らない）
+        add_mistakes([
+            {'word_id': item['word_id'], 'direction': item['dir'],
+             'source': 'rough' if item['mode'] == 'rough' else 'detailed',
+             'range_key': '' if item['mode'] == 'rough' else item['range_key']}
+            for item, correct, _, _ in results if not correct
+        ])
+        try:
+            db.session.commit()
+            break
+        except IntegrityError:
+            db.session.rollback()
+    else:
+        return jsonify({'error': '同期に失敗しました。時間をおいて再度お試しください。'}), 409
+
+    # ざっくり学習の途中結果（セッション）にも反映する
+    rough_mistakes = session.get('rough_mistakes', {'rough_je': [], 'rough_ej': []})
+    for item, correct, _, _ in results:
+        if correct or item['mode'] != 'rough':
+            continue
+        entry = {'idx': item['word_id'], 'dir': item['dir']}
+        key = f"rough_{item['dir']}"
+        rough_mistakes.setdefault(key, [])
+        if entry not in rough_mistakes[key]:
+            rough_mistakes[key].append(entry)
+    session['rough_mistakes'] = rough_mistakes
+
+    return jsonify({
+        'accepted': [item['id'] for item, _, _, _ in results],
+        'duplicates': sorted(existing),
+        'rejected': rejected,
+        'results': [
+            {'id': item['id'], 'correct': correct, 'english': english, 'japanese': japanese}
+            for item, correct, english, japanese in results
+        ],
+    })
+
 @app.route("/next_question")
 @login_required
 def next_question():
@@ -578,6 +1715,8 @@ def next_question():
     session.pop('correct_english_for_feedback', None)
     session.pop('correct_japanese_for_feedback', None)
 
+    if not keep_quiz_vocab():
+        return redirect(url_for("menu"))
     quiz_rows = get_quiz_rows_from_session_params(
         session.get('quiz_seed'),
         session.get('quiz_rows')
@@ -601,15 +1740,14 @@ def result():
     
     # ▼▼▼ ここからが修正・追加部分 ▼▼▼
     # セッションをクリアする前に、このクイズの間違いリストを取得
-    current_mistakes = session.get('current_quiz_mistakes_indices', [])
-    unique_indices = {mistake['idx'] for mistake in current_mistakes}
+    current_mistakes = mistake_keys.decode(session.get('current_quiz_mistakes_indices'))
+    unique_indices = mistake_keys.word_ids(current_mistakes)
     
+    vocab = quiz_vocab()
     mistake_words = []
-    for idx in sorted(list(unique_indices)):
-        mistake_words.append({
-            'english': full_df.at[idx, 'English'],
-            'japanese': full_df.at[idx, 'Japanese']
-        })
+    for word_id in sorted(unique_indices, key=vocab.position):
+        english, japanese = vocab.word(word_id)
+        mistake_words.append({'english': english, 'japanese': japanese})
     # ▲▲▲ ここまで ▲▲▲
 
     # クイズ関連のセッション変数をクリア
@@ -625,15 +1763,14 @@ def result():
 @app.route("/current_result")
 @login_required
 def current_result():
-    active_mistakes = session.get('current_quiz_mistakes_indices', [])
-    unique_indices = {mistake['idx'] for mistake in active_mistakes}
+    active_mistakes = mistake_keys.decode(session.get('current_quiz_mistakes_indices'))
+    unique_indices = mistake_keys.word_ids(active_mistakes)
     
+    vocab = quiz_vocab()
     mistake_words = []
-    for idx in sorted(list(unique_indices)):
-        mistake_words.append({
-            'english': full_df.at[idx, 'English'],
-            'japanese': full_df.at[idx, 'Japanese']
-        })
+    for word_id in sorted(unique_indices, key=vocab.position):
+        english, japanese = vocab.word(word_id)
+        mistake_words.append({'english': english, 'japanese': japanese})
     return render_template(
         "current_result.html",
         score=session.get("score", 0),
@@ -660,7 +1797,9 @@ def exit_quiz_to_menu():
         'score': session.get('score', 0),
         'seed': session.get('quiz_seed'),
         'rows': session.get('quiz_rows'),
-        'session_mistakes': session_mistakes_to_save
+        'session_mistakes': session_mistakes_to_save,
+        'vocab_version': session.get('vocab_version'),
+        'deck': session.get('vocab_deck')
     }
     
     quiz_direction = session.get('quiz_direction', 'ej')
@@ -674,9 +1813,11 @@ def exit_quiz_to_menu():
         current_range = session.get('detailed_quiz_range')
         if current_range:
             detailed_saves = direction_saves.setdefault('detailed', {})
-            range_key = f"{current_range[0]}-{current_range[1]}"
+            range_key = deck_range_key(current_range[0], current_range[1], session.get('vocab_deck'))
             detailed_saves[range_key] = state_to_save
             #flash(f"詳細クイズ({quiz_direction}) (範囲: {range_key}) の進行状況を保存しました。", "info")
+    elif current_quiz_type == 'adaptive':
+        direction_saves['adaptive'] = state_to_save
     elif current_quiz_type == 'retry':
         direction_saves['review'] = state_to_save
         #flash(f"復習クイズ({quiz_direction})の進行状況を保存しました。", "info")
@@ -685,11 +1826,11 @@ def exit_quiz_to_menu():
     _clear_current_quiz_session_vars()
     return redirect(url_for("menu"))
 
-@app.route("/remove_single_mistake/<int:row_index>")
+@app.route("/remove_single_mistake/<int:word_id>")
 @login_required
-def remove_single_mistake(row_index):
-    remove_mistake_from_all_lists(row_index)
-    word_to_remove = full_df.at[row_index, "English"]
+def remove_single_mistake(word_id):
+    remove_mistakes_from_all_lists([word_id])
+    word_to_remove, _ = quiz_vocab().word(word_id)
     flash(f"「{word_to_remove}」を復習リストから完全に削除しました。", "info")
     return redirect(url_for('next_question'))
 
@@ -699,8 +1840,8 @@ def start_fresh_quiz_from_anywhere():
     """全ての進行状況と間違いリストをリセットする"""
     _clear_current_quiz_session_vars()
     session.pop('saved_states', None)
-    session.pop('random_quiz_mistakes', None)
-    session.pop('detailed_quiz_mistakes', None)
+    Mistake.query.filter(Mistake.user_id == current_user.id, Mistake.source.in_(QUIZ_MISTAKE_SOURCES)).delete(synchronize_session=False)
+    db.session.commit()
     flash("全ての進行状況と間違いリストをリセットしました。", "info")
     return redirect(url_for('menu'))
 
@@ -732,7 +1873,11 @@ def admin_page():
         elif User.query.filter_by(username=username).first():
             flash(f"ユーザー名「{username}」は既に使用されています。", "danger")
         else:
-            hashed_pass = generate_password_hash(password, method="pbkdf2:sha256")
+            try:
+                hashed_pass = password_hasher.hash(password)
+            except HashPoolBusy:
+                flash("ログインが混み合っているため登録できませんでした。少し待ってから再度お試しください。", "warning")
+                return redirect(url_for('admin_page'))
             new_user = User(username=username, password=hashed_pass, nickname=nickname, is_admin=is_admin)
             db.session.add(new_user)
             db.session.commit()
@@ -771,8 +1916,133 @@ def admin_page():
     return render_template("admin.html",
         user_stats=user_stats,
         contact_msgs=contact_msgs,
-        all_users=all_users
+        all_users=all_users,
+        loaded_decks=decks.loaded(),
+        available_decks=decks.available(),
+        deck_memory=decks.estimate_nbytes(),
+        deck_memory_budget=decks.memory_budget,
+        suggestion_stats=suggestion_metrics(),
+        import_jobs=UserImportJob.query.order_by(UserImportJob.id.desc()).limit(5).all()
     )
+
+# CSV からのユーザー一括登録で、まとめて INSERT する行数
+USER_IMPORT_BATCH_SIZE = int(os.environ.get("USER_IMPORT_BATCH_SIZE", "500"))
+# 管理ページからの一括登録が、この時間（分）進まなければ止まったとみなす（1回の INSERT 分のハッシュ化より十分長く）
+USER_IMPORT_STALL_MINUTES = int(os.environ.get("USER_IMPORT_STALL_MINUTES", "15"))
+
+
+def exclude_taken_usernames(rows):
+    """既に使われているユーザー名の行を除く（username IN (...) の1回の問い合わせ）。(残りの行, エラー) を返す"""
+    taken = set()
+    if rows:
+        taken = {u for (u,) in db.session.query(User.username).filter(User.username.in_([row.username for row in rows]))}
+    errors = [(row.line, row.username, "既に使用されているユーザー名です") for row in rows if row.username in taken]
+    return [row for row in rows if row.username not in taken], errors
+
+
+def _provision_users_in_background(job_id, rows, batch_size=USER_IMPORT_BATCH_SIZE):
+    # ハッシュ化は1人 0.1 秒以上かかるので、リクエストの中ではやらない（数百人だとワーカーのタイムアウトを超える）
+    # batch_size 人ごとに、登録した人数とエラーを UserImportJob に書いて管理ページに出す
+    def run():
+        with app.app_context():
+            try:
+                for start in range(0, len(rows), batch_size):
+                    created, errors = provision_users(rows[start:start + batch_size], batch_size=batch_size)
+                    job = db.session.get(UserImportJob, job_id)
+                    job.created += created
+                    job.add_errors(errors)
+                    job.updated_at = datetime.utcnow()
+                    db.session.commit()
+                job = db.session.get(UserImportJob, job_id)
+                job.status = 'done'
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ エラー: ユーザーの一括登録に失敗しました: {e}")
+                job = db.session.get(UserImportJob, job_id)
+                job.status = 'failed'
+                job.add_errors([(0, '', f"登録を続けられませんでした: {e}")])
+            job.updated_at = datetime.utcnow()
+            db.session.commit()
+
+    threading.Thread(target=run, name=f"import-users-{job_id}", daemon=True).start()
+
+
+def provision_users(rows, hasher=None, batch_size=USER_IMPORT_BATCH_SIZE):
+    """user_csv.parse() の行をまとめて登録する。(登録した人数, [(行番号, ユーザー名, エラー内容), ...]) を返す
+
+    既に使われているユーザー名は username IN (...) の1回の問い合わせで確かめ、
+    パスワードはプロセスプールで並列にハッシュ化してから、batch_size 行ずつ INSERT する。"""
+    hasher = hasher or password_hasher
+    rows, errors = exclude_taken_usernames(rows)
+
+    hashes = hasher.hash_many(row.password for row in rows)
+    created = 0
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        try:
+            db.session.execute(db.insert(User), [
+                {'username': row.username, 'nickname': row.nickname, 'password': pwhash, 'is_admin': row.is_admin}
+                for row, pwhash in zip(batch, hashes[start:start + batch_size])
+            ])
+            db.session.commit()
+            created += len(batch)
+        except IntegrityError:
+            # 確認してから INSERT するまでの間に、別の画面で同じユーザー名が登録された
+            db.session.rollback()
+            errors.extend((row.line, row.username, "登録できませんでした（ユーザー名が重複しています）") for row in batch)
+    errors.sort()
+    return created, errors
+
+
+def suggestion_metrics():
+    """予測変換のキャッシュと回数制限の状況（このワーカーの分）"""
+    return {**suggestion_cache.stats(), 'rate_limited': suggestion_limiter.limited, 'pid': os.getpid()}
+
+@app.route("/admin/import_users", methods=["POST"])
+@login_required
+@admin_required
+def import_users():
+    upload = request.files.get("csv_file")
+    if not upload or not upload.filename:
+        flash("CSV ファイルを選択してください。", "warning")
+        return redirect(url_for('admin_page'))
+    try:
+        rows, errors = user_csv.parse(user_csv.decode(upload.read()))
+    except (UnicodeDecodeError, csv.Error) as e:
+        flash(f"CSV を読み込めませんでした: {e}", "danger")
+        return redirect(url_for('admin_page'))
+    rows, taken_errors = exclude_taken_usernames(rows)
+    # 結果（エラーの行を含む）は UserImportJob に残し、管理ページの「一括登録の結果」に出す
+    job = UserImportJob(admin_id=current_user.id, filename=upload.filename[:200], total=len(rows),
+                        status='running' if rows else 'done')
+    job.add_errors(errors + taken_errors)
+    db.session.add(job)
+    db.session.commit()
+    if rows:
+        # パスワードのハッシュ化と登録はバックグラウンドで行う（ログインのハッシュ化と交互に進む）
+        _provision_users_in_background(job.id, rows)
+        flash(f"{len(rows)} 人のユーザーの登録を開始しました。進み具合とエラーは「一括登録の結果」に出ます。", "success")
+    else:
+        flash("登録できるユーザーがいませんでした。エラーは「一括登録の結果」を見てください。", "info")
+    return redirect(url_for('admin_page'))
+
+@app.route("/admin/metrics/suggestions")
+@login_required
+@admin_required
+def admin_suggestion_metrics():
+    return jsonify(suggestion_metrics())
+
+@app.route("/admin/reload_vocabulary", methods=["POST"])
+@login_required
+@admin_required
+def reload_vocabulary():
+    # 読み込みはバックグラウンドで行い、終わったら参照を差し替える（進行中のクイズはそのまま）
+    started = [name for name, registry in decks.loaded() if registry.reload_async(force=True)]
+    if started:
+        flash(f"単語帳の再読み込みを開始しました（{', '.join(started)}）。", "info")
+    else:
+        flash("単語帳は既に再読み込み中です。", "warning")
+    return redirect(url_for('admin_page'))
 # app.py
 
 @app.route("/admin/delete_user/<int:user_id>", methods=["POST"])
@@ -785,33 +2055,121 @@ def delete_user(user_id):
         return redirect(url_for('admin_page'))
 
     user_to_delete = User.query.get_or_404(user_id)
+    nickname = user_to_delete.nickname
+    attempts = QuizAttempt.query.filter_by(user_id=user_id).count()
+    if attempts <= USER_DELETE_CHUNK_SIZE:
+        delete_user_data(user_id)
+        flash(f"ユーザー「{nickname}」を関連データと共に削除しました。", "success")
+    else:
+        # 履歴が多いときは、先にログインできないようにしてから裏で少しずつ消す
+        user_to_delete.password = ''
+        db.session.commit()
+        user_cache.invalidate(user_id)
+        _delete_user_in_background(user_id)
+        flash(f"ユーザー「{nickname}」の削除を開始しました（クイズ履歴 {attempts} 件を順に削除します）。", "info")
+    return redirect(url_for('admin_page'))
 
-    # --- 関連データを先に削除 ---
-    ContactMessage.query.filter_by(user_id=user_id).delete() # 👈 お問い合わせ履歴を削除
-    QuizAttempt.query.filter_by(user_id=user_id).delete()    # 👈 クイズ履歴を削除
-    
-    # ユーザー本体を削除
-    db.session.delete(user_to_delete)
+
+# ユーザー削除・履歴のまとめで、1回のトランザクションで消す quiz_attempts の行数
+USER_DELETE_CHUNK_SIZE = int(os.environ.get("USER_DELETE_CHUNK_SIZE", "5000"))
+
+
+def delete_user_data(user_id, chunk_size=USER_DELETE_CHUNK_SIZE):
+    """ユーザーを削除する
+
+    クイズ履歴は chunk_size 件ずつ別のトランザクションで消し（quiz_attempts を長くロックしない）、
+    お問い合わせ・学習状況・間違いなどの残りは users の DELETE から ON DELETE CASCADE で消える。"""
+    while True:
+        ids = [i for (i,) in db.session.query(QuizAttempt.id).filter(QuizAttempt.user_id == user_id).limit(chunk_size)]
+        if not ids:
+            break
+        QuizAttempt.query.filter(QuizAttempt.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+    User.query.filter_by(id=user_id).delete(synchronize_session=False)
     db.session.commit()
+    user_cache.invalidate(user_id)
 
-    flash(f"ユーザー「{user_to_delete.nickname}」を関連データと共に削除しました。", "success")
-    return redirect(url_for('admin_page'))
+
+def _delete_user_in_background(user_id):
+    # 途中でワーカーが止まっても、ユーザーはパスワード無しで残るだけなので、もう一度削除すれば続きから消える
+    def run():
+        with app.app_context():
+            try:
+                delete_user_data(user_id)
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ エラー: ユーザー {user_id} の削除に失敗しました: {e}")
+    threading.Thread(target=run, name=f"delete-user-{user_id}", daemon=True).start()
+
+
+def _add_daily_attempts(counts):
+    """{(user_id, 日付): 件数} を quiz_attempt_daily に足し込む（commit は呼び出し側）"""
+    rows = [{'user_id': u, 'day': d, 'attempts': n} for (u, d), n in counts.items()]
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(QuizAttemptDaily)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['user_id', 'day'],
+            set_={'attempts': QuizAttemptDaily.attempts + stmt.excluded.attempts},
+        ), rows)
+        return
+    # それ以外の DB: 既存の行は足し込み、無い行は追加する
+    existing = {
+        (row.user_id, row.day): row
+        for row in QuizAttemptDaily.query.filter(QuizAttemptDaily.user_id.in_({u for u, _ in counts}))
+    }
+    for (u, d), n in counts.items():
+        if (u, d) in existing:
+            existing[(u, d)].attempts += n
+        else:
+            db.session.add(QuizAttemptDaily(user_id=u, day=d, attempts=n))
+
+
+def archive_attempts(before, chunk_size=USER_DELETE_CHUNK_SIZE):
+    """before より前の quiz_attempts を、ユーザー・日ごとの件数（quiz_attempt_daily）にまとめて消す
+
+    chunk_size 件ずつ「まとめて足し込む → 消す」を1トランザクションで行う。移した件数を返す。"""
+    moved = 0
+    while True:
+        rows = (
+            db.session.query(QuizAttempt.id, QuizAttempt.user_id, QuizAttempt.timestamp)
+            .filter(QuizAttempt.timestamp < before)
+            .order_by(QuizAttempt.id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not rows:
+            break
+        _add_daily_attempts(Counter((user_id, timestamp.date()) for _, user_id, timestamp in rows))
+        QuizAttempt.query.filter(QuizAttempt.id.in_([row.id for row in rows])).delete(synchronize_session=False)
+        db.session.commit()
+        moved += len(rows)
+    return moved
 
 @app.route("/search", methods=["GET", "POST"])
 @login_required
 def search_word():
     search_results = []
-    query = ""
-    if request.method == "POST":
-        query = request.form.get("query", "").strip()
-        if query:
-            # 英単語と日本語訳の両方から部分一致で検索
-            results_df = full_df[
-                full_df['English'].str.contains(query, case=False, na=False) |
-                full_df['Japanese'].str.contains(query, case=False, na=False)
-            ]
-            search_results = results_df.to_dict('records')
-    return render_template("search.html", search_results=search_results, query=query)
+    did_you_mean = []
+    # 「もしかして」のリンクは GET の ?q= で来る
+    query = (request.form.get("query", "") if request.method == "POST" else request.args.get("q", "")).strip()
+    if query:
+        # 英単語と日本語訳の両方から部分一致で検索（結果の行は描画しながら作る）
+        vocab = current_vocab()
+        positions = vocab.search_positions(query)
+        search_results = LazyRows(
+            positions,
+            lambda pos: {'English': vocab.english[pos], 'Japanese': vocab.japanese[pos]},
+        )
+        if not positions:
+            did_you_mean = vocab.did_you_mean(query)
+    return stream_page(app, "search.html", search_results=search_results, query=query, did_you_mean=did_you_mean)
 
 @app.route("/progress")
 @login_required
@@ -820,7 +2178,8 @@ def progress():
     seven_days_ago = datetime.utcnow() - timedelta(days=7)
     
     attempts_by_day = db.session.query(
-        func.date(QuizAttempt.timestamp).label('date'),
+        # SQLite の date() は文字列を返すので、型を Date にして両方で date オブジェクトとして受け取る
+        func.date(QuizAttempt.timestamp, type_=db.Date).label('date'),
         func.count(QuizAttempt.id).label('count')
     ).filter(
         QuizAttempt.user_id == current_user.id,
@@ -846,48 +2205,56 @@ def progress():
 
     return render_template("progress.html", labels=labels, data=data)
 
+def _mistake_row(vocab, word_id):
+    english, japanese = vocab.word(word_id)
+    return {'id': word_id, 'english': english, 'japanese': japanese}
+
+
+def _mistake_page(template_name, sources):
+    """間違い管理ページ（?source=&dir=&after= で絞り込み・キーセットでページ送り）を流しながら描く"""
+    args = mistake_page_args(sources)
+    word_ids, next_after = mistake_word_page(args['sources'], args['direction'], args['after'], MISTAKES_PAGE_SIZE)
+    vocab = current_vocab()
+    return stream_page(
+        app, template_name,
+        mistake_words=LazyRows(word_ids, lambda word_id: _mistake_row(vocab, word_id)),
+        filters=args['filters'], sources=sources,
+        next_after=next_after, is_first_page=args['after'] is None,
+    )
+
+
+def _mistake_filters_redirect(endpoint):
+    """削除後は同じ絞り込みのまま1ページ目に戻る"""
+    return redirect(url_for(endpoint, **{k: v for k, v in request.args.items() if k in ('source', 'dir') and v}))
+
+
 @app.route("/manage_mistakes", methods=["GET", "POST"])
 @login_required
 def manage_mistakes():
     if request.method == "POST":
-        indices_to_delete = [int(i) for i in request.form.getlist('delete_indices')]
+        indices_to_delete = {int(i) for i in request.form.getlist('delete_indices')}
         if not indices_to_delete:
             flash("削除する単語が選択されていません。", "warning")
-            return redirect(url_for('manage_mistakes'))
-        for index_to_delete in indices_to_delete:
-            remove_mistake_from_all_lists(index_to_delete)
+            return _mistake_filters_redirect('manage_mistakes')
+        remove_mistakes_from_all_lists(indices_to_delete)
         flash(f"{len(indices_to_delete)}件の単語をリストから完全に削除しました。", "success")
-        return redirect(url_for('manage_mistakes'))
-
-    random_mistakes = session.get("random_quiz_mistakes", [])
-    detailed_mistakes_dict = session.get("detailed_quiz_mistakes", {})
-    all_mistake_indices = set()
-    for m in random_mistakes: all_mistake_indices.add(m['idx'])
-    if detailed_mistakes_dict:
-        for key in detailed_mistakes_dict:
-            for m in detailed_mistakes_dict[key]:
-                all_mistake_indices.add(m['idx'])
-    
-    mistake_words = []
-    for idx in sorted(list(all_mistake_indices)):
-        mistake_words.append({
-            'index': idx,
-            'english': full_df.at[idx, 'English'],
-            'japanese': full_df.at[idx, 'Japanese']
-        })
-    return render_template("manage_mistakes.html", mistake_words=mistake_words)
+        return _mistake_filters_redirect('manage_mistakes')
+
+    return _mistake_page("manage_mistakes.html", QUIZ_MISTAKE_SOURCES)
 
 @app.route("/mypage", methods=["GET", "POST"])
 @login_required
 def mypage():
     if request.method == "POST":
         action = request.form.get("action")
+        # current_user はキャッシュの軽いレコードなので、書き換えには ORM で読み直したものを使う
+        user = db.session.get(User, current_user.id)
 
         # ニックネームの変更
         if action == "update_nickname":
             new_nickname = request.form.get("nickname")
             if new_nickname:
-                current_user.nickname = new_nickname
+                user.nickname = new_nickname
                 db.session.commit()
                 flash("ニックネームを更新しました。", "success")
             else:
@@ -901,7 +2268,7 @@ def mypage():
                 if existing_user:
                     flash("そのユーザー名は既に使用されています。", "danger")
                 else:
-                    current_user.username = new_username
+                    user.username = new_username
                     db.session.commit()
                     flash("ユーザー名を更新しました。", "success")
             else:
@@ -913,17 +2280,21 @@ def mypage():
             new_password = request.form.get("new_password")
             confirm_password = request.form.get("confirm_password")
 
-            if not check_password_hash(current_user.password, current_password):
-                flash("現在のパスワードが正しくありません。", "danger")
-            elif new_password != confirm_password:
-                flash("新しいパスワードが一致しません。", "danger")
-            elif not new_password:
-                flash("新しいパスワードを入力してください。", "warning")
-            else:
-                current_user.password = generate_password_hash(new_password, method="pbkdf2:sha256")
-                db.session.commit()
-                flash("パスワードを更新しました。", "success")
-        
+            try:
+                if not password_hasher.verify(user.password, current_password):
+                    flash("現在のパスワードが正しくありません。", "danger")
+                elif new_password != confirm_password:
+                    flash("新しいパスワードが一致しません。", "danger")
+                elif not new_password:
+                    flash("新しいパスワードを入力してください。", "warning")
+                else:
+                    user.password = password_hasher.hash(new_password)
+                    db.session.commit()
+                    flash("パスワードを更新しました。", "success")
+            except HashPoolBusy:
+                flash("ログインが混み合っているため変更できませんでした。少し待ってから再度お試しください。", "warning")
+
+        user_cache.invalidate(user.id)
         return redirect(url_for('mypage'))
 
     return render_template("mypage.html")
@@ -931,35 +2302,17 @@ def mypage():
 @app.route("/api/search_suggestions")
 @login_required
 def search_suggestions():
-    query = request.args.get('q', '').strip()
-    
-    # queryが空の場合は、何も返さずに処理を終了
-    if not query:
-        return jsonify([])
-
-    # 英語と日本語の両方のカラムで前方一致する行を一度にフィルタリング（こちらの方が効率的）
-    condition = (
-        full_df['English'].str.startswith(query, na=False, case=False) | 
-        full_df['Japanese'].str.startswith(query, na=False, case=False)
+    # 英語・日本語の前方一致（ソート済み索引の二分探索）を、共通のキャッシュ越しに最大10件まで引く
+    status, results, headers = lookup_suggestions(
+        current_user.id, current_vocab(), request.args.get('q', ''), request.if_none_match
     )
-    matches_df = full_df[condition]
-
-    # マッチした行から英語と日本語の候補を抽出し、重複を除外
-    eng_suggestions = matches_df['English'].dropna()
-    jpn_suggestions = matches_df['Japanese'].dropna()
-    
-    # 結合して、重複を除外し、リストに変換
-    suggestions = pd.concat([eng_suggestions, jpn_suggestions]).unique().tolist()
-
-    # [修正1] 候補を最大10件に絞り込む（構文エラーの修正）
-    limited_suggestions = suggestions[:10]
-
-    # [修正2] 検索候補をJSON形式でフロントエンドに返す
-    return jsonify(limited_suggestions)
+    response = make_response('', 304) if status == 304 else make_response(jsonify(results), status)
+    response.headers.update(headers)
+    return response
 @app.route("/rough_menu")
 @login_required
 def rough_menu():
-    return render_template("rough_menu.html")
+    return render_if_modified(app, ('rough_menu', current_user.id), lambda: render_template("rough_menu.html"))
 
 
 @app.route("/start_rough_quiz/<direction>")
@@ -969,7 +2322,10 @@ def start_rough_quiz(direction):
         flash("無効な出題方向です。", "danger")
         return redirect(url_for("menu"))
     
-    indices = random.sample(ALL_INDICES, min(10, len(ALL_INDICES)))
+    vocab = current_vocab()
+    indices = random.sample(vocab.all_word_ids, min(10, len(vocab.all_word_ids)))
+    session['vocab_deck'] = selected_deck()
+    session['vocab_version'] = vocab.version
     session['quiz_direction'] = direction
     session['quiz_rows'] = indices
     session['quiz_type'] = f"rough_{direction}"
@@ -982,7 +2338,7 @@ def start_rough_quiz(direction):
 @login_required
 def start_rough_review():
     # 復習対象となるユニークな単語リストを取得する（このロジックは共通）
-    all_mistakes = session.get('global_rough_mistakes', [])
+    all_mistakes = mistake_entries(ROUGH_MISTAKE_SOURCES)
     temp_mistakes = session.get('rough_mistakes', {})
     for direction in ['rough_je', 'rough_ej']:
         all_mistakes.extend(temp_mistakes.get(direction, []))
@@ -1002,6 +2358,8 @@ def start_rough_review():
             return redirect(url_for("rough_menu"))
             
         random.shuffle(unique_mistakes)
+        session['vocab_deck'] = selected_deck()
+        session['vocab_version'] = current_vocab().version
         session['quiz_type'] = 'rough_review'
         session['quiz_rows'] = unique_mistakes
         session['index'] = 0
@@ -1010,12 +2368,11 @@ def start_rough_review():
 
     # ページを最初に表示する時 (GET)
     # 表示用に単語情報を整形
+    vocab = current_vocab()
     mistake_words_for_display = []
     for m in unique_mistakes:
-        mistake_words_for_display.append({
-            'english': full_df.at[m['idx'], 'English'],
-            'japanese': full_df.at[m['idx'], 'Japanese']
-        })
+        english, japanese = vocab.word(m['idx'])
+        mistake_words_for_display.append({'english': english, 'japanese': japanese})
     
     # 復習の確認・開始ページを表示
     return render_template('prepare_rough_review.html', mistake_words=mistake_words_for_display)
@@ -1038,21 +2395,21 @@ def rough_quiz():
     quiz_type = session.get("quiz_type")
     if quiz_type == "rough_review":
         item = quiz_rows[idx]
-        row_index = item['idx']
+        word_id = item['idx']
         direction = item['dir']
     else:
-        row_index = quiz_rows[idx]
+        word_id = quiz_rows[idx]
         direction = session.get("quiz_direction")
 
-    english = full_df.at[row_index, "English"]
-    japanese = full_df.at[row_index, "Japanese"]
+    vocab = quiz_vocab()
+    english, japanese = vocab.word(word_id)
     question, answer = (japanese, english) if direction == 'je' else (english, japanese)
 
     # 4択の選択肢を生成
     options = [answer]
     while len(options) < 4:
-        candidate = full_df.sample(1).iloc[0]
-        opt = candidate["English"] if direction == 'je' else candidate["Japanese"]
+        pos = random.randrange(len(vocab))
+        opt = vocab.english[pos] if direction == 'je' else vocab.japanese[pos]
         if opt != answer and opt not in options:
             options.append(opt)
     random.shuffle(options)
@@ -1077,7 +2434,7 @@ def rough_quiz():
         ## ★★★ ここからインデントを修正 ★★★
         if not is_correct and quiz_type != "rough_review":
             # このifブロックの中に、間違い記録処理をすべてまとめる
-            entry = {'idx': row_index, 'dir': direction}
+            entry = {'idx': word_id, 'dir': direction}
 
             # 2a. 現在のクイズ用の一時リストに記録
             key = f"rough_{direction}"
@@ -1086,16 +2443,13 @@ def rough_quiz():
                 mistakes.append(entry)
                 session['rough_mistakes'][key] = mistakes
 
-            # 2b. 復習用の永続リストに記録 (正しくインデント)
-            if 'global_rough_mistakes' not in session:
-                session['global_rough_mistakes'] = []
-            global_mistakes = session.get('global_rough_mistakes', [])
-            if entry not in global_mistakes:
-                global_mistakes.append(entry)
-                session['global_rough_mistakes'] = global_mistakes
+            # 2b. 復習用の永続リスト（DB）に記録
+            add_mistakes([{'word_id': word_id, 'direction': direction, 'source': 'rough'}])
         
         # 3. 回答直後にインデックスを更新して進捗を保存
         session["index"] = idx + 1
+        record_answers(vocab, session.get('vocab_deck') or selected_deck(), [(word_id, direction, is_correct)])
+        db.session.commit()
         
         # フィードバック表示
         show_fb = True
@@ -1140,17 +2494,18 @@ def rough_range_selector(direction):
         flash("無効な出題方向です。", "danger")
         return redirect(url_for('menu'))
 
-    # 単語範囲の生成（例：1〜50、51〜100...）
-    total_words = len(full_df)
-    ranges = [(i + 1, min(i + 50, total_words)) for i in range(0, total_words, 50)]
+    # 単語範囲（例：1〜50、51〜100...）はスナップショットで作成済み
+    deck = selected_deck()
 
-    # 保存された進捗（存在する場合）
-    saved_rough_states = session.get('saved_rough_states', {}).get(direction, {})
+    # 保存された進捗（存在する場合）と範囲ごとの集計
+    saved_rough_states = states_for_deck(session.get('saved_rough_states', {}).get(direction, {}))
     return render_template(
         "rough_range_selector.html",
         direction=direction,
-        ranges=ranges,
-        saved_rough_states=saved_rough_states
+        ranges=current_vocab().ranges,
+        saved_rough_states=saved_rough_states,
+        range_stats=range_stats_for(deck, direction),
+        current_deck=deck
     )
 
 @app.route('/start_rough_quiz_with_range/<direction>/<int:start>/<int:end>')
@@ -1160,17 +2515,20 @@ def start_rough_quiz_with_range(direction, start, end):
         flash("無効な方向です", "danger")
         return redirect(url_for('menu'))
 
-    selected_df = full_df.iloc[start-1:end].copy()
+    vocab = current_vocab()
+    range_ids = vocab.ids_in_range(start, end)
 
-    if selected_df.empty:
+    if not range_ids:
         flash("選択された範囲に単語が存在しません", "warning")
         return redirect(url_for('menu'))
 
-    selected_rows = selected_df.sample(min(50, len(selected_df)), replace=False).reset_index()
+    selected_ids = random.sample(range_ids, min(50, len(range_ids)))
 
+    session['vocab_deck'] = selected_deck()
+    session['vocab_version'] = vocab.version
     session['quiz_type'] = 'rough'
     session['quiz_direction'] = direction
-    session['quiz_rows'] = list(selected_rows['index'])  # 重要: 元の full_df の index
+    session['quiz_rows'] = selected_ids  # 重要: 行番号ではなく単語ID
     session['index'] = 0  # ← 修正ポイント
     session['score'] = 0
     session['rough_mistakes'] = session.get('rough_mistakes', { 'rough_je': [], 'rough_ej': [] })
@@ -1195,13 +2553,14 @@ def rough_current_result():
         key = f"rough_{direction}"
         mistakes = session.get("rough_mistakes", {}).get(key, [])
 
+    vocab = quiz_vocab()
     return render_template(
         "rough_current_result.html",
         current_question_number=current_index + 1,
         total_questions=len(quiz_rows),
         score=score,
         mistake_words=[
-            {"english": full_df.at[m["idx"], "English"], "japanese": full_df.at[m["idx"], "Japanese"]}
+            dict(zip(("english", "japanese"), vocab.word(m["idx"])))
             for m in mistakes if isinstance(m, dict)
         ],
         direction_label="日本語 → 英語" if direction == "je" else "英語 → 日本語"
@@ -1224,15 +2583,17 @@ def rough_result():
         mistakes = session.get("rough_mistakes", {}).get(key, [])
 
     # 表示用に整形
+    vocab = quiz_vocab()
     mistake_words = []
     for m in mistakes:
         if isinstance(m, dict):
             idx = m["idx"]
         else:
             idx = m
+        english, japanese = vocab.word(idx)
         mistake_words.append({
-            "english": full_df.at[idx, "English"],
-            "japanese": full_df.at[idx, "Japanese"]
+            "english": english,
+            "japanese": japanese
         })
 
     return render_template(
@@ -1257,6 +2618,8 @@ def resume_rough_quiz():
     session['quiz_direction'] = saved['direction']
     session['quiz_type']      = saved['quiz_type']
     session['rough_mistakes'] = saved.get('mistakes', {'rough_je':[], 'rough_ej':[]})
+    session['vocab_version']  = saved.get('vocab_version')
+    session['vocab_deck']     = saved.get('deck')
 
     return redirect(url_for('rough_quiz'))
 
@@ -1275,11 +2638,13 @@ def exit_rough_quiz_to_menu():
         'score':     session.get('score', 0),
         'direction': session.get('quiz_direction'),
         'quiz_type': quiz_type,
-        'mistakes':  session.get('rough_mistakes', {'rough_je':[], 'rough_ej':[]})
+        'mistakes':  session.get('rough_mistakes', {'rough_je':[], 'rough_ej':[]}),
+        'vocab_version': session.get('vocab_version'),
+        'deck':      session.get('vocab_deck')
     }
 
     # クイズ進行用キーをクリア
-    for key in ['quiz_rows', 'index', 'score', 'quiz_direction', 'quiz_type', 'rough_mistakes']:
+    for key in ['quiz_rows', 'index', 'score', 'quiz_direction', 'quiz_type', 'rough_mistakes', 'vocab_version', 'vocab_deck']:
         session.pop(key, None)
 
     return redirect(url_for("menu"))
@@ -1296,7 +2661,7 @@ def exit_rough_quiz_to_range():
         return redirect(url_for('menu'))
 
     direction = session['quiz_direction']
-    range_key = f"{start}-{end}"
+    range_key = deck_range_key(start, end, session.get('vocab_deck'))
 
     saved = session.setdefault('saved_rough_states', {})
     dir_states = saved.setdefault(direction, {})
@@ -1304,12 +2669,14 @@ def exit_rough_quiz_to_range():
         'rows':    session.get('quiz_rows', []),
         'index':   session.get('index', 0),
         'score':   session.get('score', 0),
-        'mistakes': session.get('rough_mistakes', {'rough_je':[], 'rough_ej':[]})
+        'mistakes': session.get('rough_mistakes', {'rough_je':[], 'rough_ej':[]}),
+        'vocab_version': session.get('vocab_version'),
+        'deck':    session.get('vocab_deck')
     }
     session['saved_rough_states'] = saved
 
     # クイズのセッションデータをクリア
-    for k in ['quiz_rows','index','score','quiz_direction','quiz_type','rough_mistakes','rough_range']:
+    for k in ['quiz_rows','index','score','quiz_direction','quiz_type','rough_mistakes','rough_range','vocab_version','vocab_deck']:
         session.pop(k, None)
 
     return redirect(url_for('rough_range_selector', direction=direction))
@@ -1317,7 +2684,7 @@ def exit_rough_quiz_to_range():
 @app.route("/resume_rough_quiz_with_range/<direction>/<range_key>")
 @login_required
 def resume_rough_quiz_with_range(direction, range_key):
-    saved = session.get('saved_rough_states', {}).get(direction, {})
+    saved = states_for_deck(session.get('saved_rough_states', {}).get(direction, {}))
     state = saved.get(range_key)
     if not state:
         flash("再開できるざっくりクイズが見つかりませんでした。", "warning")
@@ -1330,6 +2697,8 @@ def resume_rough_quiz_with_range(direction, range_key):
     session['quiz_direction'] = direction
     session['quiz_type']      = 'rough'
     session['rough_mistakes'] = state.get('mistakes', {'rough_je':[], 'rough_ej':[]})
+    session['vocab_version']  = state.get('vocab_version')
+    session['vocab_deck']     = state.get('deck') or selected_deck()
     # 範囲も復元
     start, end = map(int, range_key.split('-'))
     session['rough_range'] = (start, end)
@@ -1342,37 +2711,18 @@ def resume_rough_quiz_with_range(direction, range_key):
 @login_required
 def manage_rough_mistakes():
     if request.method == "POST":
-        indices_to_delete = [int(i) for i in request.form.getlist('delete_indices')]
+        indices_to_delete = {int(i) for i in request.form.getlist('delete_indices')}
         
         if indices_to_delete:
-            global_mistakes = session.get('global_rough_mistakes', [])
-            
-            updated_mistakes = [
-                mistake for mistake in global_mistakes 
-                if mistake['idx'] not in indices_to_delete
-            ]
-            
-            session['global_rough_mistakes'] = updated_mistakes
+            delete_mistakes(indices_to_delete, ROUGH_MISTAKE_SOURCES)
+            db.session.commit()
             flash(f"{len(indices_to_delete)}件の単語を復習リストから削除しました。", "success")
 
         # redirect先を変更
-        return redirect(url_for('manage_rough_mistakes'))
+        return _mistake_filters_redirect('manage_rough_mistakes')
 
     # GETリクエストの処理
-    mistake_words = []
-    global_mistakes = session.get('global_rough_mistakes', [])
-    
-    unique_indices = sorted(list(set(m['idx'] for m in global_mistakes)))
-    
-    for idx in unique_indices:
-        mistake_words.append({
-            'index': idx,
-            'english': full_df.at[idx, 'English'],
-            'japanese': full_df.at[idx, 'Japanese']
-        })
-
-    # 呼び出すテンプレート名を変更
-    return render_template("manage_rough_mistakes.html", mistake_words=mistake_words)
+    return _mistake_page("manage_rough_mistakes.html", ROUGH_MISTAKE_SOURCES)
 
 @app.route("/remove_from_review", methods=["POST"])
 @login_required
@@ -1382,12 +2732,8 @@ def remove_from_review():
 
     if index_to_delete is not None:
         # 1. 永続的な復習リストから削除
-        global_mistakes = session.get('global_rough_mistakes', [])
-        updated_global_mistakes = [
-            mistake for mistake in global_mistakes
-            if mistake['idx'] != index_to_delete
-        ]
-        session['global_rough_mistakes'] = updated_global_mistakes
+        delete_mistakes([index_to_delete], ROUGH_MISTAKE_SOURCES)
+        db.session.commit()
 
         # 2. 現在進行中の復習クイズリストからも削除
         # (同じセッションで再度表示されるのを防ぐため)
@@ -1411,49 +2757,19 @@ def all_manage_mistakes():
         indices_to_delete_str = request.form.getlist('delete_indices')
         if not indices_to_delete_str:
             flash("削除する単語が選択されていません。", "warning")
-            return redirect(url_for('all_manage_mistakes'))
+            return _mistake_filters_redirect('all_manage_mistakes')
 
         indices_to_delete = {int(i) for i in indices_to_delete_str}
 
-        # 1. 'global_rough_mistakes' から削除
-        rough_mistakes = session.get('global_rough_mistakes', [])
-        session['global_rough_mistakes'] = [m for m in rough_mistakes if m['idx'] not in indices_to_delete]
-
-        # 2. 'random_quiz_mistakes' から削除
-        random_mistakes = session.get('random_quiz_mistakes', [])
-        session['random_quiz_mistakes'] = [m for m in random_mistakes if m['idx'] not in indices_to_delete]
-
-        # 3. 'detailed_quiz_mistakes' から削除 (辞書なので少し複雑)
-        detailed_mistakes = session.get('detailed_quiz_mistakes', {})
-        new_detailed_mistakes = {}
-        for key, mistakes_list in detailed_mistakes.items():
-            filtered_list = [m for m in mistakes_list if m['idx'] not in indices_to_delete]
-            if filtered_list:
-                new_detailed_mistakes[key] = filtered_list
-        session['detailed_quiz_mistakes'] = new_detailed_mistakes
+        # 全ての出題元（ランダム・詳細学習・ざっくり学習）から1回の DELETE で削除
+        delete_mistakes(indices_to_delete, ALL_MISTAKE_SOURCES)
+        db.session.commit()
         
         flash(f"{len(indices_to_delete)}件の単語を全ての間違いリストから削除しました。", "success")
-        return redirect(url_for('all_manage_mistakes'))
-
-    # GETリクエスト: 全ての間違いリストを統合して表示
-    all_mistake_indices = set()
+        return _mistake_filters_redirect('all_manage_mistakes')
 
-    # 全てのリストからユニークな単語IDを収集
-    for m in session.get('global_rough_mistakes', []): all_mistake_indices.add(m['idx'])
-    for m in session.get('random_quiz_mistakes', []): all_mistake_indices.add(m['idx'])
-    for mistakes_list in session.get('detailed_quiz_mistakes', {}).values():
-        for m in mistakes_list: all_mistake_indices.add(m['idx'])
-
-    # 表示用に単語情報を取得
-    mistake_words = []
-    for idx in sorted(list(all_mistake_indices)):
-        mistake_words.append({
-            'index': idx,
-            'english': full_df.at[idx, 'English'],
-            'japanese': full_df.at[idx, 'Japanese']
-        })
-        
-    return render_template("all_manage_mistakes.html", mistake_words=mistake_words)
+    # GETリクエスト: 全ての間違いリストを統合して表示（1ページずつ）
+    return _mistake_page("all_manage_mistakes.html", ALL_MISTAKE_SOURCES)
 
 
 @app.route("/contact", methods=["GET", "POST"])
@@ -0,0 +1,103 @@
+# asgi.py
+# ASGI で動かすときの入口
+#
+#   gunicorn asgi:application -k uvicorn.workers.UvicornWorker
+#
+# 予測変換（/api/search_suggestions）はキー入力のたびに来るが、メモリ上の索引を引くだけなので、
+# Flask を通さずイベントループ上でそのまま返す（ワーカーを丸ごと占有しない）。
+# それ以外のページ・API は今までどおり Flask アプリを asgiref でスレッドに載せて動かす。
+#
+# クイズの回答（/quiz・/api/quiz/answer）と回答記録（quiz_attempts）の書き込みは非同期にしていない。
+# 回答はセッション Cookie・範囲別の集計・学習状況の配列と同じトランザクションで同期の SQLAlchemy を使うので、
+# ASGI で動かしても asgiref のスレッドプールの上で今までどおりに動く（速くはならない）。
+# 回答記録の INSERT をリクエストから外したいときは ATTEMPT_BATCH_SIZE（attempt_writer.py）を使う。
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadSignature
+from werkzeug.http import parse_cookie, parse_etags
+
+from app import app, decks, lookup_suggestions
+from decks import DEFAULT_DECK
+
+SUGGESTION_PATH = "/api/search_suggestions"
+
+
+class TanngoASGI:
+    """予測変換だけを直接返し、残り（クイズの回答・回答記録の書き込みを含む）を Flask（WSGI）に回す ASGI アプリ"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] == "http" and scope["method"] == "GET" and scope["path"] == SUGGESTION_PATH:
+            session = self._session(scope)
+            # ログインしていなければ Flask 側に任せる（ログインページへのリダイレクトなど）
+            if session.get("_user_id"):
+                await self._suggestions(scope, session, send)
+                return
+        await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _session(self, scope):
+        """Flask のセッション Cookie を読む（署名の確認は Flask と同じ方法で行う）"""
+        cookie_name = self.flask_app.config["SESSION_COOKIE_NAME"]
+        header = b"; ".join(value for name, value in scope["headers"] if name == b"cookie")
+        value = parse_cookie(header.decode("latin-1")).get(cookie_name)
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        if not value or serializer is None:
+            return {}
+        try:
+            return serializer.loads(value, max_age=int(self.flask_app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            return {}
+
+    async def _suggestions(self, scope, session, send):
+        # before_request の check_vocab_update と同じく、単語帳の更新を確認する（間隔が空いたときだけ）
+        decks.maybe_reload()
+        query = parse_qs(scope["query_string"].decode("utf-8", "replace")).get("q", [""])[0]
+        deck = session.get("deck", DEFAULT_DECK)
+        registry = decks.peek(deck)
+        if registry is None:
+            # まだ読み込んでいないデッキは read_excel や単語カタログの同期で時間がかかるので、
+            # イベントループを止めないようスレッドで読み込む（他の人の予測変換は待たせない）
+            registry = await asyncio.to_thread(self._load_deck, deck)
+        if_none_match = parse_etags(self._header(scope, b"if-none-match"))
+        status, results, headers = lookup_suggestions(int(session["_user_id"]), registry.current, query, if_none_match)
+        body = b"" if status == 304 else json.dumps(results, ensure_ascii=False).encode("utf-8")
+        response_headers = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()]
+        if status != 304:
+            response_headers += [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+            ]
+        await send({"type": "http.response.start", "status": status, "headers": response_headers})
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    def _load_deck(deck):
+        return decks.get(deck if decks.exists(deck) else DEFAULT_DECK)
+
+    @staticmethod
+    def _header(scope, name):
+        for key, value in scope["headers"]:
+            if key == name:
+                return value.decode("latin-1")
+        return None
+
+
+application = TanngoASGI(app)
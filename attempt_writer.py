@@ -0,0 +1,91 @@
+# attempt_writer.py
+# クイズの回答記録（quiz_attempts の行）をためておき、まとめて1回の INSERT で書く
+#
+# 回答1問ごとに quiz_attempts へ1行（と索引2本）を書くと、SQLite では書き込みのロックを取り合う回数がそのまま増える。
+# 回答記録は件数を数えるため（ランキング・学習記録）だけのものなので、
+# - リクエストではバッファに積むだけにして、batch_size 行たまるか interval 秒たったら別スレッドでまとめて書く
+# - 書けなかったとき（DB が一時的にロックされている等）はバッファに戻して次の回に回す（上限を超えた分は捨てる）
+# - プロセスの終了時にも残りを書く
+# ワーカー（プロセス）ごとに持つので、ほかのワーカーやほかの人の画面に出るまで最大 interval 秒ほど遅れる。
+import atexit
+import os
+import threading
+
+# 書けないまま溜めておく行数の上限（batch_size の何倍まで）
+MAX_PENDING_BATCHES = 50
+
+
+class AttemptWriter:
+    """write(rows) でまとめて書く。batch_size=0 なら無効（呼び出し側でその場で書く）"""
+
+    def __init__(self, write, batch_size=200, interval=1.0):
+        self.write = write
+        self.batch_size = batch_size
+        self.interval = interval
+        self._rows = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        self._registered = False
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self):
+        return self.batch_size > 0
+
+    def add(self, row):
+        with self._lock:
+            self._rows.append(row)
+            full = len(self._rows) >= self.batch_size
+            # スレッドはワーカーごとに、最初に使うときに起こす（fork 前に作ったスレッドは引き継がれない）
+            if self._thread is None or self._thread_pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name="attempt-writer", daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+                if not self._registered:
+                    atexit.register(self.flush)
+                    self._registered = True
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """たまっている行を書く。書いた行数を返す"""
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return 0
+        try:
+            self.write(rows)
+        except Exception as e:
+            with self._lock:
+                self._rows[:0] = rows
+                overflow = len(self._rows) - self.batch_size * MAX_PENDING_BATCHES
+                if overflow > 0:
+                    del self._rows[:overflow]
+                    self.dropped += overflow
+            print(f"❌ エラー: 回答記録を書き込めませんでした（次の回にやり直します）: {e}")
+            return 0
+        with self._lock:
+            self.written += len(rows)
+            self.batches += 1
+        return len(rows)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._rows),
+                "written": self.written,
+                "batches": self.batches,
+                "dropped": self.dropped,
+                "batch_size": self.batch_size,
+                "interval": self.interval,
+            }
@@ -0,0 +1,191 @@
+# compression.py
+# レスポンスの圧縮と、静的ファイルのキャッシュ用ヘッダー
+#
+# - 一定サイズ以上のテキスト系レスポンスを gzip / brotli で圧縮する（ストリーミングは逐次圧縮）
+# - static/ の URL に内容のハッシュを付け（?v=...）、そのURLは1年キャッシュさせる
+# - `flask compress-static` で作った .gz / .br があれば、それをそのまま返す
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+import zlib
+
+from flask import request, send_from_directory
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+try:
+    import brotli  # 任意（無ければ gzip のみ）
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    "text/html", "text/css", "text/plain", "text/javascript", "application/javascript",
+    "application/json", "image/svg+xml",
+}
+# ビルド時に圧縮しておく拡張子
+PRECOMPRESS_EXTENSIONS = (".js", ".css", ".json", ".svg", ".html", ".txt")
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def _accepts(encoding):
+    return encoding in request.accept_encodings
+
+
+def _choose_encoding():
+    if brotli is not None and _accepts("br"):
+        return "br"
+    if _accepts("gzip"):
+        return "gzip"
+    return None
+
+
+def _compress(data, encoding, level):
+    if encoding == "br":
+        return brotli.compress(data, quality=min(level, 11))
+    return gzip.compress(data, compresslevel=level)
+
+
+def _gzip_stream(chunks, level):
+    """ストリーミングを逐次 gzip する。チャンクごとに flush するので最初のバイトが遅れない"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class StaticHashes:
+    """静的ファイルの内容ハッシュ（更新時刻が変わったときだけ計算し直す）"""
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        path = safe_join(self.static_folder, filename)
+        if path is None:
+            return None
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._hashes.get(filename)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                h.update(block)
+        digest = h.hexdigest()[:12]
+        with self._lock:
+            self._hashes[filename] = (mtime, digest)
+        return digest
+
+
+def init_compression(app, min_size=1024, level=6):
+    """圧縮・静的ファイルのキャッシュヘッダーを組み込む"""
+    hashes = StaticHashes(app.static_folder)
+    app.extensions["static_hashes"] = hashes
+
+    @app.url_defaults
+    def add_static_version(endpoint, values):
+        # url_for('static', filename=...) に内容のハッシュを付ける
+        if endpoint == "static" and "filename" in values and "v" not in values:
+            version = hashes.get(values["filename"])
+            if version:
+                values["v"] = version
+
+    def static_view(filename):
+        response = None
+        # 圧縮済みファイルが元ファイルより新しければそれを返す
+        original = safe_join(app.static_folder, filename)
+        if original is None or not os.path.isfile(original):
+            raise NotFound()
+        for candidate, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if not _accepts(candidate):
+                continue
+            compressed = original + suffix
+            if os.path.isfile(compressed) and os.path.getmtime(compressed) >= os.path.getmtime(original):
+                mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                response = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype)
+                response.headers["Content-Encoding"] = candidate
+                break
+        if response is None:
+            response = app.send_static_file(filename)
+        response.vary.add("Accept-Encoding")
+        version = request.args.get("v")
+        if version and version == hashes.get(filename):
+            # 内容が変わると URL も変わるので、ずっとキャッシュしてよい
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        return response
+
+    app.view_functions["static"] = static_view
+
+    @app.after_request
+    def compress_response(response):
+        if (
+            response.status_code != 200
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES
+            or request.method == "HEAD"
+        ):
+            return response
+        encoding = _choose_encoding()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            # ストリーミング（大きな一覧）は逐次 gzip（brotli は逐次圧縮しない）
+            if not _accepts("gzip"):
+                return response
+            response.response = _gzip_stream(response.response, level)
+            response.headers["Content-Encoding"] = "gzip"
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < min_size:
+                return response
+            response.set_data(_compress(data, encoding, level))
+            response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # 圧縮後はバイト列が変わるので弱い ETag にする
+            response.set_etag(etag, weak=True)
+        return response
+
+    return hashes
+
+
+def precompress_static(static_folder, level=9):
+    """static/ のテキスト系ファイルの .gz（と brotli があれば .br）を作る。作ったファイル数を返す"""
+    written = 0
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            if not name.endswith(PRECOMPRESS_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                data = f.read()
+            outputs = [(".gz", gzip.compress(data, compresslevel=level, mtime=0))]
+            if brotli is not None:
+                outputs.append((".br", brotli.compress(data, quality=11)))
+            for suffix, compressed in outputs:
+                # 小さくならないなら置かない
+                if len(compressed) >= len(data):
+                    continue
+                with open(path + suffix, "wb") as f:
+                    f.write(compressed)
+                written += 1
+    return written
@@ -0,0 +1,101 @@
+# decks.py
+# 複数の単語帳（デッキ）の管理
+#
+# static/words.xlsx を既定のデッキ、static/decks/<名前>.xlsx をそれぞれ1つのデッキとして扱う。
+# デッキは最初に使われたときに読み込み（単語・検索索引・ベクトルの切り出しを含む）、
+# 合計サイズが上限を超えたら、最近使われていないものから捨てる。
+import os
+import threading
+from collections import OrderedDict
+
+from vocab import WORDS_PATH, VocabRegistry
+
+DEFAULT_DECK = "default"
+DECKS_DIR = "static/decks"
+
+
+class DeckManager:
+    def __init__(self, default_path=WORDS_PATH, decks_dir=DECKS_DIR, memory_budget=512 * 1024 * 1024, **registry_kwargs):
+        self.default_path = default_path
+        self.decks_dir = decks_dir
+        self.memory_budget = memory_budget
+        self.registry_kwargs = registry_kwargs
+        self._lock = threading.Lock()
+        self._loaded = OrderedDict()  # デッキ名 -> VocabRegistry（末尾ほど最近使った）
+        self._loading = {}            # デッキ名 -> 読み込み中に他のスレッドが待つためのロック
+        self.loads = 0
+        self.evictions = 0
+
+    def available(self):
+        """デッキ名 -> ファイルパス（既定のデッキが先頭）"""
+        decks = OrderedDict([(DEFAULT_DECK, self.default_path)])
+        if os.path.isdir(self.decks_dir):
+            for name in sorted(os.listdir(self.decks_dir)):
+                slug, ext = os.path.splitext(name)
+                if ext == ".xlsx" and not name.startswith(("~$", ".")) and slug != DEFAULT_DECK:
+                    decks[slug] = os.path.join(self.decks_dir, name)
+        return decks
+
+    def exists(self, deck):
+        return deck in self.available()
+
+    def get(self, deck=None):
+        """デッキの VocabRegistry。未読み込みならここで読み込む"""
+        deck = deck or DEFAULT_DECK
+        with self._lock:
+            registry = self._loaded.get(deck)
+            if registry is not None:
+                self._loaded.move_to_end(deck)
+                return registry
+            path = self.available().get(deck)
+            if path is None:
+                raise KeyError(deck)
+            loading = self._loading.setdefault(deck, threading.Lock())
+
+        # 同じデッキを複数のリクエストが同時に読み込まないよう、デッキ単位で待ち合わせる
+        with loading:
+            with self._lock:
+                registry = self._loaded.get(deck)
+                if registry is not None:
+                    self._loaded.move_to_end(deck)
+                    return registry
+            registry = VocabRegistry(path, **self.registry_kwargs)
+            with self._lock:
+                self._loaded[deck] = registry
+                self._loading.pop(deck, None)
+                self.loads += 1
+                self._evict(keep=deck)
+        return registry
+
+    def peek(self, deck=None):
+        """読み込み済みならその VocabRegistry、まだなら None（ここでは読み込まない）"""
+        with self._lock:
+            registry = self._loaded.get(deck or DEFAULT_DECK)
+            if registry is not None:
+                self._loaded.move_to_end(deck or DEFAULT_DECK)
+            return registry
+
+    def _evict(self, keep):
+        """合計サイズが上限を超えていれば、古いものから捨てる（今使うデッキは残す）"""
+        sizes = {name: reg.estimate_nbytes() for name, reg in self._loaded.items()}
+        total = sum(sizes.values())
+        for name in list(self._loaded):
+            if total <= self.memory_budget:
+                break
+            if name == keep:
+                continue
+            self._loaded.pop(name)
+            total -= sizes[name]
+            self.evictions += 1
+            print(f"ℹ️ デッキ「{name}」をメモリから外しました（{sizes[name] / 1e6:.1f} MB）")
+
+    def loaded(self):
+        with self._lock:
+            return list(self._loaded.items())
+
+    def maybe_reload(self):
+        for _, registry in self.loaded():
+            registry.maybe_reload()
+
+    def estimate_nbytes(self):
+        return sum(reg.estimate_nbytes() for _, reg in self.loaded())
@@ -0,0 +1,57 @@
+# 日本語訳の読み（ひらがな・ローマ字）の生成スクリプト
+#   python generate_readings.py [--words static/words.xlsx] [--decks-dir static/decks]
+#
+# words.xlsx（と追加の単語帳）の Japanese 列を読み、セル全体と「、」区切りの各訳の読みを
+# pykakasi で作って static/word_readings.json に書き込む。既に読みがあるテキストはそのまま使うので、
+# 追加した単語だけが変換される。手で直した読みも上書きされない。
+#   pip install pykakasi   （このスクリプトを動かす環境だけで必要。アプリ側は JSON を読むだけ）
+
+import argparse
+import glob
+import os
+
+from generate_vectors import iter_word_chunks
+from readings import READINGS_PATH, load_readings, normalize_kana, normalize_romaji, write_readings
+
+WORDS_PATH = "static/words.xlsx"
+DECKS_DIR = "static/decks"
+
+
+def reading_of(kakasi, text):
+    """(ひらがな, ローマ字)。読めない文字（英字など）はそのまま残る"""
+    items = kakasi.convert(text)
+    kana = normalize_kana("".join(item["hira"] for item in items))
+    romaji = normalize_romaji("".join(item["hepburn"] for item in items))
+    return kana, romaji
+
+
+def build(paths, readings_path=READINGS_PATH):
+    import pykakasi
+
+    kakasi = pykakasi.kakasi()
+    readings = load_readings(readings_path)
+    added = 0
+    total = 0
+    for path in paths:
+        for chunk in iter_word_chunks(path, columns=("Japanese",)):
+            for text in chunk:
+                total += 1
+                if text in readings:
+                    continue
+                readings[text] = reading_of(kakasi, text)
+                added += 1
+    print(f"テキスト数: {total}（既存 {total - added} / 新規 {added}）")
+    if not added:
+        print("✅ 変更はありません")
+        return
+    write_readings(readings, readings_path)
+    print(f"✅ {readings_path} に保存しました")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="単語帳の日本語訳から読み（ひらがな・ローマ字）を生成する")
+    parser.add_argument("--words", default=WORDS_PATH)
+    parser.add_argument("--decks-dir", default=DECKS_DIR, help="追加の単語帳（*.xlsx）のフォルダ")
+    args = parser.parse_args()
+    paths = [args.words] + sorted(glob.glob(os.path.join(args.decks_dir, "*.xlsx")))
+    build([p for p in paths if os.path.exists(p)])
@@ -1,26 +1,182 @@
-# 保存用スクリプト（make_word_vectors.py などに保存して実行）
+# 単語ベクトルの生成スクリプト
+#   python generate_vectors.py [--workers 4] [--chunk-size 256]
+#
+# words.xlsx をチャンクごとに読み、CPU のマルチプロセスでエンコードして
+# static/word_vectors.npy（memmap）に書き込む。既にベクトルがある単語は
+# コンテンツハッシュで見つけて再利用するので、追加した単語だけがエンコードされる。
+#
+# 英→日の採点では「日本語の正解」と「ユーザーの日本語の答え」を比べるため、
+# English 列だけでなく Japanese 列（セル全体と「、」区切りの各訳）もエンコードする。
+# 英語と日本語を同じ空間に載せるため、多言語モデルを使う。
 
-from sentence_transformers import SentenceTransformer
-import pandas as pd
-import pickle
+import argparse
+import os
+import time
+from multiprocessing import get_context
 
-# 1. 単語一覧の読み込み（words.xlsx）
-df = pd.read_excel("static/words.xlsx")
+import numpy as np
+from openpyxl import load_workbook
 
-# 2. 単語の抽出（英語だけ）
-english_words = df["English"].dropna().unique().tolist()
+from vector_store import KEYS_PATH, VECTORS_PATH, VectorStore, content_hash, split_variants, write_keys
 
-# 3. モデル読み込み
-model = SentenceTransformer("paraphrase-MiniLM-L6-v2")
+WORDS_PATH = "static/words.xlsx"
+MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+COLUMNS = ("English", "Japanese")
+# 訳語の言い換え（「学生、生徒」→「学生」「生徒」）もエンコードする列
+VARIANT_COLUMNS = ("Japanese",)
 
-# 4. ベクトル生成
-vectors = model.encode(english_words)
+_model = None
 
-# 5. 辞書に変換
-word_vectors = {word: vec for word, vec in zip(english_words, vectors)}
 
-# 6. 保存
-with open("word_vectors.pkl", "wb") as f:
-    pickle.dump(word_vectors, f)
+def _texts_for_cell(column, value):
+    text = str(value).strip()
+    if not text:
+        return []
+    texts = [text]
+    if column in VARIANT_COLUMNS:
+        texts.extend(v for v in split_variants(text) if v != text)
+    return texts
 
-print("✅ 正常に保存されました（辞書形式）")
+
+def iter_word_chunks(path=WORDS_PATH, columns=COLUMNS, chunk_size=256):
+    """Excel を read-only で1行ずつ読み、指定列の単語（と訳の言い換え）をチャンク単位で返す（重複は除外）"""
+    wb = load_workbook(path, read_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        col_positions = [(c, header.index(c)) for c in columns if c in header]
+        seen = set()
+        chunk = []
+        for row in rows:
+            for column, pos in col_positions:
+                value = row[pos] if pos < len(row) else None
+                if value is None:
+                    continue
+                for text in _texts_for_cell(column, value):
+                    if text in seen:
+                        continue
+                    seen.add(text)
+                    chunk.append(text)
+                    if len(chunk) >= chunk_size:
+                        yield chunk
+                        chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        wb.close()
+
+
+# --- ワーカープロセス側 -------------------------------------------------------
+def _init_worker(model_name):
+    global _model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    # プロセス数ぶん並列にするので、各プロセス内のスレッドは1本に絞る
+    torch.set_num_threads(1)
+    _model = SentenceTransformer(model_name, device="cpu")
+
+
+def _embedding_dim(_=None):
+    return _model.get_sentence_embedding_dimension()
+
+
+def _encode_chunk(job):
+    offset, texts = job
+    vectors = _model.encode(texts, batch_size=64, convert_to_numpy=True, show_progress_bar=False)
+    return offset, np.asarray(vectors, dtype=np.float32)
+
+
+# --- メイン処理 ---------------------------------------------------------------
+def _open_existing(model_name):
+    if not (os.path.exists(VECTORS_PATH) and os.path.exists(KEYS_PATH)):
+        return None
+    try:
+        store = VectorStore.open()
+    except (ValueError, OSError):
+        return None
+    if store.model_name != model_name:
+        print(f"ℹ️ モデルが変わったため全件を再エンコードします（{store.model_name} → {model_name}）")
+        return None
+    return store
+
+
+def build(words_path=WORDS_PATH, model_name=MODEL_NAME, columns=COLUMNS, workers=None, chunk_size=256):
+    workers = workers or os.cpu_count() or 1
+    existing = _open_existing(model_name)
+
+    # 1. 単語をチャンクで読みながら、再利用できるもの／エンコードが必要なものに振り分ける
+    texts = []
+    reused = []   # (出力行, 既存行)
+    pending = []  # (出力行, テキスト)
+    for chunk in iter_word_chunks(words_path, columns, chunk_size):
+        for text in chunk:
+            row = len(texts)
+            texts.append(text)
+            old_row = existing.row_of_hash(content_hash(text)) if existing is not None else None
+            if old_row is None:
+                pending.append((row, text))
+            else:
+                reused.append((row, old_row))
+
+    print(f"単語数: {len(texts)}（再利用 {len(reused)} / 新規エンコード {len(pending)}）")
+    if existing is not None and not pending and len(existing) == len(texts):
+        print("✅ 変更はありません")
+        return
+
+    ctx = get_context("spawn")
+    pool = None
+    try:
+        if existing is not None:
+            dim = existing.dim
+        else:
+            pool = ctx.Pool(workers, initializer=_init_worker, initargs=(model_name,))
+            dim = pool.apply(_embedding_dim)
+
+        # 2. 出力先を最終サイズで確保（memmap）
+        tmp_path = VECTORS_PATH + ".tmp.npy"
+        out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(len(texts), dim))
+
+        # 3. 既存ベクトルはそのままコピー
+        for row, old_row in reused:
+            out[row] = existing.vectors[old_row]
+
+        # 4. 新しい単語だけをチャンク単位で並列エンコードし、届いた順に書き込む
+        if pending:
+            if pool is None:
+                pool = ctx.Pool(workers, initializer=_init_worker, initargs=(model_name,))
+            jobs = [
+                (start, [text for _, text in pending[start:start + chunk_size]])
+                for start in range(0, len(pending), chunk_size)
+            ]
+            started = time.perf_counter()
+            done = 0
+            for offset, vectors in pool.imap_unordered(_encode_chunk, jobs):
+                for i, vec in enumerate(vectors):
+                    out[pending[offset + i][0]] = vec
+                done += len(vectors)
+                print(f"  {done}/{len(pending)} 件エンコード済み")
+            print(f"エンコード時間: {time.perf_counter() - started:.1f} 秒（{workers} プロセス）")
+
+        out.flush()
+        del out
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # 5. 差し替え（既存の memmap を閉じてから）
+    existing = None
+    os.replace(tmp_path, VECTORS_PATH)
+    write_keys([content_hash(t) for t in texts], model_name)
+    print(f"✅ {VECTORS_PATH} に保存しました")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="words.xlsx から単語ベクトルを生成する")
+    parser.add_argument("--words", default=WORDS_PATH)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--workers", type=int, default=None, help="エンコードに使うプロセス数（既定: CPU数）")
+    parser.add_argument("--chunk-size", type=int, default=256)
+    args = parser.parse_args()
+    build(args.words, args.model, workers=args.workers, chunk_size=args.chunk_size)
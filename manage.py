@@ -1,10 +1,10 @@
 # manage.py
-from app import app, db
+from app import IS_SQLITE, app, db
 from flask_migrate import Migrate
 from flask.cli import with_appcontext
 import click
 
-migrate = Migrate(app, db)
+migrate = Migrate(app, db, render_as_batch=IS_SQLITE)
 
 @app.cli.command("db-init")
 @with_appcontext
@@ -26,3 +26,928 @@ def db_upgrade():
     """マイグレーションの適用"""
     from flask_migrate import upgrade
     upgrade()
+
+@app.cli.command("remap-word-ids")
+@click.option("--dry-run", is_flag=True, help="対応付けを表示するだけで保存しない")
+@with_appcontext
+def remap_word_ids(dry_run):
+    """単語帳の修正で別IDになった単語を、元のIDに統合する
+
+    単語カタログにあるのにどのデッキ（words.xlsx と static/decks/*.xlsx）からも消えた単語と、新しく現れた単語を
+    英語（無ければ日本語）で対応付け、旧ID -> 新ID を記録する。
+    DB 上の参照は一括で書き換え、各ユーザーのセッションは次のアクセス時に変換される。"""
+    from app import Word, WordIdRemap, decks, sync_word_catalogue
+    from vocab import load_snapshot
+
+    # どのデッキにも残っていない単語が統合の対象
+    present_ids = set()
+    for path in decks.available().values():
+        snapshot = load_snapshot(path)
+        sync_word_catalogue(snapshot)  # 新しく現れた単語にIDを振る
+        present_ids.update(snapshot.all_word_ids)
+    already = {old for (old,) in db.session.query(WordIdRemap.old_id)}
+
+    words = Word.query.order_by(Word.id).all()
+    orphans = [w for w in words if w.id not in present_ids and w.id not in already]
+    # 旧IDより後に登録された（=修正後の）単語だけを統合先の候補にする
+    newest = {}
+    for w in words:
+        if w.id in present_ids:
+            newest.setdefault(("en", w.english.strip().lower()), []).append(w)
+            newest.setdefault(("ja", w.japanese.strip()), []).append(w)
+
+    mapping = {}
+    taken = set()
+    for old in orphans:
+        for key in (("en", old.english.strip().lower()), ("ja", old.japanese.strip())):
+            candidates = [w for w in newest.get(key, []) if w.id > old.id and w.id not in taken]
+            if candidates:
+                mapping[old.id] = candidates[0].id
+                taken.add(candidates[0].id)
+                break
+
+    by_id = {w.id: w for w in words}
+    for old_id, new_id in mapping.items():
+        old, new = by_id[old_id], by_id[new_id]
+        click.echo(f"{old_id} {old.english} / {old.japanese}  ->  {new_id} {new.english} / {new.japanese}")
+    click.echo(f"{len(mapping)} 件を統合します（対応が見つからない削除済み単語: {len(orphans) - len(mapping)} 件）")
+    if dry_run or not mapping:
+        return
+
+    db.session.execute(db.insert(WordIdRemap), [{'old_id': o, 'new_id': n} for o, n in mapping.items()])
+    merged = remap_word_refs(mapping)
+    db.session.commit()
+    if merged:
+        click.echo(f"同じユーザーが旧IDと新IDの両方に持っていた {merged} 行は、1行にまとめました。")
+    click.echo("✅ 統合しました。管理者ページの「再読み込み」か words.xlsx の更新で各ワーカーに反映されます。")
+
+def _merge_remap_collisions(table, column, mapping):
+    """旧IDの行を新IDに書き換えると一意制約にぶつかる行（同じユーザーが旧IDと新IDの両方の行を持つ）を先に片付ける
+
+    旧IDの行は消す。updated_at がある表で旧IDの行のほうが新しければ、その内容を新IDの行に移す。消した行数を返す。"""
+    from sqlalchemy import UniqueConstraint, select
+
+    unique = next(c for c in table.constraints if isinstance(c, UniqueConstraint) and column in c.columns)
+    key_names = [c.name for c in unique.columns if c.name != column]
+    col = table.c[column]
+
+    def key(row, word_id):
+        return tuple(row[name] for name in key_names) + (word_id,)
+
+    targets = {
+        key(row, row[column]): row
+        for row in db.session.execute(select(table).where(col.in_(set(mapping.values())))).mappings()
+    }
+    stale = []
+    for row in db.session.execute(select(table).where(col.in_(list(mapping)))).mappings().all():
+        target = targets.get(key(row, mapping[row[column]]))
+        if target is None:
+            continue
+        stale.append(row['id'])
+        if 'updated_at' in table.c and row['updated_at'] > target['updated_at']:
+            values = {name: value for name, value in row.items() if name not in ('id', column, *key_names)}
+            db.session.execute(table.update().where(table.c.id == target['id']).values(values))
+    for start in range(0, len(stale), 5000):
+        db.session.execute(table.delete().where(table.c.id.in_(stale[start:start + 5000])))
+    return len(stale)
+
+def remap_word_refs(mapping):
+    """DB 上の単語IDの参照を 旧ID -> 新ID に書き換える（commit は呼び出し側）。一意制約のためにまとめた行数を返す"""
+    from sqlalchemy import case
+    import progress_array
+    from app import ProgressArray, WORD_REF_COLUMNS
+
+    merged = 0
+    # 参照している列を、列ごとに1回の UPDATE でまとめて書き換える
+    # 一意制約（word_progress・mistakes とも単語IDを含む）にぶつかる行を先に片付けてから書き換える
+    for table, column in WORD_REF_COLUMNS:
+        merged += _merge_remap_collisions(table, column, mapping)
+        col = table.c[column]
+        db.session.execute(
+            table.update().where(col.in_(list(mapping))).values({column: case(mapping, value=col)})
+        )
+    # 単語IDを添字にした学習状況の配列は、要素を移す
+    for row in ProgressArray.query.yield_per(500):
+        row.data = progress_array.dump(progress_array.remap(progress_array.load(row.data), mapping))
+    return merged
+
+@app.cli.command("rebuild-range-stats")
+@with_appcontext
+def rebuild_range_stats():
+    """範囲別の集計を word_progress から作り直す（単語帳の並びを変えたあとなどに）"""
+    from collections import Counter
+    from app import RangeStat, WordProgress, decks
+
+    snapshots = {deck: decks.get(deck).current for deck in decks.available()}
+    counts = Counter()
+    rows = db.session.query(WordProgress.user_id, WordProgress.deck, WordProgress.word_id, WordProgress.direction, WordProgress.correct)
+    for user_id, deck, word_id, direction, correct in rows.yield_per(5000):
+        snapshot = snapshots.get(deck)
+        range_start = snapshot.range_start(word_id) if snapshot is not None else None
+        if range_start is not None:
+            counts[(user_id, deck, direction, range_start, bool(correct))] += 1
+
+    stats = {}
+    for (user_id, deck, direction, range_start, correct), n in counts.items():
+        stat = stats.setdefault((user_id, deck, direction, range_start), {
+            'user_id': user_id, 'deck': deck, 'direction': direction, 'range_start': range_start,
+            'mastered': 0, 'mistakes': 0,
+        })
+        stat['mastered' if correct else 'mistakes'] = n
+
+    RangeStat.query.delete()
+    if stats:
+        db.session.execute(db.insert(RangeStat), list(stats.values()))
+    db.session.commit()
+    click.echo(f"✅ 範囲別の集計を {len(stats)} 件作り直しました。")
+
+@app.cli.command("rebuild-progress-arrays")
+@with_appcontext
+def rebuild_progress_arrays():
+    """学習状況の配列を word_progress から作り直す（配列を入れる前からのユーザー用）
+
+    回数・連続正解数は残っていないので、最後の正誤から「1回出題・正解なら連続1」として作る。"""
+    import progress_array
+    from app import ProgressArray, WordProgress
+
+    # word_progress はデッキごとに持つので、同じ単語は一番新しい回答だけを使う
+    latest = {}
+    rows = db.session.query(WordProgress.user_id, WordProgress.direction, WordProgress.word_id,
+                            WordProgress.correct, WordProgress.updated_at)
+    for user_id, direction, word_id, correct, updated_at in rows.yield_per(5000):
+        key = (user_id, direction, word_id)
+        if key not in latest or updated_at > latest[key][1]:
+            latest[key] = (correct, updated_at)
+    results = {}
+    for (user_id, direction, word_id), (correct, updated_at) in latest.items():
+        results.setdefault((user_id, direction), []).append((word_id, correct, progress_array.today(updated_at.date())))
+
+    ProgressArray.query.delete()
+    for (user_id, direction), answers in results.items():
+        array = progress_array.load(b'')
+        for word_id, correct, day in answers:
+            array = progress_array.record(array, [(word_id, correct)], day=day)
+        db.session.add(ProgressArray(user_id=user_id, direction=direction, data=progress_array.dump(array)))
+    db.session.commit()
+    click.echo(f"✅ 学習状況の配列を {len(results)} 件作り直しました。")
+
+@app.cli.command("archive-attempts")
+@click.option("--days", default=90, show_default=True, type=click.IntRange(min=8),
+              help="これより古い回答をまとめる（直近7日の集計は quiz_attempts を直接見るので 8 以上）")
+@click.option("--chunk-size", default=5000, show_default=True, help="1回のトランザクションで移す行数")
+def archive_attempts_command(days, chunk_size):
+    """古い quiz_attempts をユーザー・日ごとの件数（quiz_attempt_daily）にまとめて、元の行を消す"""
+    from datetime import datetime, timedelta
+    from app import archive_attempts
+
+    before = datetime.utcnow() - timedelta(days=days)
+    moved = archive_attempts(before, chunk_size)
+    click.echo(f"✅ {before:%Y-%m-%d} より前の回答 {moved} 件をまとめました。")
+
+# explain-queries で開くページ（GET のみ。DB を書き換えるページは含めない）
+EXPLAIN_LEARNER_PAGES = [
+    "/menu", "/progress", "/learn_details", "/rough_range/ej", "/manage_mistakes", "/all_manage_mistakes",
+    "/manage_rough_mistakes", "/mypage", "/search?q=st", "/api/search_suggestions?q=st",
+]
+EXPLAIN_ADMIN_PAGES = ["/admin", "/admin/metrics/suggestions"]
+
+@app.cli.command("explain-queries")
+@click.option("--min-rows", default=10000, show_default=True, help="この行数以上のテーブルを Seq Scan していたら失敗にする")
+@click.option("--show-plans", is_flag=True, help="実行計画を全部表示する")
+def explain_queries(min_rows, show_plans):
+    """主なページを開いたときに出る SELECT を全部集め、実行計画に大きなテーブルの Seq Scan が無いか確かめる
+
+    PostgreSQL では EXPLAIN (ANALYZE) を、SQLite では EXPLAIN QUERY PLAN を使う。
+    データが少ないと索引があっても Seq Scan になるので、flask seed などで量を入れてから実行する。"""
+    import json
+    from sqlalchemy import event, func, text
+    from app import QuizAttempt, User, db
+
+    dialect = db.engine.dialect.name
+    if dialect not in ("postgresql", "sqlite"):
+        click.echo(f"{dialect} には対応していません（PostgreSQL / SQLite のみ）。")
+        raise SystemExit(2)
+    admin = User.query.filter_by(is_admin=True).first()
+    # 一番回答数の多いユーザーで見る（履歴の多いユーザーほど Seq Scan が効いてくる）
+    learner = (
+        db.session.query(User).join(QuizAttempt, QuizAttempt.user_id == User.id)
+        .group_by(User.id).order_by(func.count(QuizAttempt.id).desc()).first()
+    )
+    if admin is None or learner is None:
+        click.echo("管理者と、回答履歴のあるユーザーが必要です（flask seed などで作ってください）。")
+        raise SystemExit(2)
+
+    # 統計を最新にしてから、テーブルごとの行数を取る
+    if dialect == "postgresql":
+        db.session.execute(text("ANALYZE"))
+        sizes = dict(db.session.execute(text(
+            "SELECT relname, reltuples::bigint FROM pg_class WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace"
+        )).all())
+    else:
+        db.session.execute(text("ANALYZE"))
+        sizes = {table: db.session.execute(text(f'SELECT count(*) FROM "{table}"')).scalar() for table in db.metadata.tables}
+    db.session.commit()
+
+    captured = {}
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith("SELECT"):
+            captured.setdefault(statement, parameters)
+    event.listen(db.engine, "before_cursor_execute", capture)
+    try:
+        for user_id, paths in ((learner.id, EXPLAIN_LEARNER_PAGES), (admin.id, EXPLAIN_ADMIN_PAGES)):
+            # リクエストは今のアプリコンテキストを使い回すので、ユーザーごとに新しく作る（g のログイン情報を持ち越さない）
+            with app.app_context():
+                client = app.test_client()
+                with client.session_transaction() as sess:
+                    sess["_user_id"] = str(user_id)
+                    sess["_fresh"] = True
+                for path in paths:
+                    status = client.get(path).status_code
+                    if status >= 500:
+                        click.echo(f"❌ {path} が {status} を返しました")
+                        raise SystemExit(1)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", capture)
+
+    def walk(node):
+        yield node
+        for child in node.get("Plans", []):
+            yield from walk(child)
+
+    failures = 0
+    click.echo(f"{len(captured)} 件の SELECT（{min_rows:,} 行以上のテーブルの Seq Scan を失敗とする）")
+    with db.engine.connect() as conn:
+        for statement, parameters in captured.items():
+            if dialect == "postgresql":
+                value = conn.exec_driver_sql("EXPLAIN (ANALYZE, FORMAT JSON) " + statement, parameters).scalar()
+                plan = value if isinstance(value, list) else json.loads(value)
+                nodes = list(walk(plan[0]["Plan"]))
+                scans = [n["Relation Name"] for n in nodes if n["Node Type"] == "Seq Scan"]
+                elapsed = f"{plan[0]['Execution Time']:8.2f} ms"
+                lines = [f"{n['Node Type']} {n.get('Relation Name', '')} {n.get('Index Name', '')}".strip() for n in nodes]
+            else:
+                rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+                lines = [row[-1] for row in rows]
+                scans = [line.split()[1] for line in lines if line.startswith("SCAN ") and "USING" not in line]
+                elapsed = " " * 11
+            large = sorted({table for table in scans if sizes.get(table, 0) >= min_rows})
+            failures += bool(large)
+            mark = "❌" if large else "✅"
+            sql = " ".join(statement.split())
+            click.echo(f"{mark} {elapsed}  {sql[:110]}{'…' if len(sql) > 110 else ''}")
+            if large:
+                click.echo(f"     Seq Scan: {', '.join(f'{t}（{sizes[t]:,} 行）' for t in large)}")
+            if large or show_plans:
+                for line in lines:
+                    click.echo(f"       {line}")
+    if failures:
+        click.echo(f"❌ {failures} 件のクエリが大きなテーブルを Seq Scan しています")
+        raise SystemExit(1)
+    click.echo("✅ 大きなテーブルの Seq Scan はありません")
+
+@app.cli.command("compress-static")
+@with_appcontext
+def compress_static():
+    """static/ のテキスト系ファイルを事前に圧縮しておく（.gz / .br。デプロイ時のビルドで実行）"""
+    from compression import brotli, precompress_static
+
+    written = precompress_static(app.static_folder)
+    note = "" if brotli is not None else "（brotli が無いため .gz のみ）"
+    click.echo(f"✅ 圧縮ファイルを {written} 件作成しました{note}")
+
+@app.cli.command("generate-vectors")
+@click.option("--workers", default=0, help="エンコードに使うプロセス数（既定: CPU数）")
+@click.option("--chunk-size", default=256, show_default=True)
+def generate_vectors_command(workers, chunk_size):
+    """単語ベクトル（static/word_vectors.npy）を作る・足りない分を足す（デプロイ時のビルドで実行）
+
+    無いと旧形式の英語だけのベクトルにフォールバックし、英語→日本語は意味で採点できない。
+    sentence_transformers と多言語モデルのダウンロードが必要。"""
+    from generate_vectors import build
+
+    build(workers=workers or None, chunk_size=chunk_size)
+
+def _bench(label, fn, repeat=5):
+    """fn を repeat 回実行して最速の時間を表示する"""
+    import time
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    click.echo(f"  {label:<40} {best * 1000:9.2f} ms")
+    return best
+
+@app.cli.command("bench-mistakes")
+@click.option("--size", default=10000, show_default=True, help="間違いの件数")
+def bench_mistakes(size):
+    """間違いリストの操作を、辞書のリストと詰めた整数の set で比べる"""
+    import json
+    import random as rnd
+    import mistake_keys
+
+    rng = rnd.Random(0)
+    entries = [(rng.randrange(size * 2), rng.choice(mistake_keys.DIRECTIONS)) for _ in range(size)]
+    probes = [(rng.randrange(size * 2), rng.choice(mistake_keys.DIRECTIONS)) for _ in range(1000)]
+    doomed = {rng.randrange(size * 2) for _ in range(size // 10)}
+
+    click.echo(f"辞書のリスト（{size} 件）")
+    def list_add():
+        mistakes = []
+        for idx, direction in entries:
+            marker = {'idx': idx, 'dir': direction}
+            if marker not in mistakes:
+                mistakes.append(marker)
+        return mistakes
+    _bench("追加（重複チェック付き）", list_add, repeat=1)
+    as_list = list_add()
+    _bench("有無の確認 ×1000", lambda: [{'idx': i, 'dir': d} in as_list for i, d in probes])
+    _bench("重複除去（2リストの合併）", lambda: [dict(t) for t in set(tuple(d.items()) for d in as_list + as_list)])
+    _bench(f"{len(doomed)} 語の削除", lambda: [m for m in as_list if m['idx'] not in doomed])
+    list_size = len(json.dumps(as_list, separators=(',', ':')))
+
+    click.echo(f"詰めた整数の set（{size} 件）")
+    def set_add():
+        keys = set()
+        for idx, direction in entries:
+            keys.add(mistake_keys.pack(idx, direction))
+        return keys
+    _bench("追加", set_add)
+    as_set = set_add()
+    _bench("有無の確認 ×1000", lambda: [mistake_keys.pack(i, d) in as_set for i, d in probes])
+    _bench("重複除去（2集合の合併）", lambda: as_set | set(as_set))
+    _bench(f"{len(doomed)} 語の削除", lambda: {k for k in as_set if k >> 1 not in doomed})
+    _bench("encode", lambda: mistake_keys.encode(as_set))
+    encoded = mistake_keys.encode(as_set)
+    _bench("decode", lambda: mistake_keys.decode(encoded))
+    assert mistake_keys.decode(encoded) == as_set
+
+    click.echo(f"セッションに入れたときの大きさ: JSON {list_size:,} バイト → {len(encoded):,} バイト")
+
+@app.cli.command("bench-adaptive")
+@click.option("--size", default=50000, show_default=True, help="単語数")
+@click.option("--draw", "k", default=20, show_default=True, help="1回に選ぶ語数")
+def bench_adaptive(size, k):
+    """おすすめ出題の重み計算と重み付き抽出の時間を測る（学習状況はランダムに作る）"""
+    import numpy as np
+    import adaptive
+    import progress_array
+
+    rng = np.random.default_rng(0)
+    word_ids = np.arange(1, size + 1)
+    array = np.zeros(size + 1, dtype=progress_array.DTYPE)
+    array['seen'] = rng.integers(0, 5, size + 1)
+    array['streak'] = np.where(array['seen'] > 0, rng.integers(0, 4, size + 1), 0)
+    array['day'] = progress_array.today() - rng.integers(0, 30, size + 1)
+    confusable = rng.random(size).astype(np.float32)
+
+    click.echo(f"{size} 語から {k} 語")
+    _bench("重み計算", lambda: adaptive.word_weights(array, word_ids, confusable), repeat=20)
+    weights = adaptive.word_weights(array, word_ids, confusable)
+    _bench("重み付き非復元抽出", lambda: adaptive.weighted_sample(weights, k, rng), repeat=20)
+    _bench("合計（重み計算 + 抽出）", lambda: adaptive.weighted_sample(adaptive.word_weights(array, word_ids, confusable), k, rng), repeat=20)
+    _bench("比較: random.sample（一様）", lambda: __import__("random").sample(range(size), k), repeat=20)
+
+    # 重みどおりに選ばれているかの簡単な確認（直近で間違えた語の割合）
+    picked = np.concatenate([adaptive.weighted_sample(weights, k, rng) for _ in range(200)])
+    weak = (array['seen'][word_ids] > 0) & (array['streak'][word_ids] == 0)
+    click.echo(f"直近で間違えた語の割合: 単語帳全体 {weak.mean():.1%} → 選ばれた語 {weak[picked].mean():.1%}")
+
+@app.cli.command("bench-asgi")
+@click.option("--clients", default=50, show_default=True, help="同時に入力している人数")
+@click.option("--keystrokes", default=40, show_default=True, help="1人あたりのキー入力（リクエスト）数")
+@click.option("--workers", default=4, show_default=True, help="同期モードのワーカー数（gunicorn -w 相当）")
+def bench_asgi(clients, keystrokes, workers):
+    """予測変換へのキー入力の連打を、同期ワーカー（WSGI）と ASGI の直接応答で比べる（プロセス内で計測）
+
+    測るのは予測変換だけ。クイズの回答・回答記録は ASGI でも Flask 側で同期のまま動くので、ここでは比べない
+    （回答の流れは bench-quiz で測る）。"""
+    import asyncio
+    import statistics
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app import User, current_vocab, suggestion_limiter
+    from asgi import SUGGESTION_PATH, application
+
+    # 全員を1人のユーザーで流すので、計測中は回数制限を外す
+    suggestion_limiter.rate, suggestion_limiter.burst = float("inf"), float("inf")
+
+    user = User.query.first()
+    if user is None:
+        click.echo("ユーザーがいません（flask seed などで作ってください）。")
+        return
+    serializer = app.session_interface.get_signing_serializer(app)
+    cookie = f"{app.config['SESSION_COOKIE_NAME']}={serializer.dumps({'_user_id': str(user.id), '_fresh': True})}"
+    with app.test_request_context():
+        words = [w for w in current_vocab().english if w][:clients]
+    # 1人1語を1文字ずつ打つ（"s", "sc", "sch", ... 打ち終わったらまた最初から）
+    typed = [[word[:i % len(word) + 1] for i in range(keystrokes)] for word in words]
+
+    def report(label, latencies, elapsed):
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        click.echo(f"  {label:<28} {len(latencies) / elapsed:8.0f} req/s  "
+                   f"p50 {statistics.median(latencies) * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms")
+
+    click.echo(f"{len(typed)} 人 × {keystrokes} 回のキー入力")
+
+    # 同期モード: ワーカー数だけ同時に処理でき、残りは待たされる
+    slots = threading.Semaphore(workers)
+    sync_latencies = []
+    def sync_client(queries):
+        client = app.test_client()
+        client.set_cookie(app.config["SESSION_COOKIE_NAME"], cookie.split("=", 1)[1])
+        for q in queries:
+            started = time.perf_counter()
+            with slots:
+                response = client.get(SUGGESTION_PATH, query_string={"q": q})
+            assert response.status_code == 200, response.status_code
+            sync_latencies.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(len(typed)) as pool:
+        list(pool.map(sync_client, typed))
+    report(f"WSGI（同期ワーカー {workers}）", sync_latencies, time.perf_counter() - started)
+
+    # ASGI: 1つのイベントループで直接返す
+    async def call(q):
+        messages = []
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+        async def send(message):
+            messages.append(message)
+        scope = {
+            "type": "http", "method": "GET", "path": SUGGESTION_PATH,
+            "query_string": f"q={q}".encode("utf-8"), "headers": [(b"cookie", cookie.encode("latin-1"))],
+        }
+        await application(scope, receive, send)
+        assert messages[0]["status"] == 200, messages[0]["status"]
+
+    asgi_latencies = []
+    async def asgi_client(queries):
+        for q in queries:
+            started = time.perf_counter()
+            await call(q)
+            asgi_latencies.append(time.perf_counter() - started)
+    async def run_all():
+        await asyncio.gather(*(asgi_client(queries) for queries in typed))
+    started = time.perf_counter()
+    asyncio.run(run_all())
+    report("ASGI（ワーカー 1）", asgi_latencies, time.perf_counter() - started)
+
+@app.cli.command("bench-fuzzy")
+@click.option("--size", default=50000, show_default=True, help="単語数（単語帳の英単語に架空の単語を足す）")
+@click.option("--queries", default=200, show_default=True, help="つづり間違いの入力の数")
+def bench_fuzzy(size, queries):
+    """「もしかして」検索を、削除辞書と全件の fuzz.ratio / Levenshtein で比べる"""
+    import random
+    import string
+    import Levenshtein
+    from fuzzywuzzy import fuzz
+    from app import current_vocab
+    from typo_index import TypoIndex
+
+    rng = random.Random(0)
+    with app.test_request_context():
+        words = list(dict.fromkeys(w.lower() for w in current_vocab().english if w))
+    while len(words) < size:
+        words.append("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 12))))
+    words = words[:size]
+
+    def typo(word):
+        # 1〜2文字を消す・足す・置き換える
+        for _ in range(rng.randint(1, 2)):
+            i = rng.randrange(len(word))
+            op = rng.choice("dis")
+            if op == "d" and len(word) > 3:
+                word = word[:i] + word[i + 1:]
+            elif op == "i":
+                word = word[:i] + rng.choice(string.ascii_lowercase) + word[i:]
+            else:
+                word = word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]
+        return word
+
+    targets = rng.sample([w for w in words if len(w) >= 5], min(queries, len(words)))
+    probes = [typo(w) for w in targets]
+
+    click.echo(f"{len(words)} 語、つづり間違いの入力 {len(probes)} 件")
+    index = None
+    def build():
+        nonlocal index
+        index = TypoIndex(words)
+    _bench("索引の作成", build, repeat=1)
+    click.echo(f"  （削除辞書のキー {len(index.deletes):,} 件）")
+    best = _bench(f"削除辞書 ×{len(probes)}", lambda: [index.lookup(q) for q in probes], repeat=5)
+    click.echo(f"  → 1件あたり {best / len(probes) * 1000:.3f} ms")
+    few = probes[:10]
+    best = _bench(f"全件 Levenshtein.distance ×{len(few)}", lambda: [min(words, key=lambda w: Levenshtein.distance(q, w)) for q in few], repeat=1)
+    click.echo(f"  → 1件あたり {best / len(few) * 1000:.3f} ms")
+    best = _bench(f"全件 fuzz.ratio ×{len(few)}", lambda: [max(words, key=lambda w: fuzz.ratio(q, w)) for q in few], repeat=1)
+    click.echo(f"  → 1件あたり {best / len(few) * 1000:.3f} ms")
+
+    # 元の単語が候補に入っているか（距離が2を超える間違いもあるので 100% にはならない）
+    hit = sum(target in [t for t, _ in index.lookup(q)] or target == q for target, q in zip(targets, probes))
+    within = sum(Levenshtein.distance(target, q) <= 2 for target, q in zip(targets, probes))
+    click.echo(f"元の単語が候補に入った割合: {hit / len(probes):.1%}（編集距離2以内の間違い {within / len(probes):.1%}）")
+
+@app.cli.command("bench-login")
+@click.option("--users", default=40, show_default=True, help="一斉にログインする人数")
+@click.option("--workers", default=1, show_default=True, help="ハッシュ用プロセスプールの大きさ")
+def bench_login(users, workers):
+    """一斉ログインの間に、ほかのリクエスト（単語検索）がどれだけ待たされるかを比べる"""
+    import statistics
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from app import current_vocab
+    from passwords import PasswordHasher
+
+    with app.test_request_context():
+        vocab = current_vocab()
+
+    def request():
+        # クイズ・検索の画面1回ぶんくらいの軽い処理
+        vocab.search_positions("st")
+
+    def p95(values):
+        values = sorted(values)
+        return values[max(int(len(values) * 0.95) - 1, 0)] * 1000
+
+    def run(label, hasher, pwhash):
+        latencies = []
+        stop = threading.Event()
+        def traffic():
+            while not stop.is_set():
+                started = time.perf_counter()
+                request()
+                latencies.append(time.perf_counter() - started)
+                time.sleep(0.005)
+        login_times = []
+        def login(_):
+            started = time.perf_counter()
+            assert hasher.verify_and_update(pwhash, "password")[0]
+            login_times.append(time.perf_counter() - started)
+        hasher.verify(pwhash, "password")  # プールの起動は計測に含めない
+        background = threading.Thread(target=traffic)
+        background.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(users) as pool:
+            list(pool.map(login, range(users)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        background.join()
+        hasher.shutdown()
+        click.echo(f"  {label:<34} 全員完了 {elapsed:6.2f} s  ログイン p95 {p95(login_times):8.0f} ms  "
+                   f"他のリクエスト p50 {statistics.median(latencies) * 1000:6.2f} ms / p95 {p95(latencies):7.2f} ms")
+
+    baseline = []
+    for _ in range(50):
+        started = time.perf_counter()
+        request()
+        baseline.append(time.perf_counter() - started)
+    click.echo(f"{users} 人が同時にログイン（他のリクエストの平常時 p50 {statistics.median(baseline) * 1000:.2f} ms）")
+    old = PasswordHasher("pbkdf2:sha256", workers=0)
+    run("pbkdf2:sha256、リクエスト内で計算", old, old.hash("password"))
+    new = PasswordHasher("scrypt", workers=0)
+    scrypt_hash = new.hash("password")
+    run("scrypt、リクエスト内で計算", new, scrypt_hash)
+    run(f"scrypt、プール（{workers} プロセス）", PasswordHasher("scrypt", workers=workers), scrypt_hash)
+
+@app.cli.command("import-users")
+@click.argument("csv_path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--workers", default=0, help="ハッシュ化に使うプロセス数（既定: CPU数）")
+@click.option("--batch-size", default=500, show_default=True, help="1回の INSERT で入れる行数")
+@click.option("--dry-run", is_flag=True, help="チェックだけして登録しない")
+def import_users(csv_path, workers, batch_size, dry_run):
+    """CSV（username,nickname,password[,is_admin]）からユーザーをまとめて登録する"""
+    import os
+    import time
+    import user_csv
+    from app import User, db, password_hasher, provision_users
+    from passwords import PasswordHasher
+
+    with open(csv_path, "rb") as f:
+        rows, errors = user_csv.parse(user_csv.decode(f.read()))
+    if dry_run:
+        taken = {u for (u,) in db.session.query(User.username).filter(User.username.in_([r.username for r in rows]))}
+        errors += [(r.line, r.username, "既に使用されているユーザー名です") for r in rows if r.username in taken]
+        created = len(rows) - len(taken)
+        click.echo(f"登録できる行: {created} 件（登録はしていません）")
+    else:
+        hasher = PasswordHasher(password_hasher.method, workers=workers or os.cpu_count() or 1)
+        started = time.perf_counter()
+        try:
+            created, more_errors = provision_users(rows, hasher, batch_size)
+        finally:
+            hasher.shutdown()
+        errors += more_errors
+        click.echo(f"✅ {created} 人を登録しました（{time.perf_counter() - started:.1f} 秒、{hasher.workers} プロセス）")
+    for line, username, message in sorted(errors):
+        click.echo(f"❌ {line}行目 {username}: {message}", err=True)
+    if errors:
+        raise SystemExit(1)
+
+@app.cli.command("seed")
+@click.option("--users", default=1000, show_default=True, help="作るユーザー数")
+@click.option("--attempts", default=1000000, show_default=True, help="作る回答履歴（quiz_attempts）の行数")
+@click.option("--messages", default=1000, show_default=True, help="作るお問い合わせの数")
+@click.option("--days", default=60, show_default=True, help="回答履歴を散らばらせる日数（今日まで）")
+@click.option("--words", default=0, help="この語数の単語帳を static/decks/<--deck>.xlsx に作る（0 なら作らない）")
+@click.option("--deck", default="seed", show_default=True, help="--words で作る単語帳の名前")
+@click.option("--prefix", default="seed", show_default=True, help="作るユーザーのユーザー名の頭")
+@click.option("--password", default="password", show_default=True, help="作るユーザー全員のパスワード")
+@click.option("--workers", default=0, help="回答履歴を作るプロセス数（既定: CPU数）")
+@click.option("--chunk-size", default=200000, show_default=True, help="1プロセスが1回に作る（COPY する）行数")
+@click.option("--random-seed", default=0, show_default=True, help="乱数の種（同じなら同じデータになる）")
+def seed(users, attempts, messages, days, words, deck, prefix, password, workers, chunk_size, random_seed):
+    """負荷試験用のダミーデータを入れる（ユーザー・回答履歴・学習状況・お問い合わせ・大きな単語帳）
+
+    回答履歴は複数プロセスで作り、PostgreSQL には各プロセスから COPY で、SQLite にはまとめて executemany で入れる。
+    既に同じユーザー名のユーザーがいれば作らずにそのまま使う（何度か実行すると回答履歴が足されていく）。"""
+    import os
+    import time
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    from datetime import datetime
+    from functools import partial
+    from multiprocessing import get_context
+    import numpy as np
+    from sqlalchemy import func, text
+    import progress_array
+    import seed_data
+    from app import ContactMessage, ProgressArray, QuizAttempt, User, Word, db, decks, password_hasher, sync_word_catalogue
+    from passwords import PasswordHasher
+    from vocab import load_snapshot
+
+    dialect = db.engine.dialect.name
+    if dialect not in ("postgresql", "sqlite"):
+        click.echo(f"{dialect} には対応していません（PostgreSQL / SQLite のみ）。")
+        raise SystemExit(2)
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+
+    if words:
+        path = os.path.join(decks.decks_dir, f"{deck}.xlsx")
+        os.makedirs(decks.decks_dir, exist_ok=True)
+        seed_data.write_vocabulary(path, words, random_seed)
+        click.echo(f"✅ {words:,} 語の単語帳を {path} に作りました")
+
+    # ユーザー（ハッシュ化は重いので1回だけ計算して全員に使う）
+    pwhash = PasswordHasher(password_hasher.method, workers=0).hash(password)
+    usernames = [f"{prefix}_admin"] + [f"{prefix}{i:06d}" for i in range(1, users + 1)]
+    taken = set()
+    for start in range(0, len(usernames), 5000):
+        batch = usernames[start:start + 5000]
+        taken.update(u for (u,) in db.session.query(User.username).filter(User.username.in_(batch)))
+    new_users = [
+        {'username': name, 'nickname': name, 'password': pwhash, 'is_admin': name == f"{prefix}_admin"}
+        for name in usernames if name not in taken
+    ]
+    for start in range(0, len(new_users), 5000):
+        db.session.execute(db.insert(User), new_users[start:start + 5000])
+    db.session.commit()
+    # 使うのはこの実行のユーザー名のユーザーだけ（今回作った人と、前回までに作った同じ名前の人）。
+    # LIKE で頭を比べると、番号の桁が増えたときや --prefix に % や _ があるときにずれるので、名前そのもので引く
+    ids_by_name = {}
+    for start in range(1, len(usernames), 5000):
+        batch = usernames[start:start + 5000]
+        ids_by_name.update(
+            db.session.query(User.username, User.id).filter(User.username.in_(batch), User.is_admin.is_(False))
+        )
+    user_ids = [ids_by_name[name] for name in usernames[1:] if name in ids_by_name]
+    click.echo(f"✅ ユーザー {len(new_users):,} 人を作りました（使うのは {len(user_ids):,} 人、管理者 {prefix}_admin）")
+    if not user_ids:
+        return
+    weights = seed_data.user_weights(len(user_ids), random_seed)
+
+    # 回答履歴
+    start_day = seed_data.start_of_range(days)
+    sizes = seed_data.chunk_sizes(attempts, chunk_size)
+    seeds = [random_seed * 100003 + i + 1 for i in range(len(sizes))]
+    loaded = 0
+    load_started = time.perf_counter()
+    # 索引は入れ終わってから作り直す（1行ずつ索引を更新するより、最後にまとめて作るほうがずっと速い）
+    indexes = list(QuizAttempt.__table__.indexes)
+    for index in indexes:
+        index.drop(db.engine, checkfirst=True)
+    try:
+        with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as pool:
+            if dialect == "postgresql":
+                # 各プロセスが自分の接続で COPY する（親は件数を数えるだけ）
+                url = db.engine.url.render_as_string(hide_password=False)
+                task = partial(seed_data.copy_attempts, url)
+            else:
+                task = seed_data.sqlite_attempts
+                connection = db.engine.raw_connection()
+                cursor = connection.cursor()
+                # 入れ終わるまでの間だけ fsync を省く（途中で落ちたら入れ直せばよいデータなので）
+                cursor.execute("PRAGMA synchronous = OFF")
+            def load(future):
+                nonlocal loaded
+                result = future.result()
+                if dialect == "postgresql":
+                    loaded += result
+                else:
+                    cursor.executemany("INSERT INTO quiz_attempts (user_id, timestamp) VALUES (?, ?)", result)
+                    connection.commit()
+                    loaded += len(result)
+                elapsed = time.perf_counter() - load_started
+                click.echo(f"  回答履歴 {loaded:,} / {attempts:,} 行（{loaded / max(elapsed, 1e-9):,.0f} 行/秒）")
+
+            # 先に全部投げると SQLite への書き込みが追いつかずにメモリを食うので、同時に抱える数を抑える
+            pending = deque()
+            for chunk_seed, size in zip(seeds, sizes):
+                pending.append(pool.submit(task, chunk_seed, size, user_ids, weights, start_day, days))
+                if len(pending) >= workers * 2:
+                    load(pending.popleft())
+            while pending:
+                load(pending.popleft())
+            if dialect == "sqlite":
+                cursor.execute("PRAGMA synchronous = FULL")
+                connection.close()
+    finally:
+        for index in indexes:
+            index.create(db.engine, checkfirst=True)
+    click.echo(f"✅ 回答履歴 {loaded:,} 行を入れました（{time.perf_counter() - load_started:.1f} 秒、{workers} プロセス）")
+
+    # 学習状況の配列（解いた量が多い人ほど多くの単語を学習済みにする）
+    for path in decks.available().values():
+        sync_word_catalogue(load_snapshot(path))  # 単語IDを振っておく
+    max_word_id = db.session.query(func.max(Word.id)).scalar()
+    if max_word_id:
+        rng = np.random.default_rng(random_seed)
+        today = progress_array.today()
+        per_user = weights * attempts
+        have = {
+            (user_id, direction) for user_id, direction in
+            db.session.query(ProgressArray.user_id, ProgressArray.direction).filter(ProgressArray.user_id.in_(user_ids))
+        }
+        rows = []
+        for user_id, answered in zip(user_ids, per_user.tolist()):
+            for direction in ("ej", "je"):
+                if (user_id, direction) in have:
+                    continue
+                array = np.zeros(max_word_id + 1, dtype=progress_array.DTYPE)
+                # 回答の半分ずつが各方向、1語あたり3回くらい解いているとして学習済みの語数を決める
+                learned = rng.random(len(array)) < min(answered / 2 / 3 / len(array), 1.0)
+                count = int(learned.sum())
+                array['seen'][learned] = rng.integers(1, 10, size=count)
+                array['streak'][learned] = np.minimum(array['seen'][learned], rng.integers(0, 5, size=count))
+                array['day'][learned] = today - rng.integers(0, days, size=count)
+                rows.append({'user_id': user_id, 'direction': direction, 'data': progress_array.dump(array),
+                             'updated_at': datetime.utcnow()})
+            if len(rows) >= 1000:
+                db.session.execute(db.insert(ProgressArray), rows)
+                rows = []
+        if rows:
+            db.session.execute(db.insert(ProgressArray), rows)
+        db.session.commit()
+        click.echo("✅ 学習状況の配列を作りました")
+
+    # お問い合わせ
+    rows = seed_data.message_rows(user_ids, messages, datetime.utcnow(), days, random_seed)
+    for start in range(0, len(rows), 5000):
+        db.session.execute(db.insert(ContactMessage), rows[start:start + 5000])
+    db.session.commit()
+    click.echo(f"✅ お問い合わせ {len(rows):,} 件を作りました")
+
+    # 入れたあとは統計を取り直す（古いままだと実行計画が小さいテーブル向けのままになる）
+    db.session.execute(text("ANALYZE"))
+    db.session.commit()
+    click.echo(f"✅ 完了しました（{time.perf_counter() - started:.1f} 秒）。パスワードはすべて「{password}」です。")
+
+def _bench_quiz_worker(user_ids, answers, barrier):
+    """bench-quiz の1プロセスぶん: ユーザーごとのスレッドで、ランダム出題のクイズを answers 問ずつ解く"""
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from app import attempt_writer
+
+    def login(user_id):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess["_user_id"] = str(user_id)
+            sess["_fresh"] = True
+        return client
+
+    def run(user_id):
+        latencies = []
+        # g のログイン情報を持ち越さないよう、ユーザーごとにアプリコンテキストを作る
+        with app.app_context():
+            client = login(user_id)
+            client.get("/start_new_random_quiz")
+            for _ in range(answers):
+                started = time.perf_counter()
+                status = client.post("/quiz", data={"user_answer": "x"}).status_code
+                latencies.append(time.perf_counter() - started)
+                if status >= 500:
+                    raise RuntimeError(f"/quiz が {status} を返しました")
+                client.get("/next_question")
+        return latencies
+
+    # 単語帳の読み込みなどは計測に含めない
+    with app.app_context():
+        login(user_ids[0]).get("/menu")
+    barrier.wait()
+    started = time.time()
+    with ThreadPoolExecutor(len(user_ids)) as pool:
+        latencies = [t for result in pool.map(run, user_ids) for t in result]
+    attempt_writer.flush()
+    return started, time.time(), latencies
+
+@app.cli.command("bench-quiz")
+@click.option("--users", default=16, show_default=True, help="同時に解く人数")
+@click.option("--answers", default=50, show_default=True, help="1人が解く問題数")
+@click.option("--processes", default=4, show_default=True, help="gunicorn のワーカー数に見立てるプロセス数")
+@click.option("--json", "as_json", is_flag=True, help="結果を JSON 1行で出す（bench-backends 用）")
+def bench_quiz(users, answers, processes, as_json):
+    """今の DB でクイズの回答（POST /quiz）を一斉に流し、1秒あたりの回答数を測る（使い捨ての DB で実行する）"""
+    import json
+    import statistics
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import Manager, get_context
+    from app import ATTEMPT_BATCH_SIZE, QuizAttempt, User, password_hasher
+    from passwords import PasswordHasher
+
+    db.create_all()
+    names = [f"bench{i:04d}" for i in range(1, users + 1)]
+    taken = {u for (u,) in db.session.query(User.username).filter(User.username.in_(names))}
+    pwhash = PasswordHasher(password_hasher.method, workers=0).hash("password")
+    new_users = [{'username': name, 'nickname': name, 'password': pwhash, 'is_admin': False} for name in names if name not in taken]
+    if new_users:
+        db.session.execute(db.insert(User), new_users)
+    db.session.commit()
+    user_ids = [i for (i,) in db.session.query(User.id).filter(User.username.in_(names)).order_by(User.id)]
+    before = QuizAttempt.query.count()
+    db.session.commit()
+
+    processes = max(1, min(processes, users))
+    groups = [user_ids[i::processes] for i in range(processes)]
+    with Manager() as manager, ProcessPoolExecutor(processes, mp_context=get_context("spawn")) as pool:
+        barrier = manager.Barrier(processes)
+        results = list(pool.map(_bench_quiz_worker, groups, [answers] * processes, [barrier] * processes))
+    elapsed = max(end for _, end, _ in results) - min(start for start, _, _ in results)
+    latencies = sorted(t for _, _, result in results for t in result)
+    recorded = QuizAttempt.query.count() - before
+
+    summary = {
+        'backend': db.engine.dialect.name,
+        'batch_size': ATTEMPT_BATCH_SIZE,
+        'answers': len(latencies),
+        'recorded': recorded,
+        'seconds': elapsed,
+        'per_second': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000,
+    }
+    if as_json:
+        click.echo(json.dumps(summary))
+        return
+    click.echo(f"{summary['backend']}（回答記録を {summary['batch_size'] or 'ためずに'} {'行ずつまとめて' if summary['batch_size'] else ''}書く）"
+               f" {processes} プロセス・{users} 人 × {answers} 問")
+    click.echo(f"  {summary['per_second']:8.1f} 回答/秒  p50 {summary['p50_ms']:7.2f} ms  p95 {summary['p95_ms']:7.2f} ms"
+               f"  （記録された回答 {recorded} 件）")
+
+@app.cli.command("bench-backends")
+@click.option("--postgres-url", envvar="BENCH_POSTGRES_URL", default=None,
+              help="使い捨ての PostgreSQL の URL（無ければ SQLite だけ測る。中のテーブルに書き込むので本番には向けないこと）")
+@click.option("--sqlite-path", default="/tmp/tango_bench.db", show_default=True, help="測るたびに作り直す SQLite のファイル")
+@click.option("--users", default=16, show_default=True)
+@click.option("--answers", default=50, show_default=True)
+@click.option("--processes", default=4, show_default=True)
+def bench_backends(postgres_url, sqlite_path, users, answers, processes):
+    """同じクイズの流れ（bench-quiz）を PostgreSQL と SQLite で、回答記録をためる/ためないの両方で測って比べる
+
+    バックエンドごとに DATABASE_URL を変えて別プロセスで起動する。"""
+    import json
+    import os
+    import subprocess
+    import sys
+
+    backends = [("SQLite", f"sqlite:///{os.path.abspath(sqlite_path)}")]
+    if postgres_url:
+        backends.insert(0, ("PostgreSQL", postgres_url))
+    else:
+        click.echo("--postgres-url（BENCH_POSTGRES_URL）が無いので、SQLite だけ測ります。")
+
+    click.echo(f"{processes} プロセス・{users} 人 × {answers} 問")
+    for label, url in backends:
+        for batch_size in ("0", "200"):
+            if url.startswith("sqlite"):
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(sqlite_path + suffix):
+                        os.remove(sqlite_path + suffix)
+            env = {**os.environ, "DATABASE_URL": url, "ATTEMPT_BATCH_SIZE": batch_size, "PASSWORD_HASH_WORKERS": "0"}
+            proc = subprocess.run(
+                [sys.executable, "-m", "flask", "--app", "manage", "bench-quiz", "--json",
+                 "--users", str(users), "--answers", str(answers), "--processes", str(processes)],
+                env=env, capture_output=True, text=True,
+            )
+            name = f"{label}、回答記録を{'1問ずつ書く' if batch_size == '0' else f'{batch_size}行ずつまとめて書く'}"
+            if proc.returncode != 0:
+                click.echo(f"  ❌ {name}: 失敗しました\n{proc.stderr[-2000:]}")
+                continue
+            summary = json.loads(proc.stdout.strip().splitlines()[-1])
+            click.echo(f"  {name:<36} {summary['per_second']:8.1f} 回答/秒  p50 {summary['p50_ms']:7.2f} ms  "
+                       f"p95 {summary['p95_ms']:7.2f} ms  （記録 {summary['recorded']}/{summary['answers']}）")
@@ -0,0 +1,41 @@
+"""Word catalogue with stable ids
+
+Revision ID: 3f9c2a7d1b44
+Revises: e96d01ab90b2
+Create Date: 2026-10-19 10:12:41.503118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d1b44'
+down_revision = 'e96d01ab90b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('words',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('english', sa.String(length=200), nullable=False),
+    sa.Column('japanese', sa.Text(), nullable=False),
+    sa.Column('content_hash', sa.String(length=40), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('content_hash')
+    )
+    op.create_table('word_id_remaps',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('old_id', sa.Integer(), nullable=False),
+    sa.Column('new_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('old_id')
+    )
+
+
+def downgrade():
+    op.drop_table('word_id_remaps')
+    op.drop_table('words')
@@ -0,0 +1,44 @@
+"""Indexes for quiz_attempts and contact_messages
+
+Revision ID: b8e2f4a61c93
+Revises: 7a3c5e9f1d2b
+Create Date: 2026-10-19 22:03:41.118257
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e2f4a61c93'
+down_revision = '7a3c5e9f1d2b'
+branch_labels = None
+depends_on = None
+
+# quiz_attempts は大きいので、PostgreSQL では書き込みを止めない CONCURRENTLY で作る
+# （トランザクションの外で実行する必要があるので autocommit_block に入れる）
+INDEXES = [
+    ('ix_quiz_attempts_user_timestamp', 'quiz_attempts', ['user_id', 'timestamp'], {}),
+    ('ix_quiz_attempts_timestamp_user', 'quiz_attempts', ['timestamp', 'user_id'], {}),
+    ('ix_contact_messages_user_id', 'contact_messages', ['user_id'], {}),
+    ('ix_contact_messages_open_timestamp', 'contact_messages', ['timestamp'], {
+        'postgresql_where': sa.text('is_deleted = false'),
+        'sqlite_where': sa.text('is_deleted = 0'),
+    }),
+]
+
+
+def _concurrently():
+    return {'postgresql_concurrently': True} if op.get_bind().dialect.name == 'postgresql' else {}
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in INDEXES:
+            op.create_index(name, table, columns, unique=False, **kwargs, **_concurrently())
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, **_concurrently())
@@ -0,0 +1,41 @@
+"""Keep word_progress per deck
+
+Revision ID: d3a7c91f5b20
+Revises: b8e2f4a61c93
+Create Date: 2026-10-20 10:12:37.504118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a7c91f5b20'
+down_revision = 'b8e2f4a61c93'
+branch_labels = None
+depends_on = None
+
+# range_stats はデッキごとなので、差分のもとになる「最後の正誤」もデッキごとにする。
+# これまでの行はどのデッキで解いたか分からないので既定のデッキ（default）の分として残す。
+# ほかのデッキの範囲別の集計は、そのデッキで次に答えたときから、そのデッキの正誤で数え直される。
+
+
+def upgrade():
+    with op.batch_alter_table('word_progress') as batch_op:
+        batch_op.add_column(sa.Column('deck', sa.String(length=100), nullable=False, server_default='default'))
+        batch_op.drop_constraint('uq_word_progress_user_word_direction', type_='unique')
+        batch_op.create_unique_constraint('uq_word_progress_user_deck_word_direction', ['user_id', 'deck', 'word_id', 'direction'])
+
+
+def downgrade():
+    # デッキごとの行を1つにまとめてから（一番新しい回答を残す）元の一意制約に戻す
+    op.execute(
+        "DELETE FROM word_progress WHERE id IN ("
+        " SELECT a.id FROM word_progress a JOIN word_progress b"
+        " ON a.user_id = b.user_id AND a.word_id = b.word_id AND a.direction = b.direction"
+        " AND (a.updated_at < b.updated_at OR (a.updated_at = b.updated_at AND a.id < b.id)))"
+    )
+    with op.batch_alter_table('word_progress') as batch_op:
+        batch_op.drop_constraint('uq_word_progress_user_deck_word_direction', type_='unique')
+        batch_op.create_unique_constraint('uq_word_progress_user_word_direction', ['user_id', 'word_id', 'direction'])
+        batch_op.drop_column('deck')
@@ -0,0 +1,73 @@
+# mistake_keys.py
+# 進行中クイズの間違い（単語ID・方向）を整数1つで扱う
+#
+# 単語IDと方向を (word_id << 1) | 方向ビット に詰めた整数を set で持つので、
+# 追加・削除・有無の確認は O(1)、重複除去や合併は set 演算で O(n) になる。
+# セッションには差分を可変長整数にしたバイト列（base64）で入れる（辞書のリストの数分の1の大きさ）。
+import base64
+
+DIRECTION_BITS = {'ej': 0, 'je': 1}
+DIRECTIONS = ('ej', 'je')
+
+
+def pack(word_id, direction):
+    return (word_id << 1) | DIRECTION_BITS[direction]
+
+
+def unpack(key):
+    """整数から (単語ID, 方向) に戻す"""
+    return key >> 1, DIRECTIONS[key & 1]
+
+
+def word_ids(keys):
+    """方向を問わない単語IDの集合"""
+    return {key >> 1 for key in keys}
+
+
+def to_refs(keys):
+    """{'idx': 単語ID, 'dir': 方向} のリスト（単語ID順）"""
+    return [{'idx': key >> 1, 'dir': DIRECTIONS[key & 1]} for key in sorted(keys)]
+
+
+def encode(keys):
+    """整数の集合を、昇順の差分を LEB128 で並べたバイト列の base64 文字列にする"""
+    out = bytearray()
+    previous = 0
+    for key in sorted(keys):
+        delta = key - previous
+        previous = key
+        while delta >= 0x80:
+            out.append((delta & 0x7F) | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return base64.urlsafe_b64encode(bytes(out)).decode('ascii')
+
+
+def decode(value):
+    """encode() の結果を集合に戻す。古い形式（{'idx', 'dir'} のリスト）もそのまま読める"""
+    if not value:
+        return set()
+    if isinstance(value, list):
+        return {pack(m['idx'], m['dir']) for m in value}
+    keys = set()
+    key = shift = delta = 0
+    for byte in base64.urlsafe_b64decode(value):
+        delta |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        key += delta
+        keys.add(key)
+        delta = shift = 0
+    return keys
+
+
+def remap(value, fn):
+    """詰めた値の単語IDを fn で置き換える（fn が None を返したものは取り除く）"""
+    keys = set()
+    for key in decode(value):
+        word_id, direction = unpack(key)
+        new_id = fn(word_id)
+        if new_id is not None:
+            keys.add(pack(new_id, direction))
+    return encode(keys)
@@ -0,0 +1,123 @@
+# passwords.py
+# パスワードのハッシュ化・照合を、専用のプロセスプールで行う
+#
+# ハッシュ化はわざと重い処理（1回 0.1〜0.5 秒）なので、授業の始めに全員が一斉にログインすると
+# ワーカーの CPU がログインに取られて、クイズの画面まで止まってしまう。
+# - 照合・ハッシュ化は上限付きのプロセスプール（既定 1 プロセス）に回し、同時に走る数を抑える
+#   （待っている間ワーカーのスレッドは GIL を手放すので、他のリクエストは進む）
+# - プールの待ち行列も上限付き。一定時間待っても空かなければ「混み合っています」を返す
+# - ハッシュの方式は設定で変えられる（既定は scrypt。pbkdf2:sha256 の 100 万回より軽くて強い）。
+#   古い方式・パラメータのハッシュは、ログインに成功したときに今の方式で作り直す
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = "scrypt"
+
+
+class HashPoolBusy(Exception):
+    """待ち行列がいっぱいで、照合を受け付けられなかった"""
+
+
+def _method_of(pwhash):
+    """保存されたハッシュの方式とパラメータ（例: "scrypt:32768:8:1"）"""
+    return pwhash.split("$", 1)[0] if pwhash else ""
+
+
+class PasswordHasher:
+    """パスワードのハッシュ化・照合。workers=0 ならプールを使わずその場で計算する"""
+
+    def __init__(self, method=DEFAULT_METHOD, workers=1, max_pending=64, wait_timeout=10.0):
+        self.method = method
+        self.workers = workers
+        self.wait_timeout = wait_timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self._canonical_method = None
+        self.rehashed = 0
+        self.busy = 0
+
+    def _executor(self):
+        # プロセスはワーカーごとに、最初に使うときに作る（gunicorn の fork 前に作ると引き継がれてしまう）
+        # spawn で起動するので、アプリのスレッドや DB 接続は子プロセスに持ち込まれない
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=get_context("spawn"))
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            self.busy += 1
+            raise HashPoolBusy()
+        try:
+            return self._executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def hash_many(self, passwords):
+        """まとめてハッシュ化する（一括登録用。プールの全プロセスに分けて並列に計算する）
+
+        1件ずつ待ち行列の枠を取り、同時に流すのはプロセス数までにする。
+        プールの待ち行列を一括登録で埋めないので、その間のログインも間に挟まって進む。"""
+        passwords = list(passwords)
+        if self.workers <= 0:
+            return [generate_password_hash(p, self.method) for p in passwords]
+        in_flight = threading.BoundedSemaphore(self.workers)
+        futures = []
+        try:
+            for password in passwords:
+                in_flight.acquire()
+                self._slots.acquire()
+                try:
+                    future = self._executor().submit(generate_password_hash, password, self.method)
+                except BaseException:
+                    self._slots.release()
+                    in_flight.release()
+                    raise
+                future.add_done_callback(lambda _: (self._slots.release(), in_flight.release()))
+                futures.append(future)
+            return [future.result() for future in futures]
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def verify(self, pwhash, password):
+        if not pwhash or password is None:
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    @property
+    def canonical_method(self):
+        """設定の方式を、保存されるときの形（既定のパラメータ込み）にしたもの"""
+        if self._canonical_method is None:
+            self._canonical_method = _method_of(generate_password_hash("", self.method))
+        return self._canonical_method
+
+    def needs_rehash(self, pwhash):
+        return _method_of(pwhash) != self.canonical_method
+
+    def verify_and_update(self, pwhash, password):
+        """(照合結果, 作り直したハッシュ)。作り直しが不要なら2つ目は None"""
+        if not self.verify(pwhash, password):
+            return False, None
+        if not self.needs_rehash(pwhash):
+            return True, None
+        self.rehashed += 1
+        return True, self.hash(password)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=True)
+            self._pool = None
@@ -0,0 +1,97 @@
+# progress_array.py
+# ユーザー・出題方向ごとの「単語ごとの学習状況」を1本の配列で持つ
+#
+# 単語IDを添字にした NumPy の構造化配列（1語4バイト）を、そのままバイト列で DB に入れる。
+#   seen   : 出題された回数（255 で頭打ち）
+#   streak : 連続正解数（間違えると 0。255 で頭打ち）
+#   day    : 最後に出題された日（EPOCH からの日数）
+# 1回のクエリで読み、回答ごとに該当の要素だけ書き換える。
+# 「何語習得したか」などの集計は、単語帳の単語IDで配列を引いてまとめて数える（履歴を辿らない）。
+from datetime import date
+
+import numpy as np
+
+DTYPE = np.dtype([('seen', 'u1'), ('streak', 'u1'), ('day', '<u2')])
+EPOCH = date(2020, 1, 1)
+# 配列を伸ばすときの刻み（単語が1語増えるたびに作り直さないように）
+GROW_STEP = 1024
+
+
+def today(now=None):
+    return ((now or date.today()) - EPOCH).days
+
+
+def load(data):
+    """DB のバイト列から配列を作る（書き換えられるようにコピーする）"""
+    if not data:
+        return np.zeros(0, dtype=DTYPE)
+    return np.frombuffer(data, dtype=DTYPE).copy()
+
+
+def dump(array):
+    return array.tobytes()
+
+
+def _grow(array, size):
+    if size <= len(array):
+        return array
+    grown = np.zeros(-(-size // GROW_STEP) * GROW_STEP, dtype=DTYPE)
+    grown[:len(array)] = array
+    return grown
+
+
+def record(array, results, day=None, max_word_id=None):
+    """回答結果 [(単語ID, 正誤), ...] を反映した配列を返す（足りなければ伸ばす）
+
+    max_word_id（単語カタログの最大のID）を渡すと、それより大きいIDは無視する（配列をそこまでしか伸ばさない）。"""
+    results = [(word_id, correct) for word_id, correct in results
+               if word_id >= 0 and (max_word_id is None or word_id <= max_word_id)]
+    if not results:
+        return array
+    day = today() if day is None else day
+    array = _grow(array, max(word_id for word_id, _ in results) + 1)
+    seen, streak, days = array['seen'], array['streak'], array['day']
+    for word_id, correct in results:
+        if seen[word_id] < 255:
+            seen[word_id] += 1
+        if not correct:
+            streak[word_id] = 0
+        elif streak[word_id] < 255:
+            streak[word_id] += 1
+        days[word_id] = day
+    return array
+
+
+def remap(array, mapping):
+    """単語IDの統合 {旧ID: 新ID} を反映する（新IDが未出題なら旧IDの状況を引き継ぐ）"""
+    array = _grow(array, max(mapping.values(), default=-1) + 1)
+    for old_id, new_id in mapping.items():
+        if old_id >= len(array):
+            continue
+        if array['seen'][new_id] == 0:
+            array[new_id] = array[old_id]
+        array[old_id] = 0
+    return array
+
+
+def take(array, word_ids):
+    """単語ID順の配列（範囲外の単語は未学習として0）"""
+    word_ids = np.asarray(word_ids, dtype=np.int64)
+    out = np.zeros(len(word_ids), dtype=DTYPE)
+    inside = word_ids < len(array)
+    out[inside] = array[word_ids[inside]]
+    return out
+
+
+def summary(array, word_ids, mastered_streak=1):
+    """単語帳全体の {'total', 'seen', 'mastered', 'weak'}（weak は出題済みで直近を間違えている語）"""
+    rows = take(array, word_ids)
+    seen = rows['seen'] > 0
+    mastered = rows['streak'] >= mastered_streak
+    return {
+        'total': len(rows),
+        'seen': int(seen.sum()),
+        'mastered': int(mastered.sum()),
+        'weak': int((seen & ~mastered).sum()),
+    }
+
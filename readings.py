@@ -0,0 +1,61 @@
+# readings.py
+# 日本語訳の「読み」（ひらがな・ローマ字）の保存形式と正規化
+#
+# 読みは generate_readings.py で前もって作り、static/word_readings.json に
+#   {"readings": {"学生": ["がくせい", "gakusei"], ...}}
+# の形で入れておく（キーは訳語セル全体と「、」区切りの各訳）。
+# アプリは読み込むだけなので、本番に形態素解析の辞書は要らない。
+import json
+import os
+import re
+import unicodedata
+
+READINGS_PATH = "static/word_readings.json"
+
+_KATAKANA = re.compile(r"[ァ-ヶ]")
+# 読みの比較では括弧・句読点・空白などは無視する
+_NOT_KANA = re.compile(r"[^\wー]+")
+_NOT_ROMAJI = re.compile(r"[^0-9a-z]+")
+
+
+def to_hiragana(text):
+    return _KATAKANA.sub(lambda m: chr(ord(m.group(0)) - 0x60), text)
+
+
+def normalize_kana(text):
+    """読みの比較用（全角・半角をそろえ、カタカナはひらがなにする。長音はそのまま）"""
+    return _NOT_KANA.sub("", to_hiragana(unicodedata.normalize("NFKC", str(text)).lower()))
+
+
+def normalize_romaji(text):
+    """ローマ字の比較用（小文字にし、空白や記号を除く）"""
+    return _NOT_ROMAJI.sub("", unicodedata.normalize("NFKC", str(text)).lower())
+
+
+def normalize_query(query):
+    """入力を読みの索引の引き方にそろえる（英字ならローマ字、それ以外はひらがな）"""
+    text = unicodedata.normalize("NFKC", str(query)).strip()
+    if text.isascii():
+        return normalize_romaji(text)
+    return normalize_kana(text)
+
+
+def load_readings(path=READINGS_PATH):
+    """{テキスト: (ひらがな, ローマ字)}。ファイルが無ければ空（読みでの検索は無効になるだけ）"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f).get("readings", {})
+    except (OSError, ValueError) as e:
+        print(f"❌ エラー: 読みのファイルを読み込めませんでした: {e}")
+        return {}
+    return {text: (kana, romaji) for text, (kana, romaji) in raw.items()}
+
+
+def write_readings(readings, path=READINGS_PATH):
+    """一時ファイル経由で書き出す（途中状態を読ませない）"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"readings": {text: list(r) for text, r in sorted(readings.items())}}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
@@ -0,0 +1,140 @@
+# render_cache.py
+# テンプレート描画まわりのキャッシュ
+#
+# - 起動時に全テンプレートをコンパイルし、バイトコードをディスクに置く
+#   （同じマシンの gunicorn ワーカー同士で共有されるので、2つ目以降はコンパイル不要）
+# - 範囲一覧のカードのような、ユーザーによらず同じになる部分の HTML をキャッシュする
+# - 中身が変わっていないページには ETag で 304 を返す（描画そのものを省く）
+# - 行数の多い一覧は、描いた分から順に送る（最初のバイトまでの時間が件数によらない）
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from flask import Response, get_flashed_messages, make_response, request, session, stream_with_context
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "tanngo_jinja_cache")
+
+
+class FragmentCache:
+    """描画済み HTML 断片の LRU キャッシュ。テンプレートからは ``{% call cached_fragment(...) %}`` で使う"""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, name, *key, caller):
+        cache_key = (name,) + key
+        with self._lock:
+            html = self._entries.get(cache_key)
+            if html is not None:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return html
+            self.misses += 1
+        # 描画はロックの外で（同時に描いても結果は同じなので、後勝ちでよい）
+        html = Markup(caller())
+        with self._lock:
+            self._entries[cache_key] = html
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _templates_version(app):
+    """テンプレート一式の更新時刻から作るバージョン（デプロイし直すと ETag が変わる）"""
+    h = hashlib.sha1()
+    for name in sorted(app.jinja_env.list_templates()):
+        path = os.path.join(app.root_path, app.template_folder, name)
+        try:
+            h.update(f"{name}:{os.path.getmtime(path)}".encode("utf-8"))
+        except OSError:
+            pass
+    return h.hexdigest()[:12]
+
+
+def init_render_cache(app, cache_dir=DEFAULT_CACHE_DIR, precompile=True, fragment_entries=2048):
+    """バイトコードキャッシュと断片キャッシュを組み込み、必要なら全テンプレートを先にコンパイルする"""
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    fragments = FragmentCache(fragment_entries)
+    app.jinja_env.globals["cached_fragment"] = fragments
+    app.extensions["render_cache"] = {
+        "fragments": fragments,
+        "templates_version": _templates_version(app),
+    }
+    if precompile:
+        compiled = 0
+        for name in app.jinja_env.list_templates(extensions=["html"]):
+            app.jinja_env.get_template(name)
+            compiled += 1
+        print(f"✅ テンプレートを {compiled} 件コンパイルしました（{cache_dir}）")
+    return fragments
+
+
+def etag_for(app, *parts):
+    """ページの中身を決める値から ETag を作る（テンプレートのバージョンも含める）"""
+    version = app.extensions.get("render_cache", {}).get("templates_version", "")
+    raw = json.dumps([version, *parts], default=str, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+
+def render_if_modified(app, parts, render):
+    """ETag が一致すれば描画せずに 304 を返す。一致しなければ ``render()`` の結果に ETag を付けて返す
+
+    表示待ちの flash メッセージがあるときは、必ず描画する（表示しないと消えないため）。"""
+    etag = etag_for(app, *parts)
+    # 圧縮時に弱い ETag に変わるので、弱い比較で照合する
+    if not session.get("_flashes") and request.if_none_match.contains_weak(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag)
+    # ユーザーごとのページなので共有キャッシュには置かせず、毎回確認させる
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+class LazyRows:
+    """件数だけ先に分かっていて、行は描画しながら1件ずつ作る一覧（テンプレートの |length や if にも使える）"""
+
+    def __init__(self, keys, make_row):
+        self.keys = keys
+        self.make_row = make_row
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __bool__(self):
+        return len(self.keys) > 0
+
+    def __iter__(self):
+        for key in self.keys:
+            yield self.make_row(key)
+
+
+def stream_page(app, template_name, buffer_size=20, **context):
+    """テンプレートを少しずつ描画して送るレスポンス
+
+    ヘッダー（セッションの Cookie）を送った後はセッションを変更できないので、
+    flash メッセージはここで先に取り出しておく（テンプレート側の呼び出しはこの結果を返す）。"""
+    get_flashed_messages(with_categories=True)
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    # 細かすぎる書き込みを避けるため、ある程度まとめて送る
+    stream.enable_buffering(buffer_size)
+    return Response(stream_with_context(stream), mimetype="text/html")
@@ -0,0 +1,163 @@
+# seed_data.py
+# 負荷試験用のダミーデータ（ユーザー・回答履歴・お問い合わせ・大きな単語帳）を作る
+#
+# flask seed から使う。回答履歴は件数が桁違いに多い（数千万行）ので、
+# - 行はワーカープロセスが NumPy でまとめて作る（プロセスごとに乱数の種を変える）
+# - Postgres には各ワーカーが自分の接続から COPY FROM STDIN で直接流し込む
+# - SQLite は書き込めるのが1接続だけなので、ワーカーが作った行を親プロセスが executemany で入れる
+# 回答の時刻は本物の使われ方に寄せる（日本時間の朝・昼休み・放課後〜夜に多く、深夜はほぼ無し。
+# 土日は少なめ。よく解く人とほとんど解かない人の差が大きい）。
+# このモジュールはアプリ（app.py）を import しない（spawn で起動するワーカーが軽く済むように）。
+import io
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# 日本時間の時刻ごとの回答の多さ（0時〜23時）
+HOURLY_WEIGHTS = np.array([
+    1, 0.5, 0.2, 0.1, 0.1, 0.3, 1, 3, 6, 4, 3, 3,
+    7, 6, 3, 4, 7, 9, 8, 8, 10, 10, 7, 3,
+], dtype=float)
+HOURLY_WEIGHTS /= HOURLY_WEIGHTS.sum()
+# 月〜日
+WEEKDAY_WEIGHTS = np.array([1.0, 1.0, 1.0, 1.0, 0.9, 0.5, 0.6])
+# DB の時刻は UTC（datetime.utcnow）で入っているので、日本時間からずらす
+TZ_OFFSET_HOURS = 9
+
+MESSAGE_SUBJECTS = ["単語の訳について", "ログインできません", "クイズの不具合", "要望", "その他"]
+MESSAGE_BODIES = [
+    "訳が間違っていると思います。確認をお願いします。",
+    "パスワードを忘れてしまいました。",
+    "答えを入力しても次の問題に進みません。",
+    "苦手な単語だけを出題する機能がほしいです。",
+    "いつも使っています。ありがとうございます。",
+]
+
+# 単語帳用の音節（英字とカタカナ）
+_SYLLABLES = [
+    ("ka", "カ"), ("ki", "キ"), ("ku", "ク"), ("ke", "ケ"), ("ko", "コ"),
+    ("sa", "サ"), ("shi", "シ"), ("su", "ス"), ("se", "セ"), ("so", "ソ"),
+    ("ta", "タ"), ("chi", "チ"), ("tsu", "ツ"), ("te", "テ"), ("to", "ト"),
+    ("na", "ナ"), ("ni", "ニ"), ("nu", "ヌ"), ("ne", "ネ"), ("no", "ノ"),
+    ("ma", "マ"), ("mi", "ミ"), ("mu", "ム"), ("me", "メ"), ("mo", "モ"),
+    ("ra", "ラ"), ("ri", "リ"), ("ru", "ル"), ("re", "レ"), ("ro", "ロ"),
+    ("ba", "バ"), ("bi", "ビ"), ("bu", "ブ"), ("be", "ベ"), ("bo", "ボ"),
+    ("la", "ラ"), ("li", "リ"), ("ven", "ベン"), ("ter", "ター"), ("ston", "ストン"),
+]
+
+
+def user_weights(n_users, seed=0):
+    """ユーザーごとの解く量の重み（対数正規分布。一部のユーザーが大半を解く）"""
+    rng = np.random.default_rng(seed)
+    weights = rng.lognormal(mean=0.0, sigma=1.5, size=n_users)
+    return weights / weights.sum()
+
+
+def day_weights(start, days):
+    """start から days 日分の、日ごとの回答の多さ（土日は少なめ）"""
+    weekdays = (np.arange(days) + start.weekday()) % 7
+    weights = WEEKDAY_WEIGHTS[weekdays]
+    return weights / weights.sum()
+
+
+def attempt_rows(seed, size, user_ids, weights, start, days):
+    """(ユーザーIDの配列, UTC の時刻の文字列の配列) を size 行ぶん作る"""
+    rng = np.random.default_rng(seed)
+    users = rng.choice(np.asarray(user_ids), size=size, p=weights)
+    day = rng.choice(days, size=size, p=day_weights(start, days))
+    hour = rng.choice(24, size=size, p=HOURLY_WEIGHTS)
+    # 日本時間の 0:00 を基準にした秒数 -> UTC
+    seconds = day * 86400 + (hour - TZ_OFFSET_HOURS) * 3600 + rng.integers(0, 3600, size=size)
+    # 今日の分は今より先の時刻にならないように
+    seconds = np.minimum(seconds, int((datetime.utcnow() - datetime(start.year, start.month, start.day)).total_seconds()))
+    base = np.datetime64(start.strftime("%Y-%m-%d"), "s")
+    stamps = np.datetime_as_string(base + seconds.astype("timedelta64[s]"), unit="s")
+    return users, np.char.replace(stamps, "T", " ")
+
+
+def copy_attempts(database_url, seed, size, user_ids, weights, start, days):
+    """ワーカー用: 作った行を Postgres に COPY で入れる。入れた行数を返す"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import NullPool
+
+    users, stamps = attempt_rows(seed, size, user_ids, weights, start, days)
+    buffer = io.StringIO()
+    for user_id, stamp in zip(users.tolist(), stamps.tolist()):
+        buffer.write(f"{user_id}\t{stamp}\n")
+    engine = create_engine(database_url, poolclass=NullPool)
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        sql = "COPY quiz_attempts (user_id, timestamp) FROM STDIN"
+        if hasattr(cursor, "copy"):  # psycopg 3
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+        else:  # psycopg2
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+        connection.commit()
+    finally:
+        connection.close()
+        engine.dispose()
+    return size
+
+
+def sqlite_attempts(seed, size, user_ids, weights, start, days):
+    """ワーカー用: executemany にそのまま渡せる [(ユーザーID, 時刻), ...] を返す"""
+    users, stamps = attempt_rows(seed, size, user_ids, weights, start, days)
+    # SQLAlchemy が SQLite の DateTime を入れるときと同じ形（マイクロ秒まで）
+    return list(zip(users.tolist(), [stamp + ".000000" for stamp in stamps.tolist()]))
+
+
+def chunk_sizes(total, chunk_size):
+    sizes = [chunk_size] * (total // chunk_size)
+    if total % chunk_size:
+        sizes.append(total % chunk_size)
+    return sizes
+
+
+def message_rows(user_ids, size, now, days, seed=0):
+    """お問い合わせの行（insert にそのまま渡せる dict のリスト。1割ほどは削除済み）"""
+    rng = np.random.default_rng(seed)
+    users = rng.choice(np.asarray(user_ids), size=size)
+    offsets = rng.integers(0, days * 86400, size=size)
+    subjects = rng.integers(0, len(MESSAGE_SUBJECTS), size=size)
+    bodies = rng.integers(0, len(MESSAGE_BODIES), size=size)
+    deleted = rng.random(size) < 0.1
+    return [
+        {'user_id': user_id, 'subject': MESSAGE_SUBJECTS[s], 'body': MESSAGE_BODIES[b],
+         'timestamp': now - timedelta(seconds=offset), 'is_deleted': is_deleted}
+        for user_id, offset, s, b, is_deleted in zip(
+            users.tolist(), offsets.tolist(), subjects.tolist(), bodies.tolist(), deleted.tolist())
+    ]
+
+
+def vocabulary(size, seed=0):
+    """(英語, 日本語) を size 語ぶん作る（2〜4音節の作り語。英語は重複しない）"""
+    rng = np.random.default_rng(seed)
+    words = {}
+    while len(words) < size:
+        lengths = rng.integers(2, 5, size=size)
+        picks = rng.integers(0, len(_SYLLABLES), size=int(lengths.sum()))
+        pos = 0
+        for length in lengths.tolist():
+            syllables = [_SYLLABLES[i] for i in picks[pos:pos + length].tolist()]
+            pos += length
+            english = "".join(s[0] for s in syllables)
+            if english not in words:
+                words[english] = "".join(s[1] for s in syllables)
+                if len(words) >= size:
+                    break
+    return list(words.items())
+
+
+def write_vocabulary(path, size, seed=0):
+    import pandas as pd
+
+    pd.DataFrame(vocabulary(size, seed), columns=["English", "Japanese"]).to_excel(path, index=False)
+
+
+def start_of_range(days, now=None):
+    """直近 days 日の初日（日本時間の日付）"""
+    today = ((now or datetime.utcnow()) + timedelta(hours=TZ_OFFSET_HOURS)).date()
+    return today - timedelta(days=days - 1)
@@ -0,0 +1,341 @@
+// offline.js
+// オフライン学習ページ（/offline）
+//
+// - 範囲の単語（パック）を /api/offline/pack から取得して localStorage に保存する
+// - 保存したパックで、通信なしでクイズを解く（4択と完全一致はその場で判定）
+// - 回答は端末で ID を付けて未送信リストにため、つながったら /api/offline/sync に送る
+//   （サーバーは ID で重複を弾くので、何度送り直しても二重に数えられない）
+(function () {
+    'use strict';
+
+    const app = document.getElementById('offline-app');
+    if (!app) return;
+    const cfg = app.dataset;
+
+    const PACKS_KEY = 'tanngo.offline.packs';
+    const OUTBOX_KEY = 'tanngo.offline.outbox';
+    const SYNC_BATCH = 200;          // 1回の送信で送る回答数
+    const SYNC_EVERY = 10;           // これだけたまったら（オンラインなら）送る
+    const ROUGH_QUESTIONS = 50;      // ざっくりクイズの出題数（範囲内からランダム）
+
+    const statusEl = document.getElementById('offline-status');
+    const countEl = document.getElementById('outbox-count');
+    const messageEl = document.getElementById('offline-message');
+    const quizEl = document.getElementById('offline-quiz');
+    const managerEl = document.getElementById('offline-manager');
+    const listEl = document.getElementById('pack-list');
+    const emptyEl = document.getElementById('pack-empty');
+    const form = document.getElementById('pack-form');
+
+    let syncing = null;
+
+    // --- 保存領域 ------------------------------------------------------------
+    function load(key, fallback) {
+        try {
+            return JSON.parse(localStorage.getItem(key)) || fallback;
+        } catch (e) {
+            return fallback;
+        }
+    }
+
+    function save(key, value) {
+        localStorage.setItem(key, JSON.stringify(value));
+    }
+
+    function packKey(pack) {
+        return [pack.deck, pack.mode, pack.direction, pack.start + '-' + pack.end].join(':');
+    }
+
+    function newAnswerId() {
+        if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+        return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2, 12);
+    }
+
+    // --- 表示の小物 ----------------------------------------------------------
+    function el(tag, className, text) {
+        const node = document.createElement(tag);
+        if (className) node.className = className;
+        if (text !== undefined) node.textContent = text;
+        return node;
+    }
+
+    function button(label, className, onClick) {
+        const node = el('button', className, label);
+        node.type = 'button';
+        node.addEventListener('click', onClick);
+        return node;
+    }
+
+    function setMessage(text) {
+        messageEl.textContent = text || '';
+    }
+
+    function shuffle(items) {
+        const a = items.slice();
+        for (let i = a.length - 1; i > 0; i--) {
+            const j = Math.floor(Math.random() * (i + 1));
+            const t = a[i]; a[i] = a[j]; a[j] = t;
+        }
+        return a;
+    }
+
+    function normalize(text) {
+        return (text || '').trim().toLowerCase();
+    }
+
+    function refreshStatus() {
+        statusEl.textContent = navigator.onLine ? '🟢 オンライン' : '⚪ オフライン';
+        countEl.textContent = load(OUTBOX_KEY, []).length;
+    }
+
+    // --- パック --------------------------------------------------------------
+    function renderPacks() {
+        const packs = load(PACKS_KEY, {});
+        listEl.replaceChildren();
+        const keys = Object.keys(packs);
+        emptyEl.classList.toggle('hidden', keys.length > 0);
+        keys.forEach(function (key) {
+            const pack = packs[key];
+            const li = el('li', 'border border-gray-200 rounded-lg p-3');
+            const title = (pack.mode === 'rough' ? 'ざっくり' : '総合学習') + '（' +
+                (pack.direction === 'je' ? '日本語 → 英語' : '英語 → 日本語') + '）';
+            li.appendChild(el('p', 'font-semibold text-gray-800', title));
+            li.appendChild(el('p', 'text-sm text-gray-500',
+                (pack.deck === 'default' ? '標準' : pack.deck) + ' / 範囲 ' + pack.start + ' - ' + pack.end + '（' + pack.words.length + '語）'));
+            const buttons = el('div', 'mt-2 grid grid-cols-2 gap-2');
+            buttons.appendChild(button('開始', 'bg-blue-600 hover:bg-blue-700 text-white font-semibold py-2 rounded-lg', function () {
+                startQuiz(pack);
+            }));
+            buttons.appendChild(button('削除', 'bg-gray-200 hover:bg-gray-300 text-gray-700 font-semibold py-2 rounded-lg', function () {
+                const current = load(PACKS_KEY, {});
+                delete current[key];
+                save(PACKS_KEY, current);
+                renderPacks();
+            }));
+            li.appendChild(buttons);
+            listEl.appendChild(li);
+        });
+    }
+
+    function downloadPack(params) {
+        const query = new URLSearchParams(params).toString();
+        setMessage('ダウンロード中…');
+        return fetch(cfg.packUrl + '?' + query, { credentials: 'same-origin' }).then(function (res) {
+            return res.json().then(function (data) {
+                if (!res.ok) throw new Error(data.error || ('HTTP ' + res.status));
+                return data;
+            });
+        }).then(function (pack) {
+            const packs = load(PACKS_KEY, {});
+            packs[packKey(pack)] = pack;
+            save(PACKS_KEY, packs);
+            renderPacks();
+            setMessage('範囲 ' + pack.start + ' - ' + pack.end + ' を保存しました。');
+        }).catch(function (err) {
+            setMessage('ダウンロードに失敗しました: ' + err.message);
+        });
+    }
+
+    // --- 同期 ----------------------------------------------------------------
+    function sync() {
+        if (syncing) return syncing;
+        const outbox = load(OUTBOX_KEY, []);
+        if (!outbox.length || !navigator.onLine) return Promise.resolve();
+
+        // 同じ単語帳・バージョンの回答ごとにまとめて送る
+        const first = outbox[0];
+        const batch = outbox.filter(function (a) {
+            return a.deck === first.deck && a.version === first.version;
+        }).slice(0, SYNC_BATCH);
+
+        syncing = fetch(cfg.syncUrl, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            credentials: 'same-origin',
+            body: JSON.stringify({ deck: first.deck, version: first.version, answers: batch }),
+        }).then(function (res) {
+            if (!res.ok) throw new Error('HTTP ' + res.status);
+            return res.json();
+        }).then(function (data) {
+            const done = new Set([].concat(data.accepted || [], data.duplicates || [], data.rejected || []));
+            save(OUTBOX_KEY, load(OUTBOX_KEY, []).filter(function (a) { return !done.has(a.id); }));
+            const wrong = (data.results || []).filter(function (r) { return !r.correct; }).length;
+            setMessage((data.accepted || []).length + ' 件の回答を送信しました' + (wrong ? '（不正解 ' + wrong + ' 件は間違いリストに追加）' : '') + '。');
+            syncing = null;
+            refreshStatus();
+            // 残りがあれば続けて送る
+            if (done.size && load(OUTBOX_KEY, []).length) return sync();
+        }).catch(function () {
+            syncing = null;
+            refreshStatus();
+        });
+        return syncing;
+    }
+
+    function queueAnswer(pack, word, answer) {
+        const outbox = load(OUTBOX_KEY, []);
+        outbox.push({
+            id: newAnswerId(),
+            deck: pack.deck,
+            version: pack.version,
+            word_id: word[0],
+            dir: pack.direction,
+            mode: pack.mode,
+            range_key: pack.range_key,
+            answer: answer,
+            answered_at: Date.now(),
+        });
+        save(OUTBOX_KEY, outbox);
+        refreshStatus();
+        if (outbox.length >= SYNC_EVERY) sync();
+    }
+
+    // --- クイズ --------------------------------------------------------------
+    function grade(pack, word, answer) {
+        // 戻り値: true / false / null（英語→日本語で一致しない回答は、送信後にサーバーが意味で判定する）
+        const english = word[1];
+        const japanese = word[2];
+        if (pack.mode === 'rough') {
+            return answer === (pack.direction === 'je' ? english : japanese);
+        }
+        if (pack.direction === 'je') {
+            return normalize(answer) === normalize(english);
+        }
+        const accept = [japanese].concat(word[3] || []);
+        return accept.some(function (a) { return normalize(a) === normalize(answer); }) ? true : null;
+    }
+
+    function roughOptions(pack, word) {
+        const pick = function (w) { return pack.direction === 'je' ? w[1] : w[2]; };
+        const answer = pick(word);
+        const options = [answer];
+        shuffle(pack.words).some(function (w) {
+            const opt = pick(w);
+            if (opt && options.indexOf(opt) < 0) options.push(opt);
+            return options.length >= 4;
+        });
+        return shuffle(options);
+    }
+
+    function startQuiz(pack) {
+        let words = shuffle(pack.words);
+        if (pack.mode === 'rough') words = words.slice(0, ROUGH_QUESTIONS);
+        const state = { pack: pack, words: words, index: 0, score: 0, pending: 0 };
+        managerEl.classList.add('hidden');
+        quizEl.classList.remove('hidden');
+        renderQuestion(state);
+    }
+
+    function endQuiz(state) {
+        quizEl.replaceChildren();
+        quizEl.appendChild(el('h2', 'text-2xl font-bold text-gray-800 mb-4', '結果'));
+        quizEl.appendChild(el('p', 'text-xl text-gray-700', state.score + ' / ' + state.words.length + ' 問正解'));
+        if (state.pending) {
+            quizEl.appendChild(el('p', 'text-sm text-gray-500 mt-2', '判定待ち ' + state.pending + ' 問は、送信後にサーバーで採点されます。'));
+        }
+        quizEl.appendChild(button('保存した範囲に戻る', 'mt-6 w-full bg-blue-600 hover:bg-blue-700 text-white font-semibold py-3 px-4 rounded-lg', function () {
+            quizEl.classList.add('hidden');
+            managerEl.classList.remove('hidden');
+        }));
+        sync();
+    }
+
+    function renderQuestion(state) {
+        if (state.index >= state.words.length) return endQuiz(state);
+        const pack = state.pack;
+        const word = state.words[state.index];
+        const question = pack.direction === 'je' ? word[2] : word[1];
+
+        quizEl.replaceChildren();
+        quizEl.appendChild(el('p', 'text-xl font-semibold text-gray-700 mb-4', '問題 ' + (state.index + 1) + ' / ' + state.words.length));
+        quizEl.appendChild(el('p', 'text-3xl font-bold text-blue-700 mb-8', question));
+
+        const answerWith = function (answer) {
+            const result = grade(pack, word, answer);
+            if (result === true) state.score += 1;
+            if (result === null) state.pending += 1;
+            queueAnswer(pack, word, answer);
+            renderFeedback(state, word, answer, result);
+        };
+
+        if (pack.mode === 'rough') {
+            const options = el('div', 'space-y-3');
+            roughOptions(pack, word).forEach(function (opt) {
+                options.appendChild(button(opt, 'block w-full bg-white border border-gray-300 hover:bg-blue-100 text-gray-800 text-lg font-medium py-3 px-4 rounded-lg', function () {
+                    answerWith(opt);
+                }));
+            });
+            quizEl.appendChild(options);
+        } else {
+            const answerForm = el('form', 'space-y-4');
+            const input = el('input', 'block w-full px-4 py-2 border border-gray-300 rounded-lg text-lg text-center');
+            input.type = 'text';
+            input.required = true;
+            input.autocomplete = 'off';
+            input.placeholder = '回答を入力';
+            const submit = el('button', 'w-full bg-blue-600 hover:bg-blue-700 text-white font-semibold py-3 px-4 rounded-lg', '回答する');
+            submit.type = 'submit';
+            answerForm.append(input, submit);
+            answerForm.addEventListener('submit', function (event) {
+                event.preventDefault();
+                if (input.value.trim()) answerWith(input.value.trim());
+            });
+            quizEl.appendChild(answerForm);
+            input.focus();
+        }
+
+        quizEl.appendChild(button('中断する', 'mt-6 w-full bg-gray-200 hover:bg-gray-300 text-gray-700 font-semibold py-2 px-4 rounded-lg', function () {
+            endQuiz(state);
+        }));
+    }
+
+    function renderFeedback(state, word, answer, result) {
+        const style = result === true ? 'bg-green-100 text-green-700'
+            : result === false ? 'bg-red-100 text-red-700' : 'bg-yellow-100 text-yellow-800';
+        const label = result === true ? '正解' : result === false ? '不正解' : '判定待ち（送信後に採点）';
+
+        quizEl.replaceChildren();
+        quizEl.appendChild(el('p', 'text-xl font-semibold text-gray-700 mb-4', '問題 ' + (state.index + 1) + ' / ' + state.words.length));
+        const box = el('div', 'p-4 rounded-lg ' + style);
+        box.appendChild(el('p', 'font-semibold text-lg', label));
+        [['問題(英語): ', word[1]], ['問題(日本語): ', word[2]], ['あなたの答え: ', answer]].forEach(function (row) {
+            const p = el('p', 'text-base mt-2', row[0]);
+            p.appendChild(el('strong', '', row[1]));
+            box.appendChild(p);
+        });
+        quizEl.appendChild(box);
+        const next = button('次の問題へ', 'mt-6 w-full bg-blue-600 hover:bg-blue-700 text-white font-semibold py-3 px-4 rounded-lg', function () {
+            state.index += 1;
+            renderQuestion(state);
+        });
+        quizEl.appendChild(next);
+        next.focus();
+    }
+
+    // --- 初期化 --------------------------------------------------------------
+    form.addEventListener('submit', function (event) {
+        event.preventDefault();
+        const data = new FormData(form);
+        downloadPack({ mode: data.get('mode'), dir: data.get('dir'), start: data.get('start'), end: data.get('end') });
+    });
+    document.getElementById('sync-button').addEventListener('click', sync);
+    window.addEventListener('online', function () { refreshStatus(); sync(); });
+    window.addEventListener('offline', refreshStatus);
+
+    form.elements.dir.value = cfg.direction;
+    // 範囲一覧の「オフライン用に保存」から来たときは、そのままダウンロードする
+    const params = new URLSearchParams(window.location.search);
+    if (params.get('start') && params.get('end')) {
+        ['mode', 'dir', 'start', 'end'].forEach(function (name) {
+            if (params.get(name)) form.elements[name].value = params.get(name);
+        });
+        downloadPack({ mode: form.elements.mode.value, dir: form.elements.dir.value, start: params.get('start'), end: params.get('end') });
+    }
+
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.register(cfg.swUrl).catch(function () {});
+    }
+    renderPacks();
+    refreshStatus();
+    sync();
+})();
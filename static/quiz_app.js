@@ -0,0 +1,238 @@
+// quiz_app.js
+// クイズを1ページで進める（JS が無いときは従来どおりフォーム送信で動く）
+//
+// - 次の問題は /api/quiz/next でまとめて先読みしておき、ページ遷移なしで出題する
+// - 正解と一致する回答はその場で判定し、回答はまとめて /api/quiz/answer に送る
+// - 一致しない英語→日本語の回答だけは、意味での判定のためすぐにサーバーへ送る
+(function () {
+    'use strict';
+
+    const app = document.getElementById('quiz-app');
+    const initial = document.getElementById('quiz-initial');
+    if (!app || !initial || !window.fetch) return;
+
+    const PREFETCH = 10;      // 1回に先読みする問題数
+    const LOW_WATER = 4;      // 残りがこれを切ったら次を先読みする
+    const FLUSH_EVERY = 5;    // これだけ回答がたまったら送る
+
+    const cfg = app.dataset;
+    const body = document.getElementById('quiz-body');
+    const counter = document.getElementById('quiz-counter');
+
+    let queue = JSON.parse(initial.textContent);   // 出題待ちの問題
+    let pending = [];                              // 未送信の回答 {position, answer}
+    let nextPosition = queue.length ? queue[queue.length - 1].position + 1 : 0;
+    let total = null;
+    let current = null;
+    let inflight = Promise.resolve();              // 送信は順番に1本ずつ
+
+    const totalMatch = counter.textContent.match(/\/\s*(\d+)/);
+    total = totalMatch ? Number(totalMatch[1]) : nextPosition;
+
+    function normalize(text) {
+        return (text || '').trim().toLowerCase();
+    }
+
+    function el(tag, className, text) {
+        const node = document.createElement(tag);
+        if (className) node.className = className;
+        if (text !== undefined) node.textContent = text;
+        return node;
+    }
+
+    function takeQuestions(questions) {
+        (questions || []).forEach(function (q) {
+            if (q.position >= nextPosition) {
+                queue.push(q);
+                nextPosition = q.position + 1;
+            }
+        });
+    }
+
+    // --- 通信 ----------------------------------------------------------------
+    function send(extraAnswers, keepalive) {
+        const run = function () {
+            const answers = pending.concat(extraAnswers || []);
+            pending = [];
+            const payload = { answers: answers };
+            if (queue.length < LOW_WATER && nextPosition < total) {
+                payload.prefetch = { start: nextPosition, n: PREFETCH };
+            }
+            if (!answers.length && !payload.prefetch) return Promise.resolve(null);
+            return fetch(cfg.answerUrl, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                credentials: 'same-origin',
+                body: JSON.stringify(payload),
+                keepalive: !!keepalive,
+            }).then(function (res) {
+                if (!res.ok) throw new Error('HTTP ' + res.status);
+                return res.json();
+            }).then(function (data) {
+                total = data.total;
+                takeQuestions(data.questions);
+                return data;
+            }).catch(function (err) {
+                // 送れなかった回答は戻しておく（position で重複は弾かれるので再送して問題ない）
+                pending = answers.concat(pending);
+                throw err;
+            });
+        };
+        const result = inflight.then(run, run);
+        inflight = result.catch(function () {});
+        return result;
+    }
+
+    function fetchMore() {
+        const url = cfg.nextUrl + '?start=' + nextPosition + '&n=' + PREFETCH;
+        return fetch(url, { credentials: 'same-origin' }).then(function (res) {
+            if (!res.ok) throw new Error('HTTP ' + res.status);
+            return res.json();
+        }).then(function (data) {
+            total = data.total;
+            takeQuestions(data.questions);
+        });
+    }
+
+    // サーバーと食い違ったときは、ページを読み直して状態を合わせる
+    function resync() {
+        window.location.reload();
+    }
+
+    // --- 表示 ----------------------------------------------------------------
+    function showOverlay(correct) {
+        const old = app.querySelector('.feedback-overlay');
+        if (old) old.remove();
+        const overlay = el('div', 'feedback-overlay');
+        overlay.appendChild(el('div', 'feedback-symbol ' + (correct ? 'feedback-correct' : 'feedback-incorrect')));
+        app.insertBefore(overlay, app.firstChild);
+    }
+
+    function renderQuestion(q) {
+        current = q;
+        const old = app.querySelector('.feedback-overlay');
+        if (old) old.remove();
+        counter.textContent = '問題 ' + (q.position + 1) + ' / ' + total;
+        body.replaceChildren();
+
+        body.appendChild(el('p', 'text-4xl font-bold text-blue-700 mb-8', q.question));
+        if (q.hints && q.hints.word_length) {
+            const hint = el('div', 'bg-yellow-100 text-yellow-800 p-3 rounded-lg mb-4 text-sm');
+            hint.append('ヒント: ', el('strong', '', q.hints.word_length + '文字'),
+                'の英単語で、最初の文字は ', el('strong', '', "'" + q.hints.first_letter + "'"), ' です。');
+            body.appendChild(hint);
+        }
+
+        const form = el('form', 'space-y-4');
+        const input = el('input', 'block w-full px-4 py-2 border border-gray-300 rounded-lg text-lg text-center tracking-[.2em]');
+        input.type = 'text';
+        input.name = 'user_answer';
+        input.required = true;
+        input.autocomplete = 'off';
+        input.placeholder = (q.hints && q.hints.placeholder) || '回答を入力';
+        const button = el('button', 'w-full bg-blue-600 hover:bg-blue-700 text-white font-semibold py-3 px-4 rounded-lg', '回答する');
+        button.type = 'submit';
+        form.append(input, button);
+        form.addEventListener('submit', function (event) {
+            event.preventDefault();
+            submitAnswer(q, input.value.trim(), button);
+        });
+        body.appendChild(form);
+        input.focus();
+    }
+
+    function renderFeedback(q, correct, userAnswer, english, japanese) {
+        showOverlay(correct);
+        body.replaceChildren();
+
+        const box = el('div', 'mt-6 p-4 rounded-lg ' + (correct ? 'bg-green-100 text-green-700' : 'bg-red-100 text-red-700'));
+        box.appendChild(el('p', 'font-semibold text-lg', correct ? '正解' : '不正解'));
+        const rows = [['問題(英語): ', english, 'text-blue-700', 'text-base mt-2'],
+                      ['問題(日本語): ', japanese, 'text-blue-700', 'text-base'],
+                      ['あなたの答え: ', userAnswer, 'text-gray-800', 'text-base mt-2']];
+        rows.forEach(function (row) {
+            const p = el('p', row[3], row[0]);
+            p.appendChild(el('strong', row[2], row[1]));
+            box.appendChild(p);
+        });
+        body.appendChild(box);
+
+        if (cfg.removeUrl) {
+            // 復習クイズ: この単語を復習リストから削除（サーバー側の画面遷移に任せる）
+            const wrap = el('div', 'mt-4');
+            const remove = el('a', 'block w-full bg-red-600 hover:bg-red-700 text-white font-semibold py-3 px-4 rounded-lg shadow-md text-sm', 'この単語を復習リストから削除');
+            remove.href = cfg.removeUrl.replace(/\/0$/, '/' + q.word_id);
+            wrap.appendChild(remove);
+            body.appendChild(wrap);
+        }
+
+        const wrap = el('div', cfg.removeUrl ? 'mt-4' : 'mt-8');
+        const next = el('button', 'block w-full bg-blue-600 hover:bg-blue-700 text-white font-semibold py-3 px-4 rounded-lg', '次の問題へ');
+        next.type = 'button';
+        next.addEventListener('click', nextQuestion);
+        wrap.appendChild(next);
+        body.appendChild(wrap);
+        next.focus();
+    }
+
+    // --- 進行 ----------------------------------------------------------------
+    function submitAnswer(q, userAnswer, button) {
+        if (!userAnswer) return;
+        const matched = (q.accept || []).some(function (a) { return normalize(a) === normalize(userAnswer); });
+        if (matched || q.exact) {
+            // その場で判定できる → 回答はためておいてまとめて送る
+            pending.push({ position: q.position, answer: userAnswer });
+            renderFeedback(q, matched, userAnswer, q.english, q.japanese);
+            if (pending.length >= FLUSH_EVERY || queue.length < LOW_WATER) {
+                send().catch(function () {});
+            }
+            return;
+        }
+        // 意味での判定が必要 → たまっている回答と一緒にすぐ送る
+        button.disabled = true;
+        send([{ position: q.position, answer: userAnswer }]).then(function (data) {
+            const result = data && data.results.filter(function (r) { return r.position === q.position; })[0];
+            if (!result) return resync();
+            renderFeedback(q, result.correct, userAnswer, result.english, result.japanese);
+        }).catch(function () {
+            button.disabled = false;
+            alert('通信に失敗しました。もう一度「回答する」を押してください。');
+        });
+    }
+
+    function finish() {
+        send().then(function () {
+            window.location.href = cfg.resultUrl;
+        }, function () {
+            alert('回答を送信できませんでした。通信状況を確認して、もう一度お試しください。');
+        });
+    }
+
+    function nextQuestion() {
+        if (queue.length) {
+            renderQuestion(queue.shift());
+            if (queue.length < LOW_WATER && nextPosition < total && !pending.length) {
+                fetchMore().catch(function () {});
+            }
+            return;
+        }
+        if (nextPosition >= total) return finish();
+        fetchMore().then(function () {
+            if (queue.length) renderQuestion(queue.shift()); else resync();
+        }, resync);
+    }
+
+    // 画面を離れる前に、たまっている回答を送っておく
+    app.addEventListener('click', function (event) {
+        const link = event.target.closest('a[href]');
+        if (!link || !pending.length) return;
+        event.preventDefault();
+        send().then(function () { window.location.href = link.href; },
+                    function () { window.location.href = link.href; });
+    });
+    window.addEventListener('pagehide', function () {
+        if (pending.length) send(null, true);
+    });
+
+    if (queue.length) renderQuestion(queue.shift());
+})();
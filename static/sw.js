@@ -0,0 +1,78 @@
+// sw.js
+// オフライン学習ページ用のサービスワーカー（/sw.js から配信）
+//
+// /offline とその表示に必要なファイルだけをキャッシュする。
+// 他のページや API には手を出さない（通常どおりネットワークに流す）。
+const CACHE_NAME = 'tanngo-offline-v1';
+const OFFLINE_PAGE = '/offline';
+const SHELL = [
+    OFFLINE_PAGE,
+    '/static/offline.js',
+    'https://cdn.tailwindcss.com',
+];
+
+self.addEventListener('install', function (event) {
+    event.waitUntil(
+        caches.open(CACHE_NAME).then(function (cache) {
+            // 1つ失敗しても他はキャッシュする（CDN に届かない場合など）
+            return Promise.all(SHELL.map(function (url) {
+                const request = new Request(url, { credentials: 'same-origin', mode: url.startsWith('http') ? 'no-cors' : 'same-origin' });
+                return fetch(request).then(function (res) {
+                    return cache.put(url, res);
+                }).catch(function () {});
+            }));
+        }).then(function () { return self.skipWaiting(); })
+    );
+});
+
+self.addEventListener('activate', function (event) {
+    event.waitUntil(
+        caches.keys().then(function (names) {
+            return Promise.all(names.filter(function (name) {
+                return name.startsWith('tanngo-offline-') && name !== CACHE_NAME;
+            }).map(function (name) { return caches.delete(name); }));
+        }).then(function () { return self.clients.claim(); })
+    );
+});
+
+self.addEventListener('fetch', function (event) {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+
+    if (url.origin === self.location.origin && url.pathname === OFFLINE_PAGE) {
+        // ページはネットワーク優先（ログイン状態などを反映）、つながらなければキャッシュ
+        event.respondWith(
+            fetch(request).then(function (res) {
+                if (res.ok && !res.redirected) {
+                    const copy = res.clone();
+                    caches.open(CACHE_NAME).then(function (cache) { cache.put(OFFLINE_PAGE, copy); });
+                }
+                return res;
+            }).catch(function () {
+                return caches.match(OFFLINE_PAGE);
+            })
+        );
+        return;
+    }
+
+    const key = url.origin === self.location.origin ? url.pathname : request.url;
+    if (SHELL.indexOf(key) >= 0) {
+        // スクリプト類はキャッシュ優先で返しつつ、裏で新しいものに更新する
+        event.respondWith(
+            caches.open(CACHE_NAME).then(function (cache) {
+                return cache.match(key).then(function (cached) {
+                    const update = fetch(request).then(function (res) {
+                        cache.put(key, res.clone());
+                        return res;
+                    });
+                    if (cached) {
+                        update.catch(function () {});
+                        return cached;
+                    }
+                    return update;
+                });
+            })
+        );
+    }
+});
@@ -0,0 +1,119 @@
+# suggest_cache.py
+# 予測変換（/api/search_suggestions）の結果キャッシュと、ユーザーごとの回数制限
+#
+# - 結果は (単語帳のバージョン, 正規化した入力) をキーにした LRU + TTL で全ユーザー共通に持つ
+#   （バージョンは内容のハッシュなので、差し替えると古い結果は引かれずに追い出される）
+# - 1〜2文字の入力は誰でも最初に打つので、単語帳を読み込んだときに全部作っておく
+# - キー入力の連打はトークンバケットで制限する（一定の速さまでは連続で受け付け、超えた分は 429）
+# - ワーカー（プロセス）ごとに持つ。ヒット率などは管理者ページで見られる
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize(query):
+    """キャッシュのキーにする入力（前後の空白を除いて小文字に。索引の引き方と同じ）"""
+    return query.strip().lower()
+
+
+def suggestion_etag(version, query, limit):
+    raw = f"{version}\t{query}\t{limit}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class SuggestionCache:
+    """予測変換の結果の LRU キャッシュ（TTL 付き）"""
+
+    def __init__(self, max_entries=20000, ttl=600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # キー -> (期限, 結果)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.warmed = 0
+
+    def get(self, key, compute):
+        """キャッシュにあればそれを、無ければ compute() の結果を入れて返す"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+                self.expired += 1
+            self.misses += 1
+        # 計算はロックの外で（同時に計算しても結果は同じなので後勝ちでよい）
+        value = compute()
+        self.put(key, value, now)
+        return value
+
+    def put(self, key, value, now=None):
+        with self._lock:
+            self._entries[key] = ((now or time.monotonic()) + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def warm(self, snapshot, limit):
+        """単語帳に出てくる1〜2文字の入力の結果を作っておく。作った件数を返す"""
+        prefixes = set()
+        for key in snapshot.suggest_index.keys:
+            prefixes.add(key[:1])
+            prefixes.add(key[:2])
+        prefixes.discard("")
+        now = time.monotonic()
+        for prefix in prefixes:
+            self.put((snapshot.version, prefix, limit), snapshot.suggestions(prefix, limit), now)
+        with self._lock:
+            self.warmed += len(prefixes)
+        return len(prefixes)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "warmed": self.warmed,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class TokenBucket:
+    """キー（ユーザーID）ごとのトークンバケット。rate 回/秒で補充し、最大 burst 回まで連続で通す"""
+
+    def __init__(self, rate=10.0, burst=20, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # キー -> (残りトークン, 最後に補充した時刻)
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def allow(self, key):
+        """通してよければ (True, 0)、だめなら (False, 次に通るまでの秒数)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            else:
+                self.limited += 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            # しばらく来ていないユーザーから捨てる（満タンに戻っているので捨てても同じ）
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1.0 - tokens) / self.rate
@@ -0,0 +1,68 @@
+# 同じ単語が2つのデッキに入っているとき、範囲別の集計がデッキごとに正しく数えられること
+import os
+import tempfile
+
+_DB_PATH = os.path.join(tempfile.mkdtemp(), "range_stats.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DB_PATH}")
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+
+import pandas as pd
+import pytest
+from flask_login import login_user
+
+from app import RangeStat, User, app, db, update_range_stats
+from vocab import VocabSnapshot
+
+SHARED_ID = 7
+
+
+def snapshot(word_ids):
+    df = pd.DataFrame({"English": [f"w{i}" for i in word_ids], "Japanese": [f"訳{i}" for i in word_ids]})
+    snap = VocabSnapshot(df, version="test")
+    snap.attach_word_ids(word_ids)
+    return snap
+
+
+# 共有の単語は、デッキ A では 1〜50、デッキ B では 51〜100 の範囲に入っている
+DECK_A = snapshot([SHARED_ID] + list(range(100, 149)))
+DECK_B = snapshot(list(range(200, 250)) + [SHARED_ID])
+
+
+@pytest.fixture
+def user():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username="ranges", nickname="ranges", password="x")
+        db.session.add(user)
+        db.session.commit()
+        with app.test_request_context():
+            login_user(user)
+            yield user
+        db.session.remove()
+
+
+def answer(vocab, deck, correct):
+    update_range_stats(vocab, deck, [(SHARED_ID, "ej", correct)])
+    db.session.commit()
+
+
+def stats(user):
+    return {
+        (s.deck, s.range_start): (s.mastered, s.mistakes)
+        for s in RangeStat.query.filter_by(user_id=user.id, direction="ej")
+    }
+
+
+def test_shared_word_counts_in_each_deck(user):
+    answer(DECK_A, "a", False)
+    answer(DECK_B, "b", False)
+    assert stats(user) == {("a", 1): (0, 1), ("b", 51): (0, 1)}
+
+
+def test_answer_in_other_deck_does_not_change_counts(user):
+    answer(DECK_A, "a", False)
+    answer(DECK_B, "b", True)
+    assert stats(user) == {("a", 1): (0, 1), ("b", 51): (1, 0)}
+    answer(DECK_A, "a", True)
+    assert stats(user) == {("a", 1): (1, 0), ("b", 51): (1, 0)}
@@ -0,0 +1,78 @@
+# remap-word-ids で、同じユーザーが旧IDと新IDの両方の行を持っているときに一意制約で失敗しないこと
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+_DB_PATH = os.path.join(tempfile.mkdtemp(), "remap.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DB_PATH}")
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+
+import pytest
+
+import manage
+from app import Mistake, User, WordProgress, app, db
+
+OLD_ID, NEW_ID = 900001, 900002
+
+
+@pytest.fixture
+def user_id():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username="remap", nickname="remap", password="x")
+        db.session.add(user)
+        db.session.commit()
+        yield user.id
+        db.session.remove()
+
+
+def test_word_progress_collision_keeps_latest_answer(user_id):
+    now = datetime.utcnow()
+    with app.app_context():
+        db.session.add_all([
+            # 旧IDの行のほうが新しい（こちらの正誤を残す）
+            WordProgress(user_id=user_id, word_id=OLD_ID, direction="ej", correct=True, updated_at=now),
+            WordProgress(user_id=user_id, word_id=NEW_ID, direction="ej", correct=False, updated_at=now - timedelta(days=1)),
+            # 新IDの行のほうが新しい（旧IDの行は消えるだけ）
+            WordProgress(user_id=user_id, word_id=OLD_ID, direction="je", correct=True, updated_at=now - timedelta(days=1)),
+            WordProgress(user_id=user_id, word_id=NEW_ID, direction="je", correct=False, updated_at=now),
+        ])
+        db.session.commit()
+
+        merged = manage.remap_word_refs({OLD_ID: NEW_ID})
+        db.session.commit()
+
+        rows = {row.direction: row for row in WordProgress.query.filter_by(user_id=user_id)}
+        assert merged == 2
+        assert {row.word_id for row in rows.values()} == {NEW_ID}
+        assert rows["ej"].correct is True
+        assert rows["je"].correct is False
+
+
+def test_word_progress_without_collision_is_moved(user_id):
+    with app.app_context():
+        db.session.add(WordProgress(user_id=user_id, word_id=OLD_ID, direction="ej", correct=True))
+        db.session.commit()
+
+        assert manage.remap_word_refs({OLD_ID: NEW_ID}) == 0
+        db.session.commit()
+
+        assert [row.word_id for row in WordProgress.query.filter_by(user_id=user_id)] == [NEW_ID]
+
+
+def test_mistake_collision_drops_old_entry(user_id):
+    with app.app_context():
+        db.session.add_all([
+            Mistake(user_id=user_id, word_id=OLD_ID, direction="ej", source="detailed", range_key="1-50"),
+            Mistake(user_id=user_id, word_id=NEW_ID, direction="ej", source="detailed", range_key="1-50"),
+            # 別の範囲の間違いはぶつからないので、そのまま新IDになる
+            Mistake(user_id=user_id, word_id=OLD_ID, direction="ej", source="rough", range_key=""),
+        ])
+        db.session.commit()
+
+        assert manage.remap_word_refs({OLD_ID: NEW_ID}) == 1
+        db.session.commit()
+
+        entries = {(m.source, m.range_key, m.word_id) for m in Mistake.query.filter_by(user_id=user_id)}
+        assert entries == {("detailed", "1-50", NEW_ID), ("rough", "", NEW_ID)}
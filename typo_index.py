@@ -0,0 +1,77 @@
+# typo_index.py
+# 英単語のつづり間違いに強い「もしかして」検索（SymSpell の削除辞書）
+#
+# 単語から最大 MAX_DISTANCE 文字を消した文字列をすべて辞書に入れておき、
+# 入力からも同じように文字を消して辞書を引けば、編集距離が MAX_DISTANCE 以内の候補だけが集まる。
+# 候補は Levenshtein で距離を確かめて近い順に返す（単語帳を全件なめる fuzz.ratio よりずっと速い）。
+#   例: "photograper" → "photographer"
+# 長い単語は消す組み合わせが増えるので、先頭 PREFIX_LENGTH 文字だけで辞書を作る（SymSpell と同じ工夫）。
+# 索引はスナップショットごとに1回作れば後は読むだけ（スナップショットと同じく作成後は変えない）。
+import Levenshtein
+
+MAX_DISTANCE = 2
+PREFIX_LENGTH = 7
+# これより短い入力は候補が多すぎて当てにならないので引かない
+MIN_QUERY_LENGTH = 3
+
+
+def _deletes(word, max_distance):
+    """word から 0〜max_distance 文字消した文字列の集合"""
+    out = {word}
+    level = {word}
+    for _ in range(max_distance):
+        # 1つ前の段の各文字列から、さらに1文字ずつ消す
+        level = {w[:i] + w[i + 1:] for w in level for i in range(len(w))}
+        out |= level
+    return out
+
+
+class TypoIndex:
+    """英単語の削除辞書（削除した文字列 -> 単語の番号）"""
+
+    def __init__(self, words, max_distance=MAX_DISTANCE, prefix_length=PREFIX_LENGTH):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        # 小文字で同じ単語は1つにまとめ、表示には最初に出てきた書き方を使う
+        self.keys = []
+        self.texts = []
+        seen = {}
+        for text in words:
+            key = text.strip().lower()
+            if key and key not in seen:
+                seen[key] = len(self.keys)
+                self.keys.append(key)
+                self.texts.append(text)
+        self._exact = seen
+        self.deletes = {}
+        for i, key in enumerate(self.keys):
+            for d in _deletes(key[:prefix_length], max_distance):
+                self.deletes.setdefault(d, []).append(i)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, query, limit=5, max_distance=None):
+        """編集距離が max_distance 以内の単語を [(単語, 距離), ...] で近い順に返す（入力そのものは除く）"""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        query = query.strip().lower()
+        if len(query) < MIN_QUERY_LENGTH:
+            return []
+        exact = self._exact.get(query)
+        candidates = set()
+        for d in _deletes(query[:self.prefix_length], max_distance):
+            candidates.update(self.deletes.get(d, ()))
+        found = []
+        for i in candidates:
+            key = self.keys[i]
+            if i == exact or abs(len(key) - len(query)) > max_distance:
+                continue
+            distance = Levenshtein.distance(query, key, score_cutoff=max_distance)
+            if distance <= max_distance:
+                found.append((distance, key, i))
+        found.sort()
+        return [(self.texts[i], distance) for distance, _, i in found[:limit]]
+
+    def suggest(self, query, limit=5):
+        """「もしかして」に出す単語だけのリスト"""
+        return [text for text, _ in self.lookup(query, limit)]
@@ -0,0 +1,90 @@
+# user_cache.py
+# ログイン中のユーザーを、リクエストのたびに DB から読まないためのキャッシュ
+#
+# Flask-Login の user_loader はクイズの1クリック・予測変換の1キー入力ごとに呼ばれる。
+# 表示や権限の確認に要るのは id・ユーザー名・ニックネーム・管理者かどうかだけなので、
+# それだけを持つ軽いレコード（__slots__）を短い TTL でワーカーごとに持っておく。
+# - ユーザーを書き換えるルート（マイページ・管理者のユーザー削除）は ORM で読み直して更新し、
+#   終わったら invalidate() する
+# - キャッシュはワーカー（プロセス）ごとなので、別のワーカーには TTL が切れるまで古い内容が残る
+import threading
+import time
+from collections import OrderedDict
+
+
+class CachedUser:
+    """current_user として使う軽いユーザー情報（ORM のオブジェクトではないので書き換えても DB には入らない）"""
+
+    __slots__ = ("id", "username", "nickname", "is_admin")
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, id, username, nickname, is_admin):
+        self.id = id
+        self.username = username
+        self.nickname = nickname
+        self.is_admin = bool(is_admin)
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        return getattr(other, "get_id", None) is not None and self.get_id() == other.get_id()
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"<CachedUser {self.username}>"
+
+
+class UserCache:
+    """ユーザーID -> CachedUser の LRU キャッシュ（TTL 付き）"""
+
+    def __init__(self, ttl=30.0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # ユーザーID -> (期限, CachedUser)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, load):
+        """キャッシュにあればそれを、無ければ load(user_id) の結果を入れて返す（None はキャッシュしない）"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        user = load(user_id)
+        if user is not None and self.ttl > 0:
+            with self._lock:
+                self._entries[user_id] = (now + self.ttl, user)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
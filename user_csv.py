@@ -0,0 +1,68 @@
+# user_csv.py
+# ユーザー一括登録用の CSV の読み込みと、行ごとの入力チェック
+#
+#   username,nickname,password,is_admin
+#   s2025001,山田,pass1234,
+#   teacher1,佐藤先生,secret,1
+#
+# is_admin は省略可（1 / true / yes / はい なら管理者）。
+# Excel で保存した CSV（Shift_JIS）も UTF-8（BOM 付き含む）も読める。
+# DB は見ない（既に使われているユーザー名の確認は登録する側でまとめて1回だけ行う）。
+import csv
+import io
+
+REQUIRED_COLUMNS = ("username", "nickname", "password")
+# users テーブルの列の長さ
+MAX_LENGTH = 100
+_TRUE_VALUES = {"1", "true", "yes", "y", "on", "はい", "○"}
+
+
+class UserRow:
+    __slots__ = ("line", "username", "nickname", "password", "is_admin")
+
+    def __init__(self, line, username, nickname, password, is_admin):
+        self.line = line
+        self.username = username
+        self.nickname = nickname
+        self.password = password
+        self.is_admin = is_admin
+
+
+def decode(data):
+    """アップロードされたバイト列を文字列にする（UTF-8 で読めなければ Shift_JIS）"""
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("cp932")
+
+
+def parse(text):
+    """CSV を読み、(登録できる行のリスト, [(行番号, ユーザー名, エラー内容), ...]) を返す"""
+    reader = csv.DictReader(io.StringIO(text))
+    header = [(name or "").strip().lower() for name in (reader.fieldnames or [])]
+    missing = [c for c in REQUIRED_COLUMNS if c not in header]
+    if missing:
+        return [], [(1, "", f"列が足りません: {', '.join(missing)}")]
+    reader.fieldnames = header
+
+    rows = []
+    errors = []
+    seen = {}
+    for record in reader:
+        line = reader.line_num
+        username = (record.get("username") or "").strip()
+        nickname = (record.get("nickname") or "").strip()
+        password = record.get("password") or ""
+        if not any([username, nickname, password]):
+            continue  # 空行
+        if not all([username, nickname, password]):
+            errors.append((line, username, "ユーザー名、ニックネーム、パスワードは必須です"))
+        elif len(username) > MAX_LENGTH or len(nickname) > MAX_LENGTH:
+            errors.append((line, username, f"ユーザー名・ニックネームは{MAX_LENGTH}文字までです"))
+        elif username in seen:
+            errors.append((line, username, f"{seen[username]}行目と同じユーザー名です"))
+        else:
+            seen[username] = line
+            is_admin = (record.get("is_admin") or "").strip().lower() in _TRUE_VALUES
+            rows.append(UserRow(line, username, nickname, password, is_admin))
+    return rows, errors
@@ -0,0 +1,245 @@
+# vector_store.py
+# 単語ベクトルの保存形式（メモリマップ + コンテンツハッシュ索引）の読み書き
+import hashlib
+import json
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+VECTORS_PATH = "static/word_vectors.npy"
+KEYS_PATH = "static/word_vectors_keys.json"
+LEGACY_PICKLE_PATH = "static/word_vectors.pkl"
+
+
+# 「学生、生徒」「駅、（役所の）署」のような訳語セルを分割するための区切り
+_VARIANT_SEPARATORS = re.compile(r"[、,，;；/／・]")
+_PARENTHESES = re.compile(r"[（(][^）)]*[）)]")
+
+
+def split_variants(text):
+    """訳語セルを個々の訳に分ける。括弧書きの補足は取り除く（セル全体は含めない）
+
+    例: "駅、（役所の）署" -> ["駅", "署"]"""
+    variants = []
+    for part in _VARIANT_SEPARATORS.split(str(text)):
+        part = _PARENTHESES.sub("", part).strip()
+        if part and part not in variants:
+            variants.append(part)
+    return variants
+
+
+def content_hash(text):
+    """単語テキストのハッシュ（前後の空白は無視）。ベクトルの再利用判定に使う"""
+    return hashlib.sha1(str(text).strip().encode("utf-8")).hexdigest()[:20]
+
+
+class VectorStore:
+    """npy（memmap）に並んだベクトルを、テキストのハッシュで引けるようにしたもの。
+
+    旧形式の dict と同じく ``get(text)`` で使える。"""
+
+    def __init__(self, vectors, keys, model_name=None):
+        self.vectors = vectors
+        self.keys = keys
+        self.model_name = model_name
+        self._rows = {key: i for i, key in enumerate(keys)}
+
+    @classmethod
+    def open(cls, vectors_path=VECTORS_PATH, keys_path=KEYS_PATH):
+        with open(keys_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = np.load(vectors_path, mmap_mode="r")
+        keys = meta.get("keys", [])
+        if vectors.shape[0] != len(keys):
+            # 書き込み途中のファイルを掴んだ場合など
+            raise ValueError(f"{vectors_path} と {keys_path} の件数が一致しません")
+        return cls(vectors, keys, meta.get("model"))
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, text):
+        return content_hash(text) in self._rows
+
+    def row_of_hash(self, key):
+        return self._rows.get(key)
+
+    def get(self, text, default=None):
+        row = self._rows.get(content_hash(text))
+        if row is None:
+            return default
+        return self.vectors[row]
+
+    def subset(self, texts):
+        """指定したテキストの行だけを取り出した（メモリ上の）ストアを作る。単語帳ごとの切り出し用"""
+        rows = {}
+        for text in texts:
+            key = content_hash(text)
+            row = self._rows.get(key)
+            if row is not None and key not in rows:
+                rows[key] = row
+        order = sorted(rows.items(), key=lambda kv: kv[1])  # memmap を前から順に読む
+        vectors = np.array(self.vectors[[row for _, row in order]], dtype=np.float32) if order else np.zeros((0, self.dim), dtype=np.float32)
+        return VectorStore(vectors, [key for key, _ in order], self.model_name)
+
+    @property
+    def nbytes(self):
+        return int(self.vectors.nbytes)
+
+
+def subset_embeddings(embeddings, texts):
+    """単語帳に出てくるテキストのベクトルだけを取り出す（旧形式の dict にも対応）"""
+    if embeddings is None:
+        return None
+    if isinstance(embeddings, VectorStore):
+        return embeddings.subset(texts)
+    return {t: embeddings[t] for t in texts if t in embeddings}
+
+
+def cosine(a, b):
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    denom = float(np.linalg.norm(a) * np.linalg.norm(b))
+    if denom == 0.0:
+        return 0.0
+    return float(np.dot(a, b) / denom)
+
+
+class AnswerEncoder:
+    """ユーザーの自由入力をその場でエンコードする（CPU）。
+
+    - 結果は件数上限つきの LRU にキャッシュする
+    - ``budget`` 秒以内に終わらなければ None を返し、呼び出し側はfuzzyマッチに切り替える
+      （間に合わなかった結果も、終わり次第キャッシュに入るので次回からは即答できる）
+    - モデルは初回のエンコード時にバックグラウンドで読み込む"""
+
+    def __init__(self, model_name, budget=0.05, cache_size=4096):
+        self.model_name = model_name
+        self.budget = budget
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="answer-encoder")
+        self._pending = {}
+        self._model = None
+        self._disabled = False
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+
+    def _load_model(self):
+        if self._model is None:
+            import torch
+            from sentence_transformers import SentenceTransformer
+
+            torch.set_num_threads(1)
+            self._model = SentenceTransformer(self.model_name, device="cpu")
+        return self._model
+
+    def _encode(self, text):
+        try:
+            vector = self._load_model().encode([text], convert_to_numpy=True, show_progress_bar=False)[0]
+        except ImportError:
+            # sentence_transformers が無い環境（本番など）ではエンコーダを使わない
+            self._disabled = True
+            return None
+        except Exception as e:
+            # モデルのダウンロード・読み込みの失敗など。以後はエンコーダを使わず fuzzy マッチにする
+            with self._lock:
+                first = not self._disabled
+                self._disabled = True
+            if first:
+                print(f"❌ エラー: 回答のエンコーダを使えません（fuzzy マッチで採点します）: {e}")
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(text, None)
+        vector = np.asarray(vector, dtype=np.float32)
+        self._remember(text, vector)
+        return vector
+
+    def _remember(self, text, vector):
+        with self._lock:
+            self._cache[text] = vector
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def encode(self, text):
+        """ベクトルを返す。予算内に用意できなければ None"""
+        text = str(text).strip()
+        if not text or self._disabled:
+            return None
+        with self._lock:
+            vector = self._cache.get(text)
+            if vector is not None:
+                self._cache.move_to_end(text)
+                self.hits += 1
+                return vector
+            self.misses += 1
+            # 同じ入力のエンコードが既に走っていれば、それを待つ
+            future = self._pending.get(text)
+            if future is None:
+                future = self._executor.submit(self._encode, text)
+                self._pending[text] = future
+        try:
+            return future.result(timeout=self.budget)
+        except FutureTimeoutError:
+            self.timeouts += 1
+            return None
+
+
+def write_keys(keys, model_name, keys_path=KEYS_PATH):
+    """索引ファイルを一時ファイル経由で書き出す（途中状態を読ませない）"""
+    tmp_path = keys_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"model": model_name, "keys": keys}, f)
+    os.replace(tmp_path, keys_path)
+
+
+def stored_model_name(keys_path=KEYS_PATH):
+    """保存済みベクトルを作ったモデル名（新形式のストアが無ければ None）"""
+    try:
+        with open(keys_path, encoding="utf-8") as f:
+            return json.load(f).get("model")
+    except (OSError, ValueError):
+        return None
+
+
+def load_embeddings(vectors_path=VECTORS_PATH, keys_path=KEYS_PATH, legacy_path=LEGACY_PICKLE_PATH):
+    """新形式があればそれを、なければ旧形式の pickle(dict) を読む。どちらもなければ None"""
+    if os.path.exists(vectors_path) and os.path.exists(keys_path):
+        try:
+            return VectorStore.open(vectors_path, keys_path)
+        except (ValueError, OSError) as e:
+            print(f"❌ エラー: ベクトルストアを読み込めませんでした: {e}")
+    if os.path.exists(legacy_path):
+        _warn_legacy_once(vectors_path)
+        with open(legacy_path, "rb") as f:
+            return pickle.load(f)
+    return None
+
+
+_legacy_warned = False
+
+
+def _warn_legacy_once(vectors_path):
+    """旧形式しか無いときは、日本語の答えを意味で採点できないことを（プロセスごとに1回）知らせる"""
+    global _legacy_warned
+    if _legacy_warned:
+        return
+    _legacy_warned = True
+    print(
+        f"⚠️ 注意: {vectors_path} がないため、旧形式の英語だけのベクトル（pickle）を使います。"
+        "英語→日本語の答えは文字列の近さだけで採点されます。"
+        "`flask --app manage generate-vectors` で多言語のベクトルを作ってください。"
+    )
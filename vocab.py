@@ -0,0 +1,355 @@
+# vocab.py
+# 単語帳（words.xlsx）と、そこから作る索引をまとめた「スナップショット」の管理
+#
+# ワーカーを再起動せずに words.xlsx を差し替えられるよう、読み込み結果は
+# 不変のスナップショットとして持ち、新しいものをバックグラウンドで組み立ててから
+# 参照を1回で差し替える（RCU 方式）。進行中のクイズはセッションに記録した
+# バージョンのスナップショットを使い続けるので、行番号がずれない。
+import bisect
+import hashlib
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from readings import load_readings, normalize_query
+from typo_index import TypoIndex
+from vector_store import load_embeddings, split_variants, subset_embeddings
+
+WORDS_PATH = "static/words.xlsx"
+# 範囲選択（総合学習・ざっくり学習）で1つの範囲に入れる単語数
+RANGE_SIZE = 50
+
+
+def word_content_hash(english, japanese):
+    """単語（英語と訳の組）の内容ハッシュ。単語カタログで安定IDを引くキーになる"""
+    key = f"{str(english).strip()}\t{str(japanese).strip()}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def _file_version(path):
+    """ファイル内容のハッシュをバージョンにする（全ワーカーで同じ値になる）"""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()[:12]
+
+
+class PrefixIndex:
+    """小文字化したテキストをソートして持ち、前方一致を二分探索で引く"""
+
+    def __init__(self, items):
+        # items: (検索キー, 表示テキスト) のリスト
+        pairs = sorted((key.lower(), text) for key, text in items if key)
+        self.keys = [k for k, _ in pairs]
+        self.texts = [t for _, t in pairs]
+
+    def search(self, prefix, limit=10):
+        """前方一致する表示テキスト（重複なし、キー順）。limit=None なら全部"""
+        prefix = prefix.lower()
+        results = []
+        seen = set()
+        i = bisect.bisect_left(self.keys, prefix)
+        while i < len(self.keys) and self.keys[i].startswith(prefix):
+            text = self.texts[i]
+            if text not in seen:
+                seen.add(text)
+                results.append(text)
+                if limit is not None and len(results) >= limit:
+                    break
+            i += 1
+        return results
+
+
+def _row_readings(readings, japanese, variants):
+    """1行ぶんの読み [(ひらがな, ローマ字), ...]。各訳の読みを優先し、無ければセル全体の読み"""
+    found = []
+    for text in variants or [japanese]:
+        reading = readings.get(text)
+        if reading and reading not in found:
+            found.append(reading)
+    if not found and japanese in readings:
+        found.append(readings[japanese])
+    return found
+
+
+class VocabSnapshot:
+    """ある時点の単語帳と派生データ（作成後は変更しない）"""
+
+    def __init__(self, df, version, embeddings=None, mtime=None, readings=None):
+        self.df = df
+        self.version = version
+        self.mtime = mtime
+        self.loaded_at = time.time()
+        self.embeddings = embeddings
+
+        english = df["English"].fillna("").astype(str).str.strip()
+        japanese = df["Japanese"].fillna("").astype(str).str.strip()
+        self.english = english.tolist()
+        self.japanese = japanese.tolist()
+        self.content_hashes = [word_content_hash(e, j) for e, j in zip(self.english, self.japanese)]
+
+        # 単語ID（DBの単語カタログ由来）は attach_word_ids() で後から付ける
+        self.word_ids = None      # 行位置 -> 単語ID
+        self._positions = None    # 単語ID -> 行位置（無ければ -1）
+        self.all_word_ids = []
+        self.retired = {}         # 単語帳から消えた単語ID -> (英語, 日本語)
+        self.id_remaps = {}       # 統合された旧ID -> 新ID
+        self.remap_epoch = 0
+        self._nbytes = None
+        # 範囲の一覧（1始まり、例: (1, 50), (51, 100) ...）。範囲選択ページはこれをそのまま使う
+        self.ranges = [(i + 1, min(i + RANGE_SIZE, len(df))) for i in range(0, len(df), RANGE_SIZE)]
+        # 訳語セルの言い換え（「学生、生徒」→「学生」「生徒」）
+        self.variants = [split_variants(j) for j in self.japanese]
+        # 予測変換用の前方一致索引（英語・日本語セル・日本語の各訳）
+        self.suggest_index = PrefixIndex(
+            [(e, e) for e in self.english]
+            + [(j, j) for j in self.japanese]
+            + [(v, j) for j, vs in zip(self.japanese, self.variants) for v in vs]
+        )
+        # つづり間違い用の索引（英単語のみ）
+        self.typo_index = TypoIndex(self.english)
+        # 訳語の読み（ひらがな・ローマ字）の前方一致索引。表示テキストの代わりに行位置を持つ
+        self.readings = [_row_readings(readings or {}, j, vs) for j, vs in zip(self.japanese, self.variants)]
+        self.reading_index = PrefixIndex(
+            [(key, pos) for pos, rs in enumerate(self.readings) for kana, romaji in rs for key in (kana, romaji)]
+        )
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def texts(self):
+        """ベクトルを引く可能性のあるテキスト（英語・日本語セル・各訳）"""
+        return self.english + self.japanese + [v for vs in self.variants for v in vs]
+
+    def estimate_nbytes(self):
+        """メモリ使用量の概算（単語帳のキャッシュ上限の判定に使う）"""
+        if self._nbytes is not None:
+            return self._nbytes
+        total = int(self.df.memory_usage(deep=True).sum())
+        total += sum(sys.getsizeof(t) for t in self.suggest_index.keys) * 2
+        total += sum(sys.getsizeof(t) for t in self.content_hashes)
+        total += sum(sys.getsizeof(d) + 8 * len(ids) for d, ids in self.typo_index.deletes.items())
+        total += sum(sys.getsizeof(t) + 8 for t in self.reading_index.keys)
+        if self.word_ids is not None:
+            total += self.word_ids.nbytes + self._positions.nbytes
+        if self.embeddings is not None:
+            total += getattr(self.embeddings, "nbytes", 0) or sum(v.nbytes for v in self.embeddings.values())
+        self._nbytes = total
+        return total
+
+    # --- 単語ID ---------------------------------------------------------------
+    @property
+    def has_word_ids(self):
+        return self.word_ids is not None
+
+    def attach_word_ids(self, word_ids, retired=None, id_remaps=None, remap_epoch=0):
+        """行位置ごとの単語IDを登録し、ID -> 行位置の逆引き配列を作る（O(1)で変換できる）"""
+        word_ids = np.asarray(word_ids, dtype=np.int64)
+        positions = np.full(int(word_ids.max()) + 1 if len(word_ids) else 1, -1, dtype=np.int64)
+        # 同じ内容の行が複数あれば先頭の行を使う
+        positions[word_ids[::-1]] = np.arange(len(word_ids) - 1, -1, -1)
+        self.retired = retired or {}
+        self.id_remaps = id_remaps or {}
+        self.remap_epoch = remap_epoch
+        self._positions = positions
+        self._nbytes = None
+        self.all_word_ids = word_ids.tolist()
+        self.word_ids = word_ids
+
+    def position(self, word_id):
+        """単語IDの行位置。この単語帳に無ければ -1"""
+        if word_id is None or word_id < 0 or word_id >= len(self._positions):
+            return -1
+        return int(self._positions[word_id])
+
+    def word_id(self, position):
+        return int(self.word_ids[position])
+
+    def word(self, word_id):
+        """(英語, 日本語)。単語帳から消えた単語はカタログに残っている内容を返す"""
+        pos = self.position(word_id)
+        if pos >= 0:
+            return self.english[pos], self.japanese[pos]
+        return self.retired.get(word_id, ("(削除された単語)", ""))
+
+    def ids_in_range(self, start, end):
+        """1始まりの範囲 start〜end に並んでいる単語のID"""
+        return self.all_word_ids[start - 1:end]
+
+    def range_start(self, word_id):
+        """単語が属する範囲の先頭（1始まり）。この単語帳に無ければ None"""
+        pos = self.position(word_id)
+        if pos < 0:
+            return None
+        return pos // RANGE_SIZE * RANGE_SIZE + 1
+
+    def range_of(self, word_id):
+        """単語が属する範囲 (start, end)（1始まり）。この単語帳に無ければ None"""
+        pos = self.position(word_id)
+        if pos < 0:
+            return None
+        return self.ranges[pos // RANGE_SIZE]
+
+    def resolve_id(self, word_id):
+        """統合された旧IDを現在のIDに置き換える"""
+        return self.id_remaps.get(word_id, word_id)
+
+    def reading(self, word_id):
+        """単語の訳語の読み（ひらがな、「、」区切り）。読みが無ければ空文字"""
+        pos = self.position(word_id)
+        if pos < 0:
+            return ""
+        return "、".join(kana for kana, _ in self.readings[pos])
+
+    def reading_positions(self, query, limit=None):
+        """訳語の読み（ひらがな・ローマ字）が前方一致する行位置"""
+        query = normalize_query(query)
+        if not query:
+            return []
+        return self.reading_index.search(query, limit)
+
+    def suggestions(self, query, limit=10):
+        """予測変換の候補。足りなければ読みの一致した訳語で埋め、1つも無ければつづりの近い英単語を返す"""
+        results = self.suggest_index.search(query, limit)
+        if len(results) < limit:
+            for pos in self.reading_positions(query, limit):
+                if self.japanese[pos] not in results:
+                    results.append(self.japanese[pos])
+                    if len(results) >= limit:
+                        break
+        return results or self.did_you_mean(query, limit)
+
+    def did_you_mean(self, query, limit=5):
+        """つづりの近い英単語（編集距離2以内、近い順）"""
+        return self.typo_index.suggest(query, limit)
+
+    def search_positions(self, query):
+        """英単語と日本語訳の両方から部分一致で検索し、一致した行位置を返す（訳語の読みは前方一致）"""
+        df = self.df
+        mask = (
+            df['English'].str.contains(query, case=False, na=False, regex=False) |
+            df['Japanese'].str.contains(query, case=False, na=False, regex=False)
+        ).to_numpy()
+        reading_hits = self.reading_positions(query)
+        if reading_hits:
+            mask[reading_hits] = True
+        return np.flatnonzero(mask).tolist()
+
+    def search(self, query):
+        """英単語と日本語訳の両方から部分一致で検索"""
+        return self.df.iloc[self.search_positions(query)].to_dict('records')
+
+
+def load_snapshot(path=WORDS_PATH):
+    try:
+        mtime = os.path.getmtime(path)
+        df = pd.read_excel(path)
+        version = _file_version(path)
+        print(f"✅ {os.path.basename(path)} を正常に読み込みました。（version {version}）")
+    except FileNotFoundError:
+        print(f"❌ エラー: {os.path.basename(path)} が見つかりません。")
+        df = pd.DataFrame(columns=["English", "Japanese"])
+        mtime = None
+        version = "empty"
+    snapshot = VocabSnapshot(df, version, mtime=mtime, readings=load_readings())
+    # ベクトルは全体のストアから、この単語帳で使う分だけを切り出して持つ
+    snapshot.embeddings = subset_embeddings(load_embeddings(), snapshot.texts)
+    return snapshot
+
+
+class VocabRegistry:
+    """現在のスナップショットと、直近いくつかの旧バージョンを保持する。
+
+    ``current`` の読み出しはロック不要（参照の差し替えは原子的）。"""
+
+    def __init__(self, path=WORDS_PATH, keep_versions=3, check_interval=5.0, on_load=None):
+        self.path = path
+        # 新しいスナップショットを公開する前に呼ぶフック（単語IDの付与など）
+        self.on_load = on_load
+        self.keep_versions = keep_versions
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._reload_thread = None
+        self._last_check = time.monotonic()
+        self.current = None
+        snapshot = load_snapshot(path)
+        if on_load is not None:
+            on_load(snapshot)
+        self._publish(snapshot)
+
+    def _publish(self, snapshot):
+        with self._lock:
+            self._snapshots.pop(snapshot.version, None)
+            self._snapshots[snapshot.version] = snapshot
+            # 古いバージョンから捨てる（現在のものは必ず残る）
+            while len(self._snapshots) > self.keep_versions:
+                oldest = next(iter(self._snapshots))
+                self._snapshots.pop(oldest)
+            self.current = snapshot
+
+    def get(self, version=None):
+        """指定バージョンのスナップショット。無い（古すぎる）場合は現在のもの"""
+        if version is None:
+            return self.current
+        return self._snapshots.get(version, self.current)
+
+    def has_version(self, version):
+        return version in self._snapshots
+
+    def estimate_nbytes(self):
+        with self._lock:
+            snapshots = list(self._snapshots.values())
+        return sum(snap.estimate_nbytes() for snap in snapshots)
+
+    @property
+    def reloading(self):
+        return self._reload_thread is not None and self._reload_thread.is_alive()
+
+    def reload_async(self, force=False):
+        """バックグラウンドで読み直す。既に読み込み中なら何もしない
+
+        force=True なら内容が同じでも作り直して差し替える（単語IDの統合を反映するときなど）"""
+        with self._lock:
+            if self.reloading:
+                return False
+            self._reload_thread = threading.Thread(target=self._reload, args=(force,), name="vocab-reload", daemon=True)
+            self._reload_thread.start()
+            return True
+
+    def _reload(self, force=False):
+        try:
+            snapshot = load_snapshot(self.path)
+        except Exception as e:  # 読み込みに失敗しても現在のスナップショットで動き続ける
+            print(f"❌ エラー: 単語帳の再読み込みに失敗しました: {e}")
+            return
+        if snapshot.version == self.current.version and not force:
+            # 内容が同じなら差し替えない（mtime だけ更新）
+            self.current.mtime = snapshot.mtime
+            return
+        if self.on_load is not None:
+            try:
+                self.on_load(snapshot)
+            except Exception as e:
+                print(f"❌ エラー: 単語帳の準備に失敗しました: {e}")
+                return
+        self._publish(snapshot)
+
+    def maybe_reload(self):
+        """一定間隔で words.xlsx の更新時刻を確認し、変わっていれば再読み込みを始める"""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self.current.mtime:
+            self.reload_async()